@@ -0,0 +1,39 @@
+import os
+import sys
+
+from django.apps import AppConfig
+from django.conf import settings
+
+
+class BackendConfig(AppConfig):
+    name = 'Backend'
+    default_auto_field = 'django.db.models.BigAutoField'
+
+    def ready(self):
+        if not _is_serving_process():
+            return
+
+        if getattr(settings, 'RETRIEVAL_WARMUP', True):
+            from .utils.retrieval import warm_up_in_background
+            warm_up_in_background()
+
+        # Pick up questionnaire jobs interrupted by a previous shutdown
+        from .utils.jobs import get_job_manager
+        get_job_manager().resume_pending()
+
+
+def _is_serving_process():
+    """
+    Decide whether this process serves requests.
+
+    Management commands other than `runserver` never need the model, and the
+    runserver autoreloader parent only watches files, so only its child
+    (RUN_MAIN) or a `--noreload` server counts. Under ASGI/WSGI servers
+    every worker does.
+    """
+    argv = sys.argv
+    if argv and os.path.basename(argv[0]) == 'manage.py':
+        if len(argv) < 2 or argv[1] != 'runserver':
+            return False
+        return '--noreload' in argv or os.environ.get('RUN_MAIN') == 'true'
+    return True
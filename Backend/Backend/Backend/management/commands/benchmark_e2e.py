@@ -0,0 +1,298 @@
+import csv
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from Backend.utils.answer_cache import get_answer_cache
+from Backend.utils.conversation import ConversationContext
+from Backend.utils.fake_ollama import FakeOllamaServer
+from Backend.utils.generation_cache import get_generation_cache
+from Backend.utils.history import ChatThreadManager
+from Backend.utils.indexing import IndexContents
+from Backend.utils.memory import peak_rss_kb, reset_peak_rss
+from Backend.utils.retrieval import get_engine
+
+SCENARIOS = ("single", "chat", "batch")
+
+# PDF passages are cut to this many words to read like a question
+_PDF_QUESTION_WORDS = 25
+
+
+class Command(BaseCommand):
+    help = (
+        "End-to-end benchmark of /analyze/ and /batch/ against the built indexes, with a local fake "
+        "Ollama server standing in for the LLM: single-question latency, concurrent chat load and "
+        "questionnaire batches. Prints JSON with throughput, p50/p95/p99 latency and peak RSS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scenarios', default=",".join(SCENARIOS),
+            help=f"Comma-separated scenarios to run (default: {','.join(SCENARIOS)})."
+        )
+        parser.add_argument('--questions', type=int, default=50, help="Sequential /analyze/ requests (default: 50).")
+        parser.add_argument('--chat-requests', type=int, default=200, help="Concurrent /analyze/ requests (default: 200).")
+        parser.add_argument('--concurrency', type=int, default=8, help="Clients sending chat requests at once (default: 8).")
+        parser.add_argument(
+            '--batch-sizes', default="10,100,1000",
+            help="Comma-separated questionnaire sizes sent to /batch/ (default: 10,100,1000)."
+        )
+        parser.add_argument(
+            '--pdf-share', type=float, default=0.3,
+            help="Share of questions taken from PDF passages, which go through the LLM (default: 0.3)."
+        )
+        parser.add_argument('--query-file', help="Text file with one question per line, used instead of indexed texts.")
+        parser.add_argument('--tokens', type=int, default=32, help="Tokens per fake LLM answer (default: 32).")
+        parser.add_argument('--token-latency-ms', type=float, default=20, help="Fake LLM time per token (default: 20).")
+        parser.add_argument(
+            '--first-token-ms', type=float, default=100, help="Fake LLM time to the first token (default: 100)."
+        )
+        parser.add_argument(
+            '--warm-cache', action='store_true',
+            help="Keep answer, generation and query-vector caches between scenarios instead of starting each one cold."
+        )
+        parser.add_argument(
+            '--generation-cache-bytes', type=int,
+            help="Size budget of the generation cache, to measure its eviction (default: GENERATION_CACHE_MAX_BYTES)."
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Seed for picking questions.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        scenarios = [s.strip() for s in options['scenarios'].split(",") if s.strip()]
+        unknown = [s for s in scenarios if s not in SCENARIOS]
+        if unknown:
+            raise CommandError(f"Unknown scenario(s): {', '.join(unknown)}")
+        try:
+            batch_sizes = [int(size) for size in options['batch_sizes'].split(",") if size.strip()]
+        except ValueError:
+            raise CommandError("--batch-sizes must be comma-separated integers")
+
+        pool = self._question_pool(options)
+        rng = np.random.default_rng(options['seed'])
+
+        with tempfile.TemporaryDirectory() as tmp, FakeOllamaServer(
+            tokens=options['tokens'],
+            token_latency=options['token_latency_ms'] / 1000,
+            first_token_latency=options['first_token_ms'] / 1000
+        ) as llm:
+            self._isolate(tmp, llm, options)
+
+            reset_peak_rss()
+            started = time.perf_counter()
+            try:
+                get_engine().warm_up()
+            except Exception as e:
+                raise CommandError(f"Could not load the retrieval engine: {e}")
+            report = {
+                "commit": self._commit(),
+                "python": platform.python_version(),
+                "config": self._config(),
+                "fake_llm": {
+                    "tokens": options['tokens'],
+                    "token_latency_ms": options['token_latency_ms'],
+                    "first_token_ms": options['first_token_ms']
+                },
+                "load": {"seconds": round(time.perf_counter() - started, 3), "peak_rss_kb": peak_rss_kb()},
+                "scenarios": []
+            }
+
+            runs = []
+            if "single" in scenarios:
+                runs.append(lambda: self._chat("single", self._pick(pool, options['questions'], rng), 1))
+            if "chat" in scenarios:
+                runs.append(lambda: self._chat(
+                    "chat", self._pick(pool, options['chat_requests'], rng), options['concurrency']
+                ))
+            if "batch" in scenarios:
+                for size in batch_sizes:
+                    runs.append(lambda size=size: self._batch(self._pick(pool, size, rng)))
+
+            for run in runs:
+                if not options['warm_cache']:
+                    get_answer_cache().clear()
+                    get_engine().embedding_model.clear_cache()
+                    if settings.GENERATION_CACHE_ENABLED:
+                        get_generation_cache().clear()
+                reset_peak_rss()
+                requests_before = llm.requests
+                result = run()
+                result["llm_requests"] = llm.requests - requests_before
+                result["peak_rss_kb"] = peak_rss_kb()
+                if settings.GENERATION_CACHE_ENABLED:
+                    result["generation_cache"] = get_generation_cache().stats()
+                report["scenarios"].append(result)
+                self.stderr.write(
+                    f"{result['name']}: {result['throughput_per_second']}/s, "
+                    f"p50 {result['latency_ms']['p50']} ms, p99 {result['latency_ms']['p99']} ms"
+                )
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def _chat(self, name, questions, concurrency):
+        def ask(question):
+            client = Client()
+            started = time.perf_counter()
+            response = client.post('/analyze/', {"message": question}, content_type="application/json")
+            return time.perf_counter() - started, response.status_code == 200
+
+        started = time.perf_counter()
+        if concurrency == 1:
+            timings = [ask(question) for question in questions]
+        else:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                timings = list(executor.map(ask, questions))
+        wall = time.perf_counter() - started
+
+        return {
+            "name": name,
+            "requests": len(questions),
+            "concurrency": concurrency,
+            "wall_seconds": round(wall, 3),
+            "throughput_per_second": round(len(questions) / wall, 2),
+            "latency_ms": _latency([seconds for seconds, _ in timings]),
+            "errors": sum(not ok for _, ok in timings)
+        }
+
+    def _batch(self, questions):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["id", "Questions"])
+        for i, question in enumerate(questions, start=1):
+            writer.writerow([i, question])
+        upload = SimpleUploadedFile("benchmark.csv", buffer.getvalue().encode('utf-8'), content_type="text/csv")
+
+        started = time.perf_counter()
+        response = Client().post('/batch/', {"file": upload})
+        # The body is streamed as an opening part, one part per answered
+        # row and a closing part, so each part's arrival times a row
+        parts = []
+        arrivals = []
+        for part in response.streaming_content if response.streaming else [response.content]:
+            parts.append(part)
+            arrivals.append(time.perf_counter() - started)
+        wall = time.perf_counter() - started
+        row_arrivals = arrivals[1:-1]
+
+        try:
+            body = json.loads(b"".join(parts))
+            errors = len(questions) - len(body["results"])
+            deduplicated = body.get("deduplicated_rows")
+        except (ValueError, KeyError):
+            errors = len(questions)
+            deduplicated = None
+
+        return {
+            "name": f"batch_{len(questions)}",
+            "rows": len(questions),
+            "unique_questions": len(set(questions)),
+            "wall_seconds": round(wall, 3),
+            "throughput_per_second": round(len(questions) / wall, 2),
+            # Time from the upload until each row's answer arrived
+            "latency_ms": _latency(row_arrivals),
+            "first_row_ms": round(row_arrivals[0] * 1000, 1) if row_arrivals else None,
+            "deduplicated_rows": deduplicated,
+            "errors": errors
+        }
+
+    def _question_pool(self, options):
+        if options['query_file']:
+            with open(options['query_file'], 'r', encoding='utf-8') as f:
+                questions = [line.strip() for line in f if line.strip()]
+            if not questions:
+                raise CommandError(f"{options['query_file']} has no questions")
+            return questions
+
+        try:
+            csv_texts = IndexContents.read(str(settings.FAISS_CSV_INDEX_PATH)).texts
+            pdf_texts = IndexContents.read(str(settings.FAISS_PDF_INDEX_PATH)).texts
+        except Exception as e:
+            raise CommandError(f"Could not read the indexes: {e}")
+
+        rng = np.random.default_rng(options['seed'])
+        pdf_questions = [" ".join(text.split()[:_PDF_QUESTION_WORDS]) for text in pdf_texts if text.strip()]
+        csv_questions = [text for text in csv_texts if text.strip()]
+        pdf_count = int(round(len(csv_questions) * options['pdf_share'] / max(1e-9, 1 - options['pdf_share'])))
+        pdf_count = min(pdf_count, len(pdf_questions))
+        pool = csv_questions + [pdf_questions[i] for i in rng.choice(len(pdf_questions), pdf_count, replace=False)]
+        if not pool:
+            raise CommandError("The indexes hold no texts to ask about")
+        return pool
+
+    @staticmethod
+    def _pick(pool, count, rng):
+        # Without repeats while the pool lasts, so deduplication and caches
+        # only kick in for sizes beyond it
+        order = np.concatenate([rng.permutation(len(pool)) for _ in range(-(-count // len(pool)))])
+        return [pool[i] for i in order[:count]]
+
+    def _isolate(self, tmp, llm, options):
+        """
+        Point the LLM at the fake server and keep caches and chat history out
+        of the real data directories.
+        """
+        from Backend import views
+
+        settings.OLLAMA_BASE_URL = llm.url
+        settings.ANSWER_CACHE_PATH = os.path.join(tmp, "answer_cache")
+        settings.GENERATION_CACHE_PATH = os.path.join(tmp, "generations.sqlite3")
+        if options['generation_cache_bytes']:
+            settings.GENERATION_CACHE_MAX_BYTES = options['generation_cache_bytes']
+        settings.ALLOWED_HOSTS = [*settings.ALLOWED_HOSTS, "testserver"]
+        views.manager = ChatThreadManager(data_dir=os.path.join(tmp, "chat_data"))
+        views.conversations = ConversationContext(views.manager)
+
+    @staticmethod
+    def _config():
+        return {
+            "embedding_backend": settings.EMBEDDING_BACKEND,
+            "faiss_index_config": settings.FAISS_INDEX_CONFIG,
+            "faiss_mmap": settings.FAISS_MMAP,
+            "rerank_enabled": settings.RERANK_ENABLED,
+            "llm_max_concurrency": settings.LLM_MAX_CONCURRENCY,
+            "questionnaire_chunk_size": settings.QUESTIONNAIRE_CHUNK_SIZE,
+            "questionnaire_dedup": settings.QUESTIONNAIRE_DEDUP,
+            "generation_cache_enabled": settings.GENERATION_CACHE_ENABLED,
+            "generation_cache_max_bytes": settings.GENERATION_CACHE_MAX_BYTES,
+            "generation_cache_stale_seconds": settings.GENERATION_CACHE_STALE_SECONDS
+        }
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=10
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+
+def _latency(seconds):
+    milliseconds = np.asarray(seconds) * 1000
+    if not len(milliseconds):
+        return {"p50": None, "p95": None, "p99": None, "mean": None, "max": None}
+    return {
+        "p50": round(float(np.percentile(milliseconds, 50)), 1),
+        "p95": round(float(np.percentile(milliseconds, 95)), 1),
+        "p99": round(float(np.percentile(milliseconds, 99)), 1),
+        "mean": round(float(milliseconds.mean()), 1),
+        "max": round(float(milliseconds.max()), 1)
+    }
@@ -0,0 +1,153 @@
+import json
+import os
+import tempfile
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Backend.utils.index_types import DEFAULT_INDEX_PARAMS, INDEX_TYPES, create_index, index_params, read_index
+from Backend.utils.indexing import read_vectors
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare FAISS index types on the built CSV/PDF indexes: recall@k against the exact "
+        "flat index, single-query p50/p99 latency and index size. Prints JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['csv', 'pdf'], help="Benchmark only one of the two indexes.")
+        parser.add_argument(
+            '--types', default=",".join(INDEX_TYPES),
+            help=f"Comma-separated index types to compare (default: {','.join(INDEX_TYPES)})."
+        )
+        parser.add_argument('-k', type=int, default=5, help="Neighbours per query (default: 5).")
+        parser.add_argument(
+            '--queries', type=int, default=200,
+            help="Stored vectors sampled as queries when no --query-file is given (default: 200)."
+        )
+        parser.add_argument('--query-file', help="Text file with one query per line, embedded with the configured model.")
+        parser.add_argument(
+            '--set', action='append', default=[], dest='overrides', metavar='KEY=VALUE',
+            help="Override an index parameter for every type, e.g. --set nprobe=32 (repeatable)."
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Seed for sampling query vectors.")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+
+    def handle(self, *args, **options):
+        types = [t.strip() for t in options['types'].split(",") if t.strip()]
+        unknown = [t for t in types if t not in INDEX_TYPES]
+        if unknown:
+            raise CommandError(f"Unknown index type(s): {', '.join(unknown)}")
+        overrides = self._parse_overrides(options['overrides'])
+
+        targets = {"csv": settings.FAISS_CSV_INDEX_PATH, "pdf": settings.FAISS_PDF_INDEX_PATH}
+        if options['only']:
+            targets = {options['only']: targets[options['only']]}
+
+        query_texts = None
+        if options['query_file']:
+            with open(options['query_file'], 'r', encoding='utf-8') as f:
+                query_texts = [line.strip() for line in f if line.strip()]
+
+        report = {"k": options['k'], "stores": {}}
+        for kind, index_path in targets.items():
+            try:
+                vectors = np.ascontiguousarray(read_vectors(str(index_path)), dtype=np.float32)
+            except Exception as e:
+                raise CommandError(f"Could not read the {kind.upper()} index at {index_path}: {e}")
+
+            queries = self._queries(vectors, query_texts, options['queries'], options['seed'])
+            k = min(options['k'], len(vectors))
+            truth = self._search(create_index(vectors, index_params(kind, {"type": "flat"})), queries, k)[0]
+
+            results = []
+            for index_type in types:
+                params = index_params(kind, {**overrides, "type": index_type})
+                results.append(self._benchmark(vectors, queries, k, truth, params))
+                self.stderr.write(f"{kind.upper()} {index_type}: recall@{k}={results[-1]['recall_at_k']}")
+
+            report["stores"][kind] = {
+                "vectors": int(vectors.shape[0]),
+                "dim": int(vectors.shape[1]),
+                "queries": int(len(queries)),
+                "results": results
+            }
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output)
+        else:
+            self.stdout.write(output)
+
+    def _parse_overrides(self, pairs):
+        overrides = {}
+        for pair in pairs:
+            key, _, value = pair.partition("=")
+            if key not in DEFAULT_INDEX_PARAMS or key == "type" or not value:
+                raise CommandError(f"Invalid --set {pair!r}")
+            try:
+                overrides[key] = int(value)
+            except ValueError:
+                raise CommandError(f"--set {key} expects an integer")
+        return overrides
+
+    def _queries(self, vectors, query_texts, count, seed):
+        if query_texts is not None:
+            from Backend.utils.embeddings import EmbeddingService
+            return EmbeddingService().encode(query_texts)
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(vectors), size=min(count, len(vectors)), replace=False)
+        return vectors[np.sort(rows)]
+
+    def _search(self, index, queries, k):
+        latencies = []
+        neighbours = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), k)
+            latencies.append((time.perf_counter() - start) * 1000)
+            neighbours.append(ids[0])
+        return np.asarray(neighbours), np.asarray(latencies)
+
+    def _benchmark(self, vectors, queries, k, truth, params):
+        start = time.perf_counter()
+        index = create_index(vectors, params)
+        build_seconds = time.perf_counter() - start
+
+        # Search the index as the server loads it from disk
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.faiss")
+            faiss.write_index(index, path)
+            index_bytes = os.path.getsize(path)
+            index = read_index(path, params)
+            neighbours, latencies = self._search(index, queries, k)
+            del index
+        recall = np.mean([len(set(found) & set(expected)) / k for found, expected in zip(neighbours, truth)])
+
+        return {
+            "type": params["type"],
+            "params": {key: value for key, value in params.items() if self._applies(key, params["type"])},
+            "recall_at_k": round(float(recall), 4),
+            "latency_ms": {
+                "p50": round(float(np.percentile(latencies, 50)), 4),
+                "p99": round(float(np.percentile(latencies, 99)), 4),
+                "mean": round(float(latencies.mean()), 4)
+            },
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": index_bytes
+        }
+
+    @staticmethod
+    def _applies(key, index_type):
+        if index_type == "hnsw":
+            return key in ("hnsw_m", "ef_construction", "ef_search")
+        if index_type == "ivf_flat":
+            return key in ("nlist", "nprobe")
+        if index_type == "ivf_pq":
+            return key in ("nlist", "nprobe", "pq_m", "pq_bits")
+        return False
@@ -0,0 +1,70 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Backend.utils.embeddings import EmbeddingService
+from Backend.utils.indexing import LEGACY_DOCSTORE_NAME, IndexBuilder, convert_legacy_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Build or incrementally update the CSV (Q&A) and PDF (policy) FAISS indexes. "
+        "Only new or changed source files are embedded; vectors of deleted files are removed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--csv-source', action='append', dest='csv_sources',
+            help="Q&A CSV file or directory (repeatable). Defaults to KNOWLEDGE_BASE_CSV_DIR."
+        )
+        parser.add_argument(
+            '--pdf-source', action='append', dest='pdf_sources',
+            help="Policy PDF file or directory (repeatable). Defaults to KNOWLEDGE_BASE_PDF_DIR."
+        )
+        parser.add_argument('--only', choices=['csv', 'pdf'], help="Build only one of the two indexes.")
+        parser.add_argument('--full', action='store_true', help="Ignore existing indexes and rebuild from scratch.")
+        parser.add_argument(
+            '--convert-legacy', action='store_true',
+            help="Convert pickled indexes (index.pkl) to the memory-mapped docstore format and exit."
+        )
+        parser.add_argument('--workers', type=int, help="Processes used to parse source files.")
+        parser.add_argument('--batch-size', type=int, help="Chunks encoded per forward pass.")
+
+    def handle(self, *args, **options):
+        targets = {
+            "csv": (settings.FAISS_CSV_INDEX_PATH, options['csv_sources'] or [settings.KNOWLEDGE_BASE_CSV_DIR]),
+            "pdf": (settings.FAISS_PDF_INDEX_PATH, options['pdf_sources'] or [settings.KNOWLEDGE_BASE_PDF_DIR]),
+        }
+        if options['only']:
+            targets = {options['only']: targets[options['only']]}
+
+        embedding_model = EmbeddingService()
+
+        if options['convert_legacy']:
+            for kind, (index_path, _) in targets.items():
+                if not os.path.exists(os.path.join(index_path, LEGACY_DOCSTORE_NAME)):
+                    self.stdout.write(f"{kind.upper()} index: nothing to convert")
+                    continue
+                count = convert_legacy_index(index_path, embedding_model)
+                self.stdout.write(self.style.SUCCESS(f"{kind.upper()} index: converted {count} documents"))
+            return
+
+        for kind, (index_path, sources) in targets.items():
+            builder = IndexBuilder(
+                index_path, kind, embedding_model,
+                workers=options['workers'], batch_size=options['batch_size']
+            )
+            try:
+                summary = builder.build(sources, full=options['full'])
+            except ValueError as e:
+                raise CommandError(str(e))
+
+            self.stdout.write(self.style.SUCCESS(
+                f"{kind.upper()} index ({summary['index_type']}): {summary['added_files']} added, {summary['updated_files']} updated, "
+                f"{summary['removed_files']} removed, {summary['unchanged_files']} unchanged file(s); "
+                f"+{summary['vectors_added']}/-{summary['vectors_removed']} vectors, "
+                f"{summary['total_vectors']} total"
+            ))
+
+        self.stdout.write("Running servers pick up the new indexes after a POST to /retrieval/reload/.")
@@ -0,0 +1,76 @@
+import faiss
+import numpy as np
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Backend.utils.embeddings import EMBEDDING_BACKENDS, EmbeddingService
+from Backend.utils.indexing import IndexContents
+
+
+class Command(BaseCommand):
+    help = (
+        "Check an embedding backend against the vectors stored in the built indexes: re-encode a sample "
+        "of indexed texts and compare cosine similarity and nearest neighbours with the stored vectors."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', choices=['csv', 'pdf'], help="Check only one of the two indexes.")
+        parser.add_argument(
+            '--backend', choices=EMBEDDING_BACKENDS,
+            help="Backend to check (default: EMBEDDING_BACKEND)."
+        )
+        parser.add_argument('--onnx-file', help="ONNX file to check (default: EMBEDDING_ONNX_FILE).")
+        parser.add_argument('--sample', type=int, default=200, help="Indexed texts re-encoded per index (default: 200).")
+        parser.add_argument('-k', type=int, default=5, help="Neighbours compared per text (default: 5).")
+        parser.add_argument(
+            '--min-cosine', type=float, default=0.99,
+            help="Fail if the mean cosine similarity to the stored vectors is lower (default: 0.99)."
+        )
+        parser.add_argument('--seed', type=int, default=0, help="Seed for sampling texts.")
+
+    def handle(self, *args, **options):
+        targets = {"csv": settings.FAISS_CSV_INDEX_PATH, "pdf": settings.FAISS_PDF_INDEX_PATH}
+        if options['only']:
+            targets = {options['only']: targets[options['only']]}
+
+        service = EmbeddingService(backend=options['backend'], onnx_file=options['onnx_file'], cache_size=0)
+        self.stdout.write(f"Checking {service.signature}")
+
+        failed = []
+        for kind, index_path in targets.items():
+            try:
+                contents = IndexContents.read(str(index_path))
+            except Exception as e:
+                raise CommandError(f"Could not read the {kind.upper()} index at {index_path}: {e}")
+
+            stored = np.ascontiguousarray(contents.vectors, dtype=np.float32)
+            rng = np.random.default_rng(options['seed'])
+            rows = np.sort(rng.choice(len(stored), size=min(options['sample'], len(stored)), replace=False))
+            encoded = service.encode([contents.texts[i] for i in rows])
+
+            cosine = np.sum(encoded * stored[rows], axis=1) / (
+                np.linalg.norm(encoded, axis=1) * np.linalg.norm(stored[rows], axis=1)
+            )
+
+            # Do the re-encoded texts find the same neighbours in the index?
+            k = min(options['k'], len(stored))
+            index = faiss.IndexFlatL2(stored.shape[1])
+            index.add(stored)
+            _, expected = index.search(stored[rows], k)
+            _, found = index.search(encoded, k)
+            overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(found, expected)])
+            top1 = np.mean(found[:, 0] == expected[:, 0])
+
+            self.stdout.write(
+                f"{kind.upper()} index: {len(rows)} texts, cosine mean {cosine.mean():.5f} / min {cosine.min():.5f}, "
+                f"top-1 agreement {top1:.3f}, neighbour overlap@{k} {overlap:.3f}"
+            )
+            if cosine.mean() < options['min_cosine']:
+                failed.append(kind.upper())
+
+        if failed:
+            raise CommandError(
+                f"{', '.join(failed)} index vectors differ from {service.signature} "
+                f"(mean cosine below {options['min_cosine']}); rebuild with `build_indexes --full` before switching"
+            )
+        self.stdout.write(self.style.SUCCESS("Embeddings match the stored vectors"))
@@ -0,0 +1,35 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Backend.utils.history import ChatThreadManager
+
+
+class Command(BaseCommand):
+    help = (
+        "One-time import of chat threads from the old chat_data layout (users.json plus one CSV per thread) "
+        "into the SQLite history database. Threads already imported are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--source', default=os.path.join(settings.BASE_DIR, "Backend", "utils", "chat_data"),
+            help="Directory holding users.json and threads/ (default: Backend/utils/chat_data)."
+        )
+        parser.add_argument(
+            '--owner',
+            help="Chat user id that receives all imported threads, e.g. 'user:1' for the user with primary key 1. "
+                 "Threads saved by older versions all belong to 'user123', which no client uses any more."
+        )
+
+    def handle(self, *args, **options):
+        source = options['source']
+        if not os.path.exists(os.path.join(source, "users.json")):
+            raise CommandError(f"No users.json in {source}")
+
+        summary = ChatThreadManager().import_legacy_data(source, owner=options['owner'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {summary['threads']} thread(s) with {summary['messages']} message(s); "
+            f"{summary['skipped_threads']} already present"
+        ))
@@ -0,0 +1,60 @@
+import re
+import time
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .utils.metrics import REQUEST_SECONDS, trace_id
+
+# Accept a caller's request id only if it is short and log-safe
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+
+class TraceIdMiddleware:
+    """
+    Give every request a trace id and time it.
+
+    The id is taken from an incoming `X-Request-ID` header when there is
+    one, so a proxy's id carries through, and is otherwise generated. It is
+    set for the log records of the request, including those of streaming
+    bodies that finish after the view has returned, and sent back in the
+    `X-Request-ID` response header. The time until the response is ready is
+    recorded in `qna_http_request_seconds`.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = self._start(request)
+        return self._finish(request, self.get_response(request), started)
+
+    async def __acall__(self, request):
+        started = self._start(request)
+        return self._finish(request, await self.get_response(request), started)
+
+    def _start(self, request):
+        request_id = request.headers.get('X-Request-ID', '')
+        request.trace_id = request_id if REQUEST_ID_PATTERN.match(request_id) else uuid.uuid4().hex
+        # Not reset afterwards: a streaming body is produced after this
+        # returns and should still log under the request's id
+        trace_id.set(request.trace_id)
+        return time.perf_counter()
+
+    def _finish(self, request, response, started):
+        match = request.resolver_match
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started,
+            view=match.url_name if match else "unmatched",
+            method=request.method,
+            status=response.status_code
+        )
+        response['X-Request-ID'] = request.trace_id
+        return response
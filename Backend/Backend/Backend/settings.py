@@ -39,9 +39,11 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'corsheaders',
     'rest_framework',
+    'Backend',
 ]
 
 MIDDLEWARE = [
+    'Backend.middleware.TraceIdMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -58,6 +60,18 @@ CORS_ALLOWED_ORIGINS = [
     # Add any other origins you need (e.g., your deployed frontend URL)
 ]
 
+# The frontend sends its session cookie so each browser keeps its own chat
+# history and active thread.
+CORS_ALLOW_CREDENTIALS = True
+
+# Let the frontend read the trace id of a response, to quote it in bug reports.
+CORS_EXPOSE_HEADERS = ['X-Request-ID']
+
+# Anonymous chat clients are identified by a random id in their session.
+# Signed-cookie sessions keep that id in the cookie itself, so no session
+# table (and no `migrate`) is needed to serve chat.
+SESSION_ENGINE = 'django.contrib.sessions.backends.signed_cookies'
+
 ROOT_URLCONF = 'Backend.urls'
 
 TEMPLATES = [
@@ -125,6 +139,203 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Retrieval
+# The knowledge-base indexes live next to the Django project directory.
+
+FAISS_CSV_INDEX_PATH = BASE_DIR.parent / 'faiss_csv_index'
+FAISS_PDF_INDEX_PATH = BASE_DIR.parent / 'faiss_pdf_index'
+EMBEDDING_MODEL_NAME = 'sentence-transformers/all-MiniLM-L6-v2'
+
+# "torch" runs the model as-is; "onnx" runs EMBEDDING_ONNX_FILE from the model
+# repository through ONNX Runtime (pip install "sentence-transformers[onnx]"),
+# by default its int8-quantized export. Verify a backend against the stored
+# index vectors with `manage.py check_embeddings` before switching, and
+# rebuild the indexes with `build_indexes` after switching.
+EMBEDDING_BACKEND = 'torch'
+EMBEDDING_ONNX_FILE = 'onnx/model_qint8_avx512_vnni.onnx'
+# CPU threads for the encoder; None keeps the library default (all cores).
+EMBEDDING_THREADS = None
+# Recently asked questions whose vectors are kept in memory.
+EMBEDDING_CACHE_SIZE = 10000
+
+# Read indexes still in the old pickled format (index.pkl). Unpickling can run
+# arbitrary code; convert them with `build_indexes --convert-legacy` and then
+# turn this off.
+ALLOW_PICKLE_INDEXES = True
+
+# Map index.faiss read-only instead of reading it into each process's heap,
+# so every worker serving the same index shares one copy in the page cache.
+# Applies to indexes written by build_indexes (with a docstore.bin).
+FAISS_MMAP = True
+
+# Index type per store: "flat" (exact), "ivf_flat", "hnsw" or "ivf_pq", plus
+# any of nlist, nprobe, hnsw_m, ef_construction, ef_search, pq_m, pq_bits
+# (see utils/index_types.py for defaults). The type and build parameters
+# apply on the next `build_indexes` run; nprobe and ef_search on every load.
+# Compare settings with `manage.py benchmark_indexes` before changing them.
+FAISS_INDEX_CONFIG = {
+    'csv': {'type': 'flat'},
+    'pdf': {'type': 'flat'},
+}
+
+# Source files the build_indexes command reads by default.
+KNOWLEDGE_BASE_CSV_DIR = BASE_DIR.parent / 'knowledge_base' / 'csv'
+KNOWLEDGE_BASE_PDF_DIR = BASE_DIR.parent / 'knowledge_base' / 'pdf'
+
+# Index building: parser processes, chunks per encoder pass, PDF chunking.
+INDEX_BUILD_WORKERS = 4
+INDEX_BUILD_BATCH_SIZE = 128
+INDEX_CHUNK_SIZE = 1000
+INDEX_CHUNK_OVERLAP = 100
+
+# Load the embedding model and both indexes when the app starts instead of
+# on the first request.
+RETRIEVAL_WARMUP = True
+
+# Questions encoded per forward pass when answering questionnaires.
+RETRIEVAL_BATCH_SIZE = 64
+
+# Optional cross-encoder reranking of retrieval candidates (needs
+# sentence-transformers). RERANK_CANDIDATES hits per store are scored; a
+# knowledge-library (CSV) answer rated at least RERANK_CSV_MIN_SCORE (0-1)
+# is used even if its embedding distance misses the fixed threshold. Each
+# question gets RERANK_BUDGET_MS of scoring time before falling back to
+# plain FAISS order.
+RERANK_ENABLED = False
+RERANK_MODEL = 'cross-encoder/ms-marco-MiniLM-L-6-v2'
+RERANK_CANDIDATES = 20
+RERANK_CSV_MIN_SCORE = 0.7
+RERANK_BATCH_SIZE = 32
+RERANK_BUDGET_MS = 150
+RERANK_CACHE_SIZE = 20000
+
+# Lexical retrieval: build_indexes writes a BM25 index (bm25.bin) next to each
+# FAISS index, and its hits are merged with the FAISS hits by reciprocal-rank
+# fusion, so exact identifiers ("CC6.1", "AES-256") rank the passages that
+# contain them first. A hit is still accepted by its embedding distance.
+# RRF_K damps the rank weights; BM25_K1 and BM25_B apply on the next build.
+LEXICAL_ENABLED = True
+RRF_K = 60
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# PDF prompt context: CONTEXT_CANDIDATES passages are fetched per question,
+# and up to CONTEXT_MAX_CHUNKS of them picked by maximal marginal relevance
+# (CONTEXT_MMR_LAMBDA weighs relevance against diversity, 0-1) within an
+# estimated CONTEXT_TOKEN_BUDGET tokens. With these defaults a PDF prompt
+# carries up to about 600 context tokens, several times the single passage
+# sent before; set CONTEXT_MAX_CHUNKS = 1 to send only the best passage.
+CONTEXT_CANDIDATES = 10
+CONTEXT_MAX_CHUNKS = 4
+CONTEXT_TOKEN_BUDGET = 600
+CONTEXT_MMR_LAMBDA = 0.7
+
+# Answer cache
+# Answers are reused for the same normalized question, or for a question
+# whose embedding is at least this cosine-similar to a cached one.
+ANSWER_CACHE_PATH = BASE_DIR / 'Backend' / 'utils' / 'cache_data' / 'answer_cache'
+ANSWER_CACHE_MAX_ENTRIES = 5000
+ANSWER_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+ANSWER_CACHE_SIMILARITY_CUTOFF = 0.92
+ANSWER_CACHE_SAVE_INTERVAL = 30
+
+# Generation cache
+# LLM output of the PDF path is reused for a question that retrieves the same
+# chunks with the same prompt and model. Entries are fresh for the TTL; for
+# STALE_SECONDS after that they are still served while being regenerated in
+# the background (0 disables). The least recently used entries are evicted
+# once the stored text exceeds MAX_BYTES.
+GENERATION_CACHE_ENABLED = True
+GENERATION_CACHE_PATH = BASE_DIR / 'Backend' / 'utils' / 'cache_data' / 'generations.sqlite3'
+GENERATION_CACHE_MAX_BYTES = 64 * 1024 * 1024
+GENERATION_CACHE_TTL_SECONDS = 7 * 24 * 60 * 60
+GENERATION_CACHE_STALE_SECONDS = 0
+
+# LLM generation
+OLLAMA_MODEL = 'llama3.2:latest'
+OLLAMA_BASE_URL = 'http://localhost:11434'
+
+# How long Ollama keeps the model loaded between requests.
+OLLAMA_KEEP_ALIVE = '30m'
+
+# Generations in flight at once across the whole process.
+LLM_MAX_CONCURRENCY = 4
+
+# Seconds allowed for one generation attempt, and extra attempts per row.
+LLM_TIMEOUT_SECONDS = 120
+LLM_MAX_RETRIES = 1
+LLM_RETRY_BACKOFF_SECONDS = 1
+
+# Background questionnaire jobs
+# Jobs processed at the same time by each server process.
+BATCH_JOB_WORKERS = 2
+
+# A job whose worker has not reported progress for this long is taken over
+# by the next process that starts.
+BATCH_JOB_STALE_SECONDS = 300
+
+# Seconds between progress events on the job event stream.
+BATCH_JOB_EVENT_INTERVAL = 1
+
+# Questionnaire rows read, retrieved and generated together. Uploads are
+# streamed, so only this many rows are held in memory at a time.
+QUESTIONNAIRE_CHUNK_SIZE = 64
+
+# Answer repeated questions of an upload once. Rows with the same text up to
+# case, punctuation and spacing are always grouped; with a similarity set,
+# rows whose embeddings are at least that close in cosine similarity are too
+# (None groups on text only). The most recently used
+# QUESTIONNAIRE_DEDUP_RESULTS groups are remembered for the rest of the
+# upload; a repeat of an older group is answered again.
+QUESTIONNAIRE_DEDUP = True
+QUESTIONNAIRE_DEDUP_SIMILARITY = 0.95
+QUESTIONNAIRE_DEDUP_RESULTS = 2000
+
+# Chat history
+
+# Messages returned per /history/ "select" page, and the most a client may ask for.
+HISTORY_PAGE_SIZE = 50
+HISTORY_MAX_PAGE_SIZE = 200
+
+# Chat context: question/answer pairs looked back on for follow-ups, the token
+# budget of the history window sent to the chat prompt (0 sends none), the
+# tokens kept of any one message, and threads whose recent turns are cached.
+CONVERSATION_TURNS = 3
+CONVERSATION_HISTORY_TOKENS = 512
+CONVERSATION_MESSAGE_TOKENS = 200
+CONVERSATION_CACHE_SIZE = 1000
+
+# Logging
+# Records carry the trace id of the request they belong to (see
+# Backend.middleware.TraceIdMiddleware) as key=value pairs. Set LOG_LEVEL to
+# DEBUG to also log the duration of every answering stage.
+LOG_LEVEL = 'INFO'
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'trace_id': {'()': 'Backend.utils.metrics.TraceIdFilter'},
+    },
+    'formatters': {
+        'structured': {
+            'format': 'time=%(asctime)s level=%(levelname)s logger=%(name)s trace_id=%(trace_id)s %(message)s',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'filters': ['trace_id'],
+            'formatter': 'structured',
+        },
+    },
+    'root': {'handlers': ['console'], 'level': 'WARNING'},
+    'loggers': {
+        'Backend': {'handlers': ['console'], 'level': LOG_LEVEL, 'propagate': False},
+        'django': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
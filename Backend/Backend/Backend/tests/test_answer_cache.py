@@ -0,0 +1,61 @@
+import os
+import tempfile
+
+import numpy as np
+from django.test import SimpleTestCase
+
+from Backend.utils.answer_cache import AnswerCache
+
+
+class AnswerCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "answer_cache")
+        self.vector = np.array([1.0, 0.0, 0.0, 0.0], dtype=np.float32)
+
+    def cache(self, **kwargs):
+        return AnswerCache(path=self.path, max_entries=10, ttl_seconds=3600, similarity_cutoff=0.9,
+                           save_interval=0, **kwargs)
+
+    def test_exact_and_near_duplicate_hits(self):
+        cache = self.cache()
+        cache.put("Do you encrypt data at rest?", self.vector, {"answer": "Yes"}, "v1")
+
+        self.assertEqual(cache.get("do you encrypt data at rest", self.vector, "v1"), {"answer": "Yes"})
+        nearby = np.array([0.99, 0.1, 0.0, 0.0], dtype=np.float32)
+        self.assertEqual(cache.get("Is stored data encrypted?", nearby, "v1"), {"answer": "Yes"})
+        self.assertIsNone(cache.get("Is stored data encrypted?", np.array([0, 1, 0, 0], dtype=np.float32), "v1"))
+
+    def test_prompts_do_not_share_answers(self):
+        cache = self.cache()
+        cache.put("Do you encrypt data?", self.vector, {"answer": "chat"}, "v1", prompt="chat")
+
+        self.assertIsNone(cache.get("Do you encrypt data?", self.vector, "v1"))
+        self.assertEqual(cache.get("Do you encrypt data?", self.vector, "v1", prompt="chat"), {"answer": "chat"})
+
+    def test_new_index_version_drops_entries(self):
+        cache = self.cache()
+        cache.put("Q", self.vector, {"answer": "A"}, "v1")
+
+        self.assertIsNone(cache.get("Q", self.vector, "v2"))
+        self.assertEqual(cache.stats()["invalidations"], 1)
+
+    def test_saved_cache_round_trips(self):
+        cache = self.cache()
+        cache.put("Q one", self.vector, {"answer": "1"}, "v1")
+        cache.put("Q two", np.array([0, 1, 0, 0], dtype=np.float32), {"answer": "2"}, "v1", prompt="chat")
+
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["answer_cache.lock", "answer_cache.npz"])
+        loaded = self.cache()
+        self.assertEqual(loaded.stats()["entries"], 2)
+        self.assertEqual(loaded.get("Q one", self.vector, "v1"), {"answer": "1"})
+        self.assertEqual(loaded.get("q two", np.array([0, 1, 0, 0], dtype=np.float32), "v1", prompt="chat"),
+                         {"answer": "2"})
+
+    def test_unreadable_file_is_ignored(self):
+        with open(f"{self.path}.npz", 'wb') as f:
+            f.write(b"not a cache")
+
+        self.assertEqual(self.cache().stats()["entries"], 0)
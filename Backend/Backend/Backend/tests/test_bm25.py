@@ -0,0 +1,106 @@
+import os
+import tempfile
+
+import faiss
+import numpy as np
+from django.test import SimpleTestCase
+
+from Backend.utils.bm25 import BM25_NAME, Bm25Index, load_bm25, reciprocal_rank_fusion, tokenize, write_bm25
+from Backend.utils.retrieval import RetrievalEngine
+
+TEXTS = [
+    "Logical access is reviewed quarterly as required by SOC 2 CC6.1.",
+    "Backups are encrypted with AES-256 and restores are tested yearly.",
+    "Change management follows ISO 27001 A.12.1 with peer review.",
+    "Access reviews cover every production system and every vendor account.",
+    "",
+]
+
+
+class TokenizeTests(SimpleTestCase):
+
+    def test_identifiers_are_kept_whole_and_split(self):
+        self.assertEqual(
+            tokenize("SOC 2 CC6.1 and AES-256"),
+            ["soc", "2", "cc6.1", "cc6", "1", "aes-256", "aes", "256"]
+        )
+
+    def test_stop_words_are_dropped(self):
+        self.assertEqual(tokenize("Do you encrypt the data?"), ["encrypt", "data"])
+
+
+class Bm25IndexTests(SimpleTestCase):
+    """
+    Round trips through the BM25 file format and the ranking it gives.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, BM25_NAME)
+        write_bm25(self.path, TEXTS)
+        self.index = Bm25Index(self.path)
+
+    def test_round_trip(self):
+        self.assertEqual(len(self.index), len(TEXTS))
+        self.assertEqual(self.index.k1, 1.2)
+        self.assertEqual(self.index.b, 0.75)
+        self.assertIsInstance(load_bm25(self.tmp.name), Bm25Index)
+
+    def test_identifier_ranks_its_document_first(self):
+        self.assertEqual(self.index.top("Is access controlled per CC6.1?", 3)[0][0], 0)
+        self.assertEqual(self.index.top("Do you use AES-256?", 3)[0][0], 1)
+        self.assertEqual(self.index.top("ISO 27001 A.12.1", 3)[0][0], 2)
+
+    def test_scores_descend_and_k_limits(self):
+        hits = self.index.top("access review", 10)
+        self.assertEqual({row for row, _ in hits}, {0, 2, 3})
+        scores = [score for _, score in hits]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertEqual(len(self.index.top("access review", 1)), 1)
+
+    def test_unknown_terms_match_nothing(self):
+        self.assertEqual(self.index.top("kubernetes", 5), [])
+        self.assertEqual(self.index.top("", 5), [])
+
+    def test_missing_file(self):
+        self.assertIsNone(load_bm25(os.path.join(self.tmp.name, "missing")))
+
+    def test_rejects_other_files(self):
+        other = os.path.join(self.tmp.name, "other.bin")
+        with open(other, 'wb') as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            Bm25Index(other)
+
+
+class FusionTests(SimpleTestCase):
+
+    def test_reciprocal_rank_fusion_order(self):
+        # "b" is second in both rankings and beats items first in only one
+        self.assertEqual(reciprocal_rank_fusion([["a", "b", "c"], ["d", "b", "a"]], k=60), ["a", "b", "d", "c"])
+
+    def test_reciprocal_rank_fusion_ties_keep_first_ranking_order(self):
+        self.assertEqual(reciprocal_rank_fusion([["x", "y"], ["y", "x"]]), ["x", "y"])
+        self.assertEqual(reciprocal_rank_fusion([[], ["z"]]), ["z"])
+
+    def test_fuse_adds_lexical_hits_with_their_distance(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, BM25_NAME)
+        write_bm25(path, [f"doc{i} filler" for i in range(50)])
+        lexical_index = Bm25Index(path)
+
+        vectors = np.random.default_rng(0).standard_normal((50, 8)).astype(np.float32)
+        index = faiss.IndexFlatL2(8)
+        index.add(vectors)
+        query = vectors[:1]
+        scores, indices = index.search(query, 4)
+
+        fused_scores, fused_indices = RetrievalEngine._fuse(index, lexical_index, ["doc30"], query, scores, indices)
+
+        self.assertEqual(fused_indices.shape, indices.shape)
+        # The exact dense match stays first, the lexical hit comes next
+        self.assertEqual(fused_indices[0, :2].tolist(), [0, 30])
+        self.assertAlmostEqual(float(fused_scores[0, 1]), float(((vectors[30] - query[0]) ** 2).sum()), places=3)
+        self.assertEqual(fused_indices[0, 2:].tolist(), indices[0, 1:3].tolist())
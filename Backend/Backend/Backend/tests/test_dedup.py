@@ -0,0 +1,61 @@
+import numpy as np
+from django.test import SimpleTestCase
+
+from Backend.utils.dedup import QuestionDeduplicator
+
+
+def unit_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+
+class QuestionDeduplicatorTests(SimpleTestCase):
+
+    def test_repeats_join_the_first_cluster(self):
+        dedup = QuestionDeduplicator(enabled=True, similarity=0.95, max_results=10)
+        vectors = unit_vectors(3)
+        near = vectors[0] + 0.001
+
+        clusters = dedup.assign(
+            ["Do you encrypt data?", "do you ENCRYPT data", "Is MFA enforced?", "Encryption of data?"],
+            [vectors[0], vectors[1], vectors[2], near]
+        )
+        self.assertEqual(clusters, [0, 0, 1, 0])
+
+        dedup.remember(0, {"answer": "Yes"})
+        self.assertEqual(dedup.result(0), {"answer": "Yes"})
+        self.assertIsNone(dedup.result(1))
+
+    def test_memory_stays_bounded(self):
+        dedup = QuestionDeduplicator(enabled=True, similarity=0.95, max_results=8)
+        vectors = unit_vectors(100)
+
+        for start in range(0, 100, 10):
+            clusters = dedup.assign([f"question {i}" for i in range(start, start + 10)], vectors[start:start + 10])
+            for cluster in clusters:
+                dedup.remember(cluster, {"answer": cluster})
+
+        self.assertLessEqual(len(dedup._by_text), 8)
+        self.assertLessEqual(len(dedup._results), 8)
+        self.assertEqual(len(dedup._leaders), 8)
+        self.assertEqual(int((dedup._slot_clusters >= 0).sum()), 8)
+
+        # The most recent clusters are still found, forgotten ones start anew
+        self.assertEqual(dedup.assign(["question 99"], vectors[99:]), [99])
+        self.assertEqual(dedup.result(99), {"answer": 99})
+        self.assertEqual(dedup.assign(["question 0"], vectors[:1]), [100])
+
+    def test_recently_used_clusters_are_kept(self):
+        dedup = QuestionDeduplicator(enabled=True, similarity=0.95, max_results=2)
+        vectors = unit_vectors(3)
+        dedup.assign(["a", "b"], vectors[:2])
+        dedup.assign(["a"], vectors[:1])
+        dedup.assign(["c"], vectors[2:])
+
+        self.assertEqual(set(dedup._by_text), {"a", "c"})
+
+    def test_disabled(self):
+        dedup = QuestionDeduplicator(enabled=False)
+
+        self.assertEqual(dedup.assign(["a", "a"], unit_vectors(2)), [0, 1])
+        dedup.remember(0, {"answer": "x"})
+        self.assertIsNone(dedup.result(0))
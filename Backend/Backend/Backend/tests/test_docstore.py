@@ -0,0 +1,62 @@
+import math
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from Backend.utils.docstore import DOCSTORE_NAME, MmapDocstore, write_docstore
+
+
+class DocstoreTests(SimpleTestCase):
+    """
+    Round trips through the memory-mapped docstore format.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, DOCSTORE_NAME)
+
+    def test_round_trip(self):
+        ids = ["kl-0", "policy-3", "policy-4"]
+        texts = ["Do you encrypt data at rest?", "Données chiffrées (AES-256) ✓", ""]
+        metadatas = [
+            {"answer": "Yes", "category": "Encryption", "row": 12},
+            {"source": "pdf", "page_number": 3, "score": 0.5, "tags": ["a", "b"]},
+            {"details": None, "missing": float("nan")},
+        ]
+        write_docstore(self.path, ids, texts, metadatas)
+
+        docstore = MmapDocstore(self.path)
+        self.assertEqual(len(docstore), 3)
+        self.assertEqual([doc.id for doc in docstore], ids)
+        self.assertEqual([doc.page_content for doc in docstore], texts)
+        self.assertEqual(docstore.document(0).metadata, metadatas[0])
+        self.assertEqual(docstore.document(1).metadata, metadatas[1])
+
+        # Keys a document lacks stay absent; None and NaN keep their type
+        last = docstore.document(2).metadata
+        self.assertEqual(set(last), {"details", "missing"})
+        self.assertIsNone(last["details"])
+        self.assertTrue(math.isnan(last["missing"]))
+
+    def test_search_by_row(self):
+        write_docstore(self.path, ["a", "b"], ["first", "second"], [{}, {}])
+        docstore = MmapDocstore(self.path)
+
+        self.assertEqual(docstore.search(1).page_content, "second")
+        self.assertEqual(docstore.search("0").id, "a")
+        self.assertEqual(docstore.search(2), "ID 2 not found.")
+
+    def test_empty(self):
+        write_docstore(self.path, [], [], [])
+        docstore = MmapDocstore(self.path)
+
+        self.assertEqual(len(docstore), 0)
+        self.assertEqual(list(docstore), [])
+
+    def test_rejects_other_files(self):
+        with open(self.path, 'wb') as f:
+            f.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            MmapDocstore(self.path)
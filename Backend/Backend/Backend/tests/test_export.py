@@ -0,0 +1,34 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from Backend.utils.export import write_answered_questionnaire
+
+
+def result(answer):
+    return {"suggestedAnswer": answer, "confidence_score": 90, "references": ["KL (Cat)"]}
+
+
+class AnsweredQuestionnaireTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_csv_keeps_every_line(self):
+        upload = os.path.join(self.tmp.name, "q.csv")
+        output = os.path.join(self.tmp.name, "q_answered.csv")
+        with open(upload, 'w', encoding='utf-8-sig', newline='') as f:
+            f.write("id,Questions\n1,Do you encrypt data?\n\n2,\n3,Is MFA enforced?\n")
+
+        write_answered_questionnaire(upload, "q.csv", [result("Yes"), result("No")], output)
+
+        with open(output, 'r', encoding='utf-8', newline='') as f:
+            self.assertEqual(f.read().splitlines(), [
+                "id,Questions,Suggested Answer,Confidence,References",
+                "1,Do you encrypt data?,Yes,90,KL (Cat)",
+                "",
+                "2,,,,",
+                "3,Is MFA enforced?,No,90,KL (Cat)",
+            ])
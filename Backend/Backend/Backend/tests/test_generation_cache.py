@@ -0,0 +1,30 @@
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from Backend.utils.generation_cache import GenerationCache
+
+
+class GenerationCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.cache = GenerationCache(path=os.path.join(self.tmp.name, "generations.sqlite3"), max_bytes=1 << 20,
+                                     ttl_seconds=3600, stale_seconds=0)
+
+    def test_round_trip(self):
+        self.cache.put("k", "model", "Backups are encrypted.", 1.5)
+
+        self.assertEqual(self.cache.get("k"), ("Backups are encrypted.", "fresh"))
+        self.assertEqual(self.cache.get("other"), (None, "miss"))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_database_errors_count_as_misses(self):
+        self.cache.put("k", "model", "Backups are encrypted.", 1.5)
+        self.cache._connection().execute("DROP TABLE generations")
+
+        with self.assertLogs("Backend.utils.generation_cache", "WARNING"):
+            self.assertEqual(self.cache.get("k"), (None, "miss"))
+        self.assertEqual(self.cache.misses, 1)
@@ -0,0 +1,54 @@
+import json
+import os
+import tempfile
+
+from django.test import SimpleTestCase
+
+from Backend.utils.indexing import MANIFEST_NAME, check_index_files, index_file_signature
+
+
+class IndexFileCheckTests(SimpleTestCase):
+    """
+    Index directories are checked against the files their manifest lists.
+    """
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.write("index.faiss", b"\1" * 200_000)
+        self.write("docstore.bin", b"rows")
+
+    def write(self, name, data):
+        with open(os.path.join(self.tmp.name, name), 'wb') as f:
+            f.write(data)
+
+    def write_manifest(self):
+        files = {name: index_file_signature(os.path.join(self.tmp.name, name)) for name in ("index.faiss", "docstore.bin")}
+        with open(os.path.join(self.tmp.name, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump({"index_files": files}, f)
+
+    def test_matching_files(self):
+        self.write_manifest()
+        check_index_files(self.tmp.name)
+
+    def test_rewritten_file_is_refused(self):
+        self.write_manifest()
+        # Same size, different tail: a newer file next to the old manifest
+        self.write("index.faiss", b"\1" * 199_999 + b"\2")
+
+        with self.assertRaises(ValueError):
+            check_index_files(self.tmp.name)
+
+    def test_missing_file_is_refused(self):
+        self.write_manifest()
+        os.remove(os.path.join(self.tmp.name, "docstore.bin"))
+
+        with self.assertRaises(ValueError):
+            check_index_files(self.tmp.name)
+
+    def test_unlisted_indexes_are_not_checked(self):
+        check_index_files(self.tmp.name)
+
+        with open(os.path.join(self.tmp.name, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump({"version": 2, "files": {}}, f)
+        check_index_files(self.tmp.name)
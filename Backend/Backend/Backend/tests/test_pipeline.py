@@ -0,0 +1,29 @@
+from django.test import SimpleTestCase
+
+from Backend.utils.pipeline import AnswerPipeline, PipelineItem
+
+
+class PipelineItemCachingTests(SimpleTestCase):
+    """
+    Which chat answers may go into the answer cache.
+    """
+
+    def item(self, source, follow_up):
+        item = PipelineItem("does it cover backups encryption", message="does it cover backups?",
+                            history="User: Do you encrypt data?\nAssistant: Yes.", follow_up=follow_up,
+                            prompt="chat")
+        item.source = source
+        item.context = "Backups are encrypted."
+        return item
+
+    def test_only_pdf_follow_ups_skip_the_cache(self):
+        self.assertFalse(self.item("pdf", follow_up=True).cacheable)
+        self.assertTrue(self.item("csv", follow_up=True).cacheable)
+        self.assertTrue(self.item("pdf", follow_up=False).cacheable)
+        self.assertTrue(PipelineItem("Do you encrypt data?").cacheable)
+
+    def test_history_only_goes_into_follow_up_prompts(self):
+        pipeline = AnswerPipeline(engine=object(), client=object())
+
+        self.assertIn("Assistant: Yes.", pipeline.inputs(self.item("pdf", follow_up=True), "chat")["history"])
+        self.assertEqual(pipeline.inputs(self.item("pdf", follow_up=False), "chat")["history"], "")
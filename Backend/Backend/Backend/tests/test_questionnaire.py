@@ -0,0 +1,80 @@
+import io
+
+import openpyxl
+from django.test import SimpleTestCase
+
+from Backend.utils.questionnaire import (
+    QuestionnaireError, check_questionnaire, estimate_rows, iter_chunks, iter_questionnaire
+)
+
+
+def csv_upload(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+class QuestionnaireReaderTests(SimpleTestCase):
+    """
+    The streaming readers behind /batch/ and questionnaire jobs.
+    """
+
+    def test_csv_rows(self):
+        upload = csv_upload("\ufeffid,Questions\n7,Do you encrypt data?\n\n,Is MFA enforced?\n8,\n")
+
+        self.assertEqual(
+            list(iter_questionnaire(upload, "q.csv")),
+            [(7, "Do you encrypt data?"), ("Q2", "Is MFA enforced?")]
+        )
+        self.assertFalse(upload.closed)
+
+    def test_xlsx_rows(self):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.append(["Question", "id"])
+        sheet.append(["Do you log access?", 3.0])
+        sheet.append([None, 4])
+        sheet.append(["Are backups tested?", None])
+        upload = io.BytesIO()
+        workbook.save(upload)
+        upload.seek(0)
+
+        self.assertEqual(
+            list(iter_questionnaire(upload, "q.XLSX")),
+            [(3, "Do you log access?"), ("Q3", "Are backups tested?")]
+        )
+
+    def test_missing_question_column(self):
+        with self.assertRaises(QuestionnaireError):
+            iter_questionnaire(csv_upload("id,Text\n1,Hello\n"), "q.csv")
+
+    def test_unsupported_format(self):
+        with self.assertRaises(QuestionnaireError):
+            iter_questionnaire(csv_upload("Questions\nA?\n"), "q.txt")
+
+    def test_check_leaves_upload_rewindable(self):
+        upload = csv_upload("Questions\nDo you encrypt data?\n")
+
+        check_questionnaire(upload, "q.csv")
+        self.assertFalse(upload.closed)
+        upload.seek(0)
+        self.assertEqual(list(iter_questionnaire(upload, "q.csv")), [("Q1", "Do you encrypt data?")])
+
+        with self.assertRaises(QuestionnaireError):
+            check_questionnaire(csv_upload("Text\nHello\n"), "q.csv")
+
+    def test_estimate_rows(self):
+        upload = csv_upload("Questions\nA?\n\nB?")
+        self.assertEqual(estimate_rows(upload, "q.csv"), 3)
+        self.assertEqual(upload.tell(), 0)
+        self.assertEqual(estimate_rows(csv_upload(""), "q.csv"), 0)
+
+        workbook = openpyxl.Workbook()
+        for question in ["Question", "A?", "B?"]:
+            workbook.active.append([question])
+        upload = io.BytesIO()
+        workbook.save(upload)
+        self.assertEqual(estimate_rows(upload, "q.xlsx"), 2)
+        self.assertEqual(upload.tell(), 0)
+
+    def test_iter_chunks(self):
+        self.assertEqual(list(iter_chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(iter_chunks([], 2)), [])
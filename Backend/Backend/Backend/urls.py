@@ -1,11 +1,23 @@
 
 from django.contrib import admin
 from django.urls import path
-from .views import analyze_question, analyze_questionnaire, fetch_history
+from .views import (
+    analyze_question, analyze_question_stream, analyze_questionnaire, answer_cache_stats, download_questionnaire_job,
+    fetch_history, metrics, questionnaire_job, questionnaire_job_events, reload_indexes, retrieval_status, submit_questionnaire_job
+)
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path ('analyze/', analyze_question, name = 'analyze_question'),
+    path ('analyze/stream/', analyze_question_stream, name = 'analyze_question_stream'),
     path ('history/', fetch_history, name = 'fetch_history'),
-    path ('batch/', analyze_questionnaire, name = 'analyze_questionnaire')
+    path ('batch/', analyze_questionnaire, name = 'analyze_questionnaire'),
+    path ('batch/jobs/', submit_questionnaire_job, name = 'submit_questionnaire_job'),
+    path ('batch/jobs/<str:job_id>/', questionnaire_job, name = 'questionnaire_job'),
+    path ('batch/jobs/<str:job_id>/events/', questionnaire_job_events, name = 'questionnaire_job_events'),
+    path ('batch/jobs/<str:job_id>/download/', download_questionnaire_job, name = 'download_questionnaire_job'),
+    path ('retrieval/reload/', reload_indexes, name = 'reload_indexes'),
+    path ('retrieval/status/', retrieval_status, name = 'retrieval_status'),
+    path ('cache/', answer_cache_stats, name = 'answer_cache_stats'),
+    path ('metrics', metrics, name = 'metrics')
 ]
@@ -0,0 +1,325 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: saves are still atomic, just not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_question(text):
+    """
+    Reduce a question to a canonical form for exact-match lookups.
+
+    Lowercases, drops punctuation and collapses whitespace, so
+    "Do you encrypt data at rest?" and "do you encrypt data at rest"
+    share one cache entry.
+    """
+    text = re.sub(r"[^\w\s]", " ", str(text).lower())
+    return " ".join(text.split())
+
+
+class AnswerCache:
+    """
+    Two-stage cache of answers in front of the retrieval + generation path.
+
+    Answers are kept per prompt ("questionnaire" or "chat"), since the
+    same question is answered differently by each. A lookup first tries
+    the normalized question text, then falls back to the nearest
+    previously answered question of the same prompt by cosine similarity
+    of the query embeddings. Entries are evicted least-recently-used beyond
+    `max_entries` and expire after `ttl_seconds`.
+
+    Every entry belongs to one index version; when the retrieval engine
+    reports a different version the whole cache is dropped, since its
+    answers came from indexes that no longer exist.
+
+    The cache is saved to `path`.npz (the entries as JSON next to their
+    embeddings, in one file so they are always replaced together) at most
+    every `save_interval` seconds. Worker processes save under an
+    exclusive lock on `path`.lock, each through its own temporary file.
+    """
+
+    def __init__(self, path=None, max_entries=None, ttl_seconds=None, similarity_cutoff=None, save_interval=None):
+        """
+        Initialize the AnswerCache and load any saved entries.
+
+        Args:
+            path (str, optional): File prefix for the saved cache and its lock
+            max_entries (int, optional): Maximum number of cached answers
+            ttl_seconds (float, optional): Age after which an entry expires
+            similarity_cutoff (float, optional): Minimum cosine similarity
+                for a near-duplicate hit
+            save_interval (float, optional): Minimum seconds between saves
+        """
+        self.path = str(path or settings.ANSWER_CACHE_PATH)
+        self.max_entries = max_entries or settings.ANSWER_CACHE_MAX_ENTRIES
+        self.ttl_seconds = ttl_seconds or settings.ANSWER_CACHE_TTL_SECONDS
+        self.similarity_cutoff = similarity_cutoff or settings.ANSWER_CACHE_SIMILARITY_CUTOFF
+        self.save_interval = settings.ANSWER_CACHE_SAVE_INTERVAL if save_interval is None else save_interval
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._matrix = None
+        self._slot_keys = []
+        self._free_slots = []
+        self._index_version = None
+        self._dirty = False
+        self._last_saved = time.monotonic()
+
+        self.hits_exact = 0
+        self.hits_semantic = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+        self._load()
+
+    def get(self, query, vector, index_version, prompt="questionnaire"):
+        """
+        Look up a cached answer.
+
+        Args:
+            query (str): The question
+            vector (numpy.ndarray): Embedding of the question
+            index_version (str): Current retrieval index version
+            prompt (str): Prompt the answer is for
+
+        Returns:
+            dict: The cached answer, or None on a miss
+        """
+        key = (prompt, normalize_question(query))
+        with self._lock:
+            self._check_version(index_version)
+
+            entry = self._live_entry(key)
+            if entry is not None:
+                self.hits_exact += 1
+                return entry["result"]
+
+            key = self._nearest(vector, prompt)
+            entry = self._live_entry(key) if key is not None else None
+            if entry is not None:
+                self.hits_semantic += 1
+                return entry["result"]
+
+            self.misses += 1
+            return None
+
+    def put(self, query, vector, result, index_version, prompt="questionnaire"):
+        """
+        Cache the answer to a question.
+
+        Args:
+            query (str): The question
+            vector (numpy.ndarray): Embedding of the question
+            result (dict): JSON-serializable answer
+            index_version (str): Index version the answer was retrieved from
+            prompt (str): Prompt the answer was made with
+        """
+        key = (prompt, normalize_question(query))
+        with self._lock:
+            self._check_version(index_version)
+            self._store(key, query, self._unit(vector), result, time.time())
+
+            while len(self._entries) > self.max_entries:
+                self._evict(next(iter(self._entries)))
+                self.evictions += 1
+
+            self._dirty = True
+            if time.monotonic() - self._last_saved >= self.save_interval:
+                self._save()
+
+    def stats(self):
+        """
+        Get hit/miss counters and the current size.
+
+        Returns:
+            dict: Cache statistics
+        """
+        with self._lock:
+            lookups = self.hits_exact + self.hits_semantic + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits_exact": self.hits_exact,
+                "hits_semantic": self.hits_semantic,
+                "misses": self.misses,
+                "hit_rate": round((self.hits_exact + self.hits_semantic) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "index_version": self._index_version
+            }
+
+    def clear(self):
+        with self._lock:
+            self._clear()
+            self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _check_version(self, index_version):
+        if index_version != self._index_version:
+            if self._entries:
+                logger.info("Index version changed, dropping %d cached answers", len(self._entries))
+                self.invalidations += 1
+            self._clear()
+            self._index_version = index_version
+            self._dirty = True
+
+    def _live_entry(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if time.time() - entry["created_at"] > self.ttl_seconds:
+            self._evict(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, vector, prompt):
+        if not self._entries:
+            return None
+        similarities = self._matrix @ self._unit(vector)
+        # Most similar entry of the same prompt; entries of other prompts
+        # above the cutoff are skipped one by one
+        while True:
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.similarity_cutoff:
+                return None
+            key = self._slot_keys[slot]
+            if key is not None and key[0] == prompt:
+                return key
+            similarities[slot] = -np.inf
+
+    def _store(self, key, question, unit_vector, result, created_at):
+        if key in self._entries:
+            slot = self._entries[key]["slot"]
+        elif self._free_slots:
+            slot = self._free_slots.pop()
+        else:
+            slot = len(self._slot_keys)
+            self._grow(slot + 1, len(unit_vector))
+
+        self._matrix[slot] = unit_vector
+        self._slot_keys[slot] = key
+        self._entries[key] = {
+            "prompt": key[0], "question": question, "result": result, "created_at": created_at, "slot": slot
+        }
+        self._entries.move_to_end(key)
+
+    def _grow(self, size, dim):
+        if self._matrix is None:
+            self._matrix = np.zeros((0, dim), dtype=np.float32)
+            self._slot_keys = []
+        capacity = max(size, 2 * len(self._slot_keys), 64)
+        matrix = np.zeros((capacity, dim), dtype=np.float32)
+        matrix[:len(self._matrix)] = self._matrix
+        self._free_slots.extend(range(capacity - 1, size - 1, -1))
+        self._slot_keys.extend([None] * (capacity - len(self._slot_keys)))
+        self._matrix = matrix
+
+    def _evict(self, key):
+        entry = self._entries.pop(key)
+        slot = entry["slot"]
+        # A zero row can never reach the similarity cutoff
+        self._matrix[slot] = 0.0
+        self._slot_keys[slot] = None
+        self._free_slots.append(slot)
+        self._dirty = True
+
+    def _clear(self):
+        self._entries.clear()
+        self._matrix = None
+        self._slot_keys = []
+        self._free_slots = []
+
+    @staticmethod
+    def _unit(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _save(self):
+        if not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+            keys = list(self._entries)
+            entries = [{key: value for key, value in self._entries[k].items() if key != "slot"} for k in keys]
+            vectors = self._matrix[[self._entries[k]["slot"] for k in keys]] if keys else np.zeros((0, 0), dtype=np.float32)
+
+            saved = json.dumps({"index_version": self._index_version, "entries": entries}, default=str)
+
+            tmp_path = f"{self.path}.{uuid.uuid4().hex}.tmp"
+            with open(f"{self.path}.lock", 'w') as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    with open(tmp_path, 'wb') as f:
+                        np.savez(f, entries=np.frombuffer(saved.encode('utf-8'), dtype=np.uint8), vectors=vectors)
+                    os.replace(tmp_path, f"{self.path}.npz")
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+
+            self._dirty = False
+            self._last_saved = time.monotonic()
+        except Exception as e:
+            logger.warning("Could not save answer cache: %s", e)
+
+    def _load(self):
+        path = f"{self.path}.npz"
+        if not os.path.exists(path):
+            return
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                saved = json.loads(data["entries"].tobytes().decode('utf-8'))
+                vectors = data["vectors"]
+            if len(vectors) != len(saved["entries"]):
+                raise ValueError("entry and vector counts differ")
+
+            self._index_version = saved["index_version"]
+            now = time.time()
+            for entry, vector in zip(saved["entries"], vectors):
+                if now - entry["created_at"] <= self.ttl_seconds:
+                    key = (entry.get("prompt", "questionnaire"), normalize_question(entry["question"]))
+                    self._store(key, entry["question"], vector, entry["result"], entry["created_at"])
+        except Exception as e:
+            logger.warning("Ignoring unreadable answer cache at %s: %s", self.path, e)
+            self._clear()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_answer_cache():
+    """
+    Get the process-wide AnswerCache, creating it on first call.
+
+    Returns:
+        AnswerCache: The shared cache
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnswerCache()
+                atexit.register(_cache.save)
+    return _cache
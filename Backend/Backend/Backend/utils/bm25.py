@@ -0,0 +1,247 @@
+import json
+import mmap
+import os
+import re
+import struct
+from collections import Counter
+
+import numpy as np
+
+from .conversation import STOP_WORDS
+
+BM25_NAME = "bm25.bin"
+
+MAGIC = b"IQABM201"
+_PREFIX = struct.Struct("<8sQQ")
+_ALIGNMENT = 8
+
+# Words, numbers and identifiers such as "cc6.1", "a.12.3" or "aes-256";
+# an identifier is indexed whole and by its parts
+_TOKEN = re.compile(r"[a-z0-9]+(?:[./-][a-z0-9]+)*")
+_SEPARATOR = re.compile(r"[./-]")
+
+# Term frequencies are stored as uint16
+_MAX_TF = 65535
+
+
+def tokenize(text):
+    """
+    Split text into BM25 terms.
+
+    Text is lowercased and stop words dropped. Identifiers joined by dots,
+    dashes or slashes ("CC6.1", "A.12.3", "AES-256") are kept as one term,
+    so an exact control reference outscores passages that merely share its
+    numbers, and are also split into their parts, so "AES" still matches
+    "AES-256".
+
+    Args:
+        text (str): Question or document text
+
+    Returns:
+        list: Terms in text order, repeated as often as they occur
+    """
+    terms = []
+    for token in _TOKEN.findall(str(text).lower()):
+        if token not in STOP_WORDS:
+            terms.append(token)
+        if _SEPARATOR.search(token):
+            terms.extend(part for part in _SEPARATOR.split(token) if part not in STOP_WORDS)
+    return terms
+
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+
+
+def write_bm25(path, texts, k1=1.2, b=0.75):
+    """
+    Write a BM25 inverted index of documents in FAISS index order.
+
+    Layout, like docstore.bin: a fixed prefix (magic, header position,
+    header length), then 8-byte aligned arrays, and finally a JSON header
+    giving each array's position, dtype and length. The vocabulary is
+    sorted; term t's UTF-8 text is terms[term_offsets[t]:term_offsets[t + 1]]
+    and its postings are doc_ids and term_freqs in
+    [postings[t], postings[t + 1]), by ascending row.
+
+    Args:
+        path (str): Output file
+        texts (list): Document page contents
+        k1 (float): Term frequency saturation
+        b (float): Document length normalization, 0-1
+    """
+    postings = {}
+    lengths = np.zeros(len(texts), dtype="<u4")
+    for row, text in enumerate(texts):
+        counts = Counter(tokenize(text))
+        lengths[row] = sum(counts.values())
+        for term, tf in counts.items():
+            postings.setdefault(term, []).append((row, min(tf, _MAX_TF)))
+
+    vocabulary = sorted(postings)
+    encoded = [term.encode('utf-8') for term in vocabulary]
+    term_offsets = np.zeros(len(vocabulary) + 1, dtype="<i8")
+    np.cumsum([len(term) for term in encoded], dtype="<i8", out=term_offsets[1:])
+    posting_offsets = np.zeros(len(vocabulary) + 1, dtype="<i8")
+    np.cumsum([len(postings[term]) for term in vocabulary], dtype="<i8", out=posting_offsets[1:])
+    doc_ids = np.fromiter((row for term in vocabulary for row, _ in postings[term]), dtype="<u4",
+                          count=int(posting_offsets[-1]))
+    term_freqs = np.fromiter((tf for term in vocabulary for _, tf in postings[term]), dtype="<u2",
+                             count=int(posting_offsets[-1]))
+
+    arrays = {
+        "terms": np.frombuffer(b"".join(encoded), dtype="u1"),
+        "term_offsets": term_offsets,
+        "postings": posting_offsets,
+        "doc_ids": doc_ids,
+        "term_freqs": term_freqs,
+        "lengths": lengths,
+    }
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, 0, 0))
+        _pad(f)
+
+        header = {
+            "rows": len(texts),
+            "terms": len(vocabulary),
+            "avgdl": float(lengths.mean()) if len(texts) else 0.0,
+            "k1": k1,
+            "b": b,
+            "arrays": {}
+        }
+        for name, array in arrays.items():
+            header["arrays"][name] = {"offset": f.tell(), "dtype": array.dtype.str, "count": len(array)}
+            f.write(array.tobytes())
+            _pad(f)
+
+        header_pos = f.tell()
+        header_bytes = json.dumps(header).encode('utf-8')
+        f.write(header_bytes)
+        f.seek(0)
+        f.write(_PREFIX.pack(MAGIC, header_pos, len(header_bytes)))
+
+    os.replace(tmp_path, path)
+
+
+class Bm25Index:
+    """
+    Read-only, memory-mapped BM25 index written by `write_bm25`.
+
+    The posting lists stay in the mapping, shared between worker processes
+    like the docstore. Opening the file builds the term lookup table and
+    the per-term idf and per-document length norms once; a query then only
+    touches the postings of its own terms, scored with numpy.
+
+    Documents are addressed by their row number, which equals their
+    position in the FAISS index.
+    """
+
+    def __init__(self, path):
+        """
+        Map an index file written by `write_bm25`.
+
+        Args:
+            path (str): Path to the BM25 file
+        """
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_pos, header_size = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a BM25 index file")
+        header = json.loads(self._mmap[header_pos:header_pos + header_size])
+
+        arrays = {
+            name: np.frombuffer(self._mmap, dtype=spec["dtype"], count=spec["count"], offset=spec["offset"])
+            for name, spec in header["arrays"].items()
+        }
+        self.rows = header["rows"]
+        self.k1 = header["k1"]
+        self.b = header["b"]
+        self._postings = arrays["postings"]
+        self._doc_ids = arrays["doc_ids"]
+        self._term_freqs = arrays["term_freqs"]
+
+        terms, term_offsets = arrays["terms"].tobytes(), arrays["term_offsets"]
+        self._vocabulary = {
+            terms[term_offsets[t]:term_offsets[t + 1]].decode('utf-8'): t
+            for t in range(header["terms"])
+        }
+
+        df = np.diff(self._postings).astype(np.float64)
+        self._idf = np.log(1 + (self.rows - df + 0.5) / (df + 0.5)).astype(np.float32)
+        lengths = arrays["lengths"].astype(np.float32)
+        avgdl = header["avgdl"] or 1.0
+        self._norms = (self.k1 * (1 - self.b + self.b * lengths / avgdl)).astype(np.float32)
+
+    def __len__(self):
+        return self.rows
+
+    def top(self, query, k):
+        """
+        Rank documents for a query with Okapi BM25.
+
+        Args:
+            query (str): Question text
+            k (int): Hits to return at most
+
+        Returns:
+            list: (row, score) tuples best first, only documents sharing a
+            term with the query
+        """
+        terms = {self._vocabulary[term] for term in tokenize(query) if term in self._vocabulary}
+        if not terms or k <= 0:
+            return []
+
+        scores = np.zeros(self.rows, dtype=np.float32)
+        for t in terms:
+            start, end = self._postings[t], self._postings[t + 1]
+            rows = self._doc_ids[start:end]
+            tf = self._term_freqs[start:end].astype(np.float32)
+            scores[rows] += self._idf[t] * tf * (self.k1 + 1) / (tf + self._norms[rows])
+
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(row), float(scores[row])) for row in matched]
+
+
+def load_bm25(index_path):
+    """
+    Open the BM25 index of an index directory, if it has one.
+
+    Args:
+        index_path (str): Index directory
+
+    Returns:
+        Bm25Index: The index, or None for indexes built before BM25 was
+        added (rebuild them with `build_indexes --full`)
+    """
+    path = os.path.join(str(index_path), BM25_NAME)
+    return Bm25Index(path) if os.path.exists(path) else None
+
+
+def reciprocal_rank_fusion(rankings, k=60):
+    """
+    Merge rankings of the same items by reciprocal-rank fusion.
+
+    Each item scores sum(1 / (k + rank)) over the rankings it appears in,
+    with ranks counted from 1, so only positions matter and dense distances
+    and BM25 scores need no common scale.
+
+    Args:
+        rankings (list): Lists of items, each best first
+        k (int): Damping constant; larger values flatten the rank weights
+
+    Returns:
+        list: Items best first; ties keep the order of the first ranking
+    """
+    scores = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda item: -scores[item])
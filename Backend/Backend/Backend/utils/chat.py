@@ -0,0 +1,86 @@
+from .pipeline import PipelineItem, calculate_confidence, get_pipeline, result_references, result_text
+
+
+class ChatTurn:
+    """
+    Retrieval half of answering one chat message.
+
+    Creating a ChatTurn runs the AnswerPipeline up to generation for the
+    message - or, for a follow-up, the standalone query built from its
+    conversation. CSV, cached and empty results are complete right away; a
+    PDF match leaves `inputs` for the chat prompt, and the `chunks` they
+    were built from for the generation cache, and is finished with
+    `complete()` once the answer has been generated, which lets a streaming
+    view send the metadata before any tokens exist.
+    """
+
+    def __init__(self, query, pipeline=None, context=None):
+        """
+        Retrieve the answer or the generation inputs for a message.
+
+        Args:
+            query (str): The user's message
+            pipeline (AnswerPipeline, optional): Pipeline to answer with
+            context (dict, optional): `ConversationContext.build` output
+                for the message
+        """
+        self.pipeline = pipeline or get_pipeline()
+        context = context or {"query": query, "history": "", "follow_up": False}
+        # Caching and retrieval go by the standalone query
+        self.item = self.pipeline.prepare(
+            PipelineItem(context["query"], message=query, history=context["history"],
+                         follow_up=context["follow_up"], prompt="chat")
+        )
+        self.cached = self.item.origin == "cache"
+
+        self.inputs = None
+        self.chunks = None
+        if self.item.needs_generation:
+            self.inputs = self.pipeline.inputs(self.item, "chat")
+            self.chunks = self.item.chunks
+            self.result = {
+                "source": "pdf",
+                "score": self.item.score,
+                "answer": "",
+                "references": self.item.references
+            }
+        else:
+            self.result = self.pipeline.format(self.item).result
+
+    @property
+    def needs_generation(self):
+        return self.inputs is not None
+
+    def complete(self, answer, cache=True):
+        """
+        Fill in the generated answer of a PDF match.
+
+        Args:
+            answer (str): Generated text
+            cache (bool): Store the finished answer in the answer cache
+
+        Returns:
+            dict: The finished result
+        """
+        self.item.generated = answer
+        self.result = self.pipeline.format(self.item, cache=cache).result
+        return self.result
+
+
+def response_metadata(result):
+    """
+    The parts of a chat response known before the answer text.
+    """
+    return {
+        "type": "system",
+        "source": result.get("source"),
+        "references": result_references(result),
+        "confidence_score": calculate_confidence(result.get("score", 0.0))
+    }
+
+
+def response_text(result):
+    """
+    The answer text of a chat response, as `analyze_question` shows it.
+    """
+    return result_text(result)
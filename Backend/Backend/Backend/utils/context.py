@@ -0,0 +1,161 @@
+import re
+
+import numpy as np
+from django.conf import settings
+
+from .metrics import CONTEXT_TOKENS
+from .tokens import clip_tokens, estimate_tokens
+
+# Longest chunk overlap looked for when merging neighbouring chunks; the
+# index is built with INDEX_CHUNK_OVERLAP characters of overlap
+_MAX_OVERLAP = 400
+
+_WORD = re.compile(r"\w+")
+
+
+class ContextBuilder:
+    """
+    Prompt context for the PDF path, from several retrieved chunks.
+
+    Chunks are picked by maximal marginal relevance: each next chunk is the
+    one that best trades closeness to the question against similarity to
+    the chunks already picked, so the context covers more of the policy
+    instead of repeating one passage. The retrieval's best match is always
+    picked first. Picking stops at `max_chunks` or when no other chunk fits
+    the token budget.
+
+    Picked chunks of the same document page are merged into one passage in
+    reading order, with the text neighbouring chunks share written once.
+    The tokens this saves compared with concatenating the picked chunks
+    as they are are counted in `qna_context_tokens_total`.
+    """
+
+    def __init__(self, max_chunks=None, token_budget=None, mmr_lambda=None):
+        """
+        Initialize the ContextBuilder.
+
+        Args:
+            max_chunks (int, optional): Chunks picked at most
+            token_budget (int, optional): Tokens the context may take
+            mmr_lambda (float, optional): Weight of relevance against
+                diversity, from 0 (only diversity) to 1 (only relevance)
+        """
+        self.max_chunks = max_chunks or settings.CONTEXT_MAX_CHUNKS
+        self.token_budget = token_budget or settings.CONTEXT_TOKEN_BUDGET
+        self.mmr_lambda = settings.CONTEXT_MMR_LAMBDA if mmr_lambda is None else mmr_lambda
+
+    def build(self, candidates, best=None):
+        """
+        Build the context for one question.
+
+        Args:
+            candidates (list): (Document, score, vector) tuples, best first,
+                as returned by `RetrievalEngine.pdf_passages`
+            best (tuple, optional): (Document, score) the retrieval settled
+                on, picked first even if it is not among the candidates
+
+        Returns:
+            dict: `context` text, the picked `docs_with_scores`, and the
+            context's `tokens` and `tokens_saved`
+        """
+        candidates = list(candidates)
+        if best is not None:
+            key = _chunk_key(best[0])
+            vector = next((c[2] for c in candidates if _chunk_key(c[0]) == key), None)
+            candidates = [(best[0], best[1], vector)] + [c for c in candidates if _chunk_key(c[0]) != key]
+        if not candidates:
+            return {"context": "", "docs_with_scores": [], "tokens": 0, "tokens_saved": 0}
+
+        picked = [candidates[i] for i in self._pick(candidates)]
+        context = clip_tokens(self._merge(picked), self.token_budget)
+
+        tokens = estimate_tokens(context)
+        naive = estimate_tokens("\n\n".join(doc.page_content for doc, _, _ in picked))
+        saved = max(0, naive - tokens)
+        CONTEXT_TOKENS.inc(tokens, kind="used")
+        CONTEXT_TOKENS.inc(saved, kind="saved")
+        return {
+            "context": context,
+            "docs_with_scores": [candidate[:2] for candidate in picked],
+            "tokens": tokens,
+            "tokens_saved": saved
+        }
+
+    def _pick(self, candidates):
+        # L2 distances of unit vectors: cosine similarity is 1 - d / 2
+        relevance = [1 - float(score) / 2 for _, score, _ in candidates]
+        costs = [estimate_tokens(doc.page_content) for doc, _, _ in candidates]
+        vectors = [_unit(vector) for _, _, vector in candidates]
+        words = [None] * len(candidates)
+
+        def similarity(i, j):
+            if vectors[i] is not None and vectors[j] is not None:
+                return float(vectors[i] @ vectors[j])
+            # Without stored vectors, fall back to word overlap
+            for k in (i, j):
+                if words[k] is None:
+                    words[k] = set(_WORD.findall(candidates[k][0].page_content.lower()))
+            union = words[i] | words[j]
+            return len(words[i] & words[j]) / len(union) if union else 0.0
+
+        picked = [0]
+        used = costs[0]
+        redundancy = [similarity(0, j) for j in range(len(candidates))]
+        remaining = set(range(1, len(candidates)))
+        while remaining and len(picked) < self.max_chunks:
+            fitting = [j for j in remaining if used + costs[j] <= self.token_budget]
+            if not fitting:
+                break
+            best = max(fitting, key=lambda j: (
+                self.mmr_lambda * relevance[j] - (1 - self.mmr_lambda) * redundancy[j], -j
+            ))
+            picked.append(best)
+            used += costs[best]
+            remaining.discard(best)
+            for j in remaining:
+                redundancy[j] = max(redundancy[j], similarity(best, j))
+        return picked
+
+    @staticmethod
+    def _merge(picked):
+        # One passage per document page, the pages in the order they were
+        # picked and each page's chunks in reading order
+        pages = {}
+        for doc, _, _ in picked:
+            page = (doc.metadata.get("document_name"), doc.metadata.get("page_number"))
+            pages.setdefault(page, []).append(doc)
+
+        passages = []
+        for docs in pages.values():
+            docs.sort(key=lambda doc: doc.metadata.get("chunk_index", 0))
+            text = docs[0].page_content
+            for previous, doc in zip(docs, docs[1:]):
+                previous_index, index = previous.metadata.get("chunk_index"), doc.metadata.get("chunk_index")
+                if previous_index is not None and index == previous_index + 1:
+                    text += doc.page_content[_overlap(text, doc.page_content):]
+                else:
+                    text += " ... " + doc.page_content
+            passages.append(text)
+        return "\n\n".join(passages)
+
+
+def _overlap(text, following):
+    """
+    Length of the longest end of `text` that `following` starts with.
+    """
+    for size in range(min(len(text), len(following), _MAX_OVERLAP), 0, -1):
+        if text.endswith(following[:size]):
+            return size
+    return 0
+
+
+def _unit(vector):
+    if vector is None:
+        return None
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+def _chunk_key(doc):
+    return doc.id or doc.page_content
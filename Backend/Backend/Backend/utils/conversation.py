@@ -0,0 +1,184 @@
+import re
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+from .metrics import span
+from .tokens import clip_tokens, estimate_tokens
+
+# Openings that only make sense as a continuation of the previous question.
+# "and ..." or "for ..." also open standalone questions ("For which systems
+# is MFA enforced?"); short ones like "and for logs?" are caught by having
+# at most one content word.
+FOLLOW_UP_PREFIXES = (
+    "what about", "how about", "also ", "what if", "same for", "same ", "is that", "does that",
+    "do they", "does it", "is it", "can it", "how so",
+)
+
+# Words that point back at something said earlier, when the message is short
+# enough that they are unlikely to refer to something inside it
+ANAPHORA = {"it", "its", "this", "they", "them", "their", "those", "these", "same"}
+SHORT_MESSAGE_WORDS = 8
+
+STOP_WORDS = {
+    "a", "about", "all", "an", "and", "any", "are", "as", "at", "be", "by", "can", "could", "do", "does", "for",
+    "from", "has", "have", "how", "i", "if", "in", "is", "it", "its", "of", "on", "or", "our", "should", "so",
+    "than", "that", "the", "their", "them", "there", "these", "they", "this", "those", "to", "us", "was", "we",
+    "what", "when", "where", "which", "who", "why", "will", "with", "would", "you", "your", "also", "same",
+}
+
+# Keywords of the earlier question added to a follow-up's retrieval query
+TOPIC_WORDS = 12
+
+_WORD = re.compile(r"[a-z0-9][a-z0-9'-]*")
+
+
+def content_words(text):
+    """
+    The words of a text that carry its topic, in order, without repeats.
+    """
+    return list(dict.fromkeys(word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS))
+
+
+def is_follow_up(query):
+    """
+    Decide whether a message leans on the previous question, like
+    "what about for backups?" or "is it reviewed yearly?".
+    """
+    text = query.strip().lower()
+    words = _WORD.findall(text)
+    return (
+        text.startswith(FOLLOW_UP_PREFIXES)
+        or (len(words) <= SHORT_MESSAGE_WORDS and any(word in ANAPHORA for word in words))
+        or len(content_words(text)) <= 1
+    )
+
+
+class ConversationContext:
+    """
+    Recent-history context for a chat turn.
+
+    A follow-up such as "what about for backups?" retrieves nothing useful
+    on its own, so the retrieval query gets the keywords of the last
+    standalone question in the thread appended. The recent turns are also
+    passed to the chat prompt as a history window, cut to a token budget
+    newest first, whole messages at a time, so the same thread always
+    gives the same window.
+
+    No LLM is involved, so building the context costs a keyword scan and
+    one indexed read. The last turns of each thread are kept in an LRU, so
+    the read only fetches the messages added since the previous turn; the
+    whole tail is read only on a cache miss. The `history_read` and
+    `condense` stages time both in `qna_stage_seconds`.
+    """
+
+    def __init__(self, history, turns=None, history_tokens=None, message_tokens=None, cache_size=None):
+        """
+        Initialize the ConversationContext.
+
+        Args:
+            history (ChatThreadManager): Store the messages are read from
+            turns (int, optional): Question/answer pairs looked back on
+            history_tokens (int, optional): Token budget of the history window
+            message_tokens (int, optional): Tokens kept of any one message
+            cache_size (int, optional): Threads whose recent turns are cached
+        """
+        self.history = history
+        self.turns = turns or settings.CONVERSATION_TURNS
+        self.history_tokens = settings.CONVERSATION_HISTORY_TOKENS if history_tokens is None else history_tokens
+        self.message_tokens = message_tokens or settings.CONVERSATION_MESSAGE_TOKENS
+        self.cache_size = settings.CONVERSATION_CACHE_SIZE if cache_size is None else cache_size
+
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def build(self, thread_id, query):
+        """
+        Assemble the retrieval query and prompt history for a new message.
+
+        Args:
+            thread_id (str): The user's active thread, or None
+            query (str): The new message, not yet added to the thread
+
+        Returns:
+            dict: `query` to retrieve with, `history` window for the prompt
+            ("" if none) and whether the message was read as a `follow_up`
+        """
+        if not thread_id:
+            return {"query": query, "history": "", "follow_up": False}
+
+        with span("history_read"):
+            messages, topic = self._recent_messages(thread_id)
+
+        with span("condense"):
+            follow_up = is_follow_up(query)
+            standalone = query
+            if follow_up and topic:
+                standalone = f"{query} {' '.join(topic[:TOPIC_WORDS])}"
+            window = self._window(messages)
+
+        return {"query": standalone, "history": window, "follow_up": follow_up}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "cached_threads": len(self._cache),
+                "cache_hits": self.cache_hits,
+                "cache_misses": self.cache_misses
+            }
+
+    def _recent_messages(self, thread_id):
+        limit = 2 * self.turns
+        with self._lock:
+            cached, topic = self._cache.get(thread_id, (None, []))
+            if cached is not None:
+                self._cache.move_to_end(thread_id)
+            if cached:
+                self.cache_hits += 1
+            else:
+                self.cache_misses += 1
+
+        if cached:
+            # Only the messages added since the last turn are read
+            page = self.history.get_message_page(thread_id, after=cached[-1]["id"], page_size=limit)
+            messages = None if page["has_more"] else (cached + page["messages"])[-limit:]
+        else:
+            messages = None
+        if messages is None:
+            messages = self.history.get_thread_messages(thread_id, limit=limit)
+
+        # A chain of follow-ups longer than the window keeps the topic of
+        # the question it started from
+        topic = self._topic(messages) or topic
+
+        if self.cache_size:
+            with self._lock:
+                self._cache[thread_id] = (messages, topic)
+                self._cache.move_to_end(thread_id)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return messages, topic
+
+    @staticmethod
+    def _topic(messages):
+        # The most recent user question that stands on its own
+        for message in reversed(messages):
+            if message["role"] == "user" and not is_follow_up(message["content"]):
+                return content_words(message["content"])
+        return []
+
+    def _window(self, messages):
+        lines = []
+        used = 0
+        for message in reversed(messages):
+            speaker = "User" if message["role"] == "user" else "Assistant"
+            line = f"{speaker}: {clip_tokens(message['content'], self.message_tokens)}"
+            cost = estimate_tokens(line)
+            if used + cost > self.history_tokens:
+                break
+            lines.append(line)
+            used += cost
+        return "\n".join(reversed(lines))
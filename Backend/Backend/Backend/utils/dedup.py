@@ -0,0 +1,151 @@
+import re
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+
+
+def normalize_question(question):
+    """
+    Reduce a question to the text that decides whether two rows repeat it:
+    lower case, punctuation dropped, whitespace collapsed.
+    """
+    return " ".join(re.sub(r"[\W_]+", " ", question.lower()).split())
+
+
+class QuestionDeduplicator:
+    """
+    Groups the repeated questions of one questionnaire upload.
+
+    Questionnaires such as SIG and CAIQ ask the same thing in several
+    sections. Rows whose normalized text matches, or whose embeddings are
+    at least QUESTIONNAIRE_DEDUP_SIMILARITY apart in cosine similarity,
+    join the cluster of the first such row. Retrieval and generation run
+    once per cluster and the answer is copied to every member.
+
+    Uploads are answered in chunks, so the deduplicator lives for the whole
+    upload and remembers the `max_results` most recently used clusters for
+    the chunks after them: their texts, their leader vectors (in a fixed
+    matrix of `max_results` rows) and their answers. Memory and the
+    per-row similarity scan therefore stay bounded however long the upload
+    is streamed. A repeat of a forgotten cluster starts a new one and is
+    answered again, usually from the answer cache.
+    """
+
+    def __init__(self, enabled=None, similarity=None, max_results=None):
+        """
+        Initialize the QuestionDeduplicator.
+
+        Args:
+            enabled (bool, optional): Cluster rows at all; when off every row
+                is its own cluster
+            similarity (float, optional): Cosine similarity at which two
+                questions count as the same; None clusters on text only
+            max_results (int, optional): Clusters remembered at most
+        """
+        self.enabled = settings.QUESTIONNAIRE_DEDUP if enabled is None else enabled
+        self.similarity = settings.QUESTIONNAIRE_DEDUP_SIMILARITY if similarity is None else similarity
+        self.max_results = max_results or settings.QUESTIONNAIRE_DEDUP_RESULTS
+
+        self._by_text = {}
+        # Remembered clusters, least recently used first: cluster -> its
+        # normalized texts and leader slot
+        self._live = OrderedDict()
+        self._results = {}
+        # Unit vectors of the cluster leaders, one slot per live cluster;
+        # _slot_clusters[slot] is the slot's cluster, or -1 if it is free
+        self._leaders = None
+        self._slot_clusters = None
+        self._free_slots = []
+        self._clusters = 0
+        self.deduplicated = 0
+
+    def assign(self, questions, vectors):
+        """
+        Put each question of a chunk into a cluster.
+
+        Args:
+            questions (list): Question per row
+            vectors (numpy.ndarray): Query embedding per row
+
+        Returns:
+            list: Cluster id per row
+        """
+        clusters = []
+        for question, vector in zip(questions, vectors):
+            if not self.enabled:
+                clusters.append(self._new_cluster(None, None))
+                continue
+
+            text = normalize_question(question)
+            cluster = self._by_text.get(text)
+            if cluster is None and self.similarity is not None:
+                cluster = self._nearest(vector)
+            if cluster is None:
+                cluster = self._new_cluster(text, vector)
+            else:
+                if text not in self._by_text:
+                    self._by_text[text] = cluster
+                    self._live[cluster]["texts"].append(text)
+                self._live.move_to_end(cluster)
+            clusters.append(cluster)
+        return clusters
+
+    def result(self, cluster):
+        """
+        Get the answer of a cluster answered in an earlier chunk, if it is
+        still remembered.
+        """
+        result = self._results.get(cluster)
+        if result is not None:
+            self._live.move_to_end(cluster)
+        return result
+
+    def remember(self, cluster, result):
+        """
+        Keep a cluster's answer for its members in later chunks.
+        """
+        if cluster in self._live:
+            self._results[cluster] = result
+            self._live.move_to_end(cluster)
+
+    def _nearest(self, vector):
+        if not self._live:
+            return None
+        unit = vector / (np.linalg.norm(vector) or 1.0)
+        similarities = self._leaders @ unit
+        similarities[self._slot_clusters < 0] = -np.inf
+        best = int(np.argmax(similarities))
+        return int(self._slot_clusters[best]) if similarities[best] >= self.similarity else None
+
+    def _new_cluster(self, text, vector):
+        cluster = self._clusters
+        self._clusters += 1
+        if text is None:
+            return cluster
+
+        if len(self._live) >= self.max_results:
+            self._forget(next(iter(self._live)))
+
+        slot = None
+        if self.similarity is not None:
+            if self._leaders is None:
+                self._leaders = np.zeros((self.max_results, len(vector)), dtype=np.float32)
+                self._slot_clusters = np.full(self.max_results, -1, dtype=np.int64)
+                self._free_slots = list(range(self.max_results - 1, -1, -1))
+            slot = self._free_slots.pop()
+            self._leaders[slot] = vector / (np.linalg.norm(vector) or 1.0)
+            self._slot_clusters[slot] = cluster
+
+        self._by_text[text] = cluster
+        self._live[cluster] = {"texts": [text], "slot": slot}
+        return cluster
+
+    def _forget(self, cluster):
+        entry = self._live.pop(cluster)
+        for text in entry["texts"]:
+            del self._by_text[text]
+        self._results.pop(cluster, None)
+        if entry["slot"] is not None:
+            self._slot_clusters[entry["slot"]] = -1
+            self._free_slots.append(entry["slot"])
@@ -0,0 +1,149 @@
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+DOCSTORE_NAME = "docstore.bin"
+
+MAGIC = b"IQADOC01"
+_PREFIX = struct.Struct("<8sQQ")
+_ALIGNMENT = 8
+
+# Cells of these columns are stored as raw UTF-8; metadata cells as JSON
+# so numbers, NaN and None keep their type. An empty cell means the
+# document has no value for that metadata key.
+_TEXT_COLUMNS = ("id", "page_content")
+_META_PREFIX = "meta."
+
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % _ALIGNMENT))
+
+
+def write_docstore(path, ids, texts, metadatas):
+    """
+    Write documents in the columnar docstore format.
+
+    Layout: a fixed prefix (magic, header position, header length), then
+    for every column an int64 offset table of n + 1 entries followed by the
+    heap of concatenated cell bytes, and finally a JSON header describing
+    the columns. Row i of a column is heap[offsets[i]:offsets[i + 1]].
+
+    Args:
+        path (str): Output file
+        ids (list): Stable document ids, in FAISS index order
+        texts (list): Document page contents
+        metadatas (list): Metadata dict per document
+    """
+    rows = len(ids)
+    columns = {"id": [str(i).encode('utf-8') for i in ids],
+               "page_content": [str(t).encode('utf-8') for t in texts]}
+    for key in sorted({key for metadata in metadatas for key in metadata}):
+        columns[_META_PREFIX + key] = [
+            json.dumps(metadata[key], default=str).encode('utf-8') if key in metadata else b""
+            for metadata in metadatas
+        ]
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, 0, 0))
+        _pad(f)
+
+        header = {"rows": rows, "columns": []}
+        for name, cells in columns.items():
+            offsets = np.zeros(rows + 1, dtype="<i8")
+            np.cumsum([len(cell) for cell in cells], dtype="<i8", out=offsets[1:])
+
+            offsets_pos = f.tell()
+            f.write(offsets.tobytes())
+            heap_pos = f.tell()
+            for cell in cells:
+                f.write(cell)
+            _pad(f)
+
+            header["columns"].append({"name": name, "offsets": offsets_pos, "heap": heap_pos})
+
+        header_pos = f.tell()
+        header_bytes = json.dumps(header).encode('utf-8')
+        f.write(header_bytes)
+        f.seek(0)
+        f.write(_PREFIX.pack(MAGIC, header_pos, len(header_bytes)))
+
+    os.replace(tmp_path, path)
+
+
+class MmapDocstore(Docstore):
+    """
+    Read-only, memory-mapped docstore for the FAISS wrapper.
+
+    Opening the file only maps it and parses the small JSON header; offset
+    tables are numpy views over the mapping and cells are decoded only for
+    the rows a search returns. The mapping is read-only and backed by the
+    OS page cache, so several worker processes serving the same index
+    share one physical copy of it.
+
+    Documents are addressed by their row number, which equals their
+    position in the FAISS index.
+    """
+
+    def __init__(self, path):
+        """
+        Map a docstore file written by `write_docstore`.
+
+        Args:
+            path (str): Path to the docstore file
+        """
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, header_pos, header_size = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a docstore file")
+        header = json.loads(self._mmap[header_pos:header_pos + header_size])
+
+        self.rows = header["rows"]
+        self._columns = []
+        for column in header["columns"]:
+            offsets = np.frombuffer(self._mmap, dtype="<i8", count=self.rows + 1, offset=column["offsets"])
+            self._columns.append((column["name"], offsets, column["heap"]))
+
+    def __len__(self):
+        return self.rows
+
+    def document(self, row):
+        """
+        Decode one row into a Document.
+
+        Args:
+            row (int): Row number (FAISS index position)
+
+        Returns:
+            Document: The stored document
+        """
+        values = {}
+        metadata = {}
+        for name, offsets, heap in self._columns:
+            start, end = heap + int(offsets[row]), heap + int(offsets[row + 1])
+            if name in _TEXT_COLUMNS:
+                values[name] = self._mmap[start:end].decode('utf-8')
+            elif end > start:
+                metadata[name[len(_META_PREFIX):]] = json.loads(self._mmap[start:end])
+        return Document(id=values["id"], page_content=values["page_content"], metadata=metadata)
+
+    def search(self, search):
+        """
+        Look up a document by row number, as the FAISS wrapper does.
+        """
+        row = int(search)
+        if not 0 <= row < self.rows:
+            return f"ID {search} not found."
+        return self.document(row)
+
+    def __iter__(self):
+        for row in range(self.rows):
+            yield self.document(row)
@@ -0,0 +1,159 @@
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from django.conf import settings
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_BACKENDS = ("torch", "onnx")
+
+
+def embedding_signature(model_name=None, backend=None, onnx_file=None):
+    """
+    Identify the vectors an encoder configuration produces.
+
+    Indexes and caches record this value, so switching to the quantized
+    ONNX model is noticed like switching models. The plain PyTorch model
+    keeps the bare model name that older manifests recorded.
+    """
+    model_name = model_name or settings.EMBEDDING_MODEL_NAME
+    backend = backend or settings.EMBEDDING_BACKEND
+    if backend == "onnx":
+        return f"{model_name}#onnx:{onnx_file or settings.EMBEDDING_ONNX_FILE}"
+    return model_name
+
+
+class EmbeddingService(Embeddings):
+    """
+    Local sentence-transformers encoder shared by retrieval and indexing.
+
+    Encodes exactly like LangChain's HuggingFaceEmbeddings (newlines become
+    spaces, no normalization), so vectors match indexes built with it. On
+    top of that it caches query vectors in an LRU, so a question asked
+    again - or searched against both stores - is encoded once, and it can
+    run the model through ONNX Runtime, typically with an int8-quantized
+    export, which is several times faster on CPU. Check a backend against
+    the stored index vectors with `manage.py check_embeddings` first.
+    """
+
+    def __init__(self, model_name=None, backend=None, onnx_file=None, threads=None, cache_size=None, batch_size=None):
+        """
+        Initialize the EmbeddingService and load the model.
+
+        Args:
+            model_name (str, optional): HuggingFace model name
+            backend (str, optional): "torch" or "onnx"
+            onnx_file (str, optional): ONNX file inside the model repository
+            threads (int, optional): CPU threads used by the encoder
+            cache_size (int, optional): Query vectors kept in the LRU cache
+            batch_size (int, optional): Texts encoded per forward pass
+        """
+        self.model_name = model_name or settings.EMBEDDING_MODEL_NAME
+        self.backend = backend or settings.EMBEDDING_BACKEND
+        self.onnx_file = onnx_file or settings.EMBEDDING_ONNX_FILE
+        self.threads = threads or settings.EMBEDDING_THREADS
+        self.cache_size = settings.EMBEDDING_CACHE_SIZE if cache_size is None else cache_size
+        self.batch_size = batch_size or settings.RETRIEVAL_BATCH_SIZE
+        if self.backend not in EMBEDDING_BACKENDS:
+            raise ValueError(f"Unknown embedding backend {self.backend!r}; expected one of {', '.join(EMBEDDING_BACKENDS)}")
+
+        self.signature = embedding_signature(self.model_name, self.backend, self.onnx_file)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self._model = self._load_model()
+
+    def encode(self, texts, batch_size=None):
+        """
+        Encode texts without caching, as for documents being indexed.
+
+        Args:
+            texts (list): Texts to encode
+            batch_size (int, optional): Texts per forward pass
+
+        Returns:
+            numpy.ndarray: float32 matrix of shape (len(texts), dim)
+        """
+        texts = [text.replace("\n", " ") for text in texts]
+        vectors = self._model.encode(
+            texts, batch_size=batch_size or self.batch_size, convert_to_numpy=True, show_progress_bar=False
+        )
+        return np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+
+    def encode_queries(self, queries, batch_size=None):
+        """
+        Encode queries, reusing cached vectors and encoding the rest in batches.
+
+        Args:
+            queries (list): Query strings
+            batch_size (int, optional): Queries per forward pass
+
+        Returns:
+            numpy.ndarray: float32 matrix of shape (len(queries), dim)
+        """
+        found = {}
+        with self._cache_lock:
+            for query in queries:
+                if query in self._cache:
+                    self._cache.move_to_end(query)
+                    found[query] = self._cache[query]
+        self.cache_hits += sum(1 for query in queries if query in found)
+
+        # Duplicates within one batch are encoded once
+        missing = list(dict.fromkeys(query for query in queries if query not in found))
+        self.cache_misses += len(missing)
+        if missing:
+            vectors = self.encode(missing, batch_size)
+            with self._cache_lock:
+                for query, vector in zip(missing, vectors):
+                    found[query] = vector
+                    if self.cache_size:
+                        self._cache[query] = vector
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if not queries:
+            return np.zeros((0, 0), dtype=np.float32)
+        return np.stack([found[query] for query in queries])
+
+    def embed_documents(self, texts):
+        return self.encode(list(texts)).tolist()
+
+    def embed_query(self, text):
+        return self.encode_queries([text])[0].tolist()
+
+    def clear_cache(self):
+        with self._cache_lock:
+            self._cache.clear()
+
+    def stats(self):
+        return {
+            "model": self.signature,
+            "threads": self.threads,
+            "cached_queries": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses
+        }
+
+    def _load_model(self):
+        from sentence_transformers import SentenceTransformer
+
+        if self.backend == "torch":
+            if self.threads:
+                import torch
+                torch.set_num_threads(self.threads)
+            return SentenceTransformer(self.model_name, device="cpu")
+
+        model_kwargs = {"file_name": self.onnx_file, "provider": "CPUExecutionProvider"}
+        if self.threads:
+            import onnxruntime
+            session_options = onnxruntime.SessionOptions()
+            session_options.intra_op_num_threads = self.threads
+            model_kwargs["session_options"] = session_options
+        logger.info("Loading %s through ONNX Runtime (%s)", self.model_name, self.onnx_file)
+        return SentenceTransformer(self.model_name, device="cpu", backend="onnx", model_kwargs=model_kwargs)
@@ -0,0 +1,101 @@
+import csv
+import os
+import uuid
+
+import openpyxl
+
+from .questionnaire import iter_table, question_columns, row_question
+
+ANSWER_COLUMNS = ("Suggested Answer", "Confidence", "References")
+
+EXPORT_CONTENT_TYPES = {
+    ".csv": "text/csv",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+
+def export_name(file_name):
+    """
+    Name of the answered copy of an uploaded questionnaire.
+
+    CSV uploads stay CSV; Excel uploads, including legacy .xls files that
+    openpyxl cannot write, come back as .xlsx.
+    """
+    base, ext = os.path.splitext(os.path.basename(file_name))
+    return f"{base}_answered{'.csv' if ext.lower() == '.csv' else '.xlsx'}"
+
+
+def write_answered_questionnaire(upload_path, file_name, results, output_path):
+    """
+    Write the uploaded questionnaire back with the answers filled in.
+
+    Every original row (blank CSV lines included) and column is kept, and
+    the answer columns are added to the questions sheet. Rows are streamed
+    from the upload and written as they are read - CSV line by line, Excel
+    through openpyxl's write-only mode - so the questionnaire is never
+    fully in memory. Other worksheets of a workbook are copied as values.
+
+    Args:
+        upload_path (str): Path of the uploaded file
+        file_name (str): Original file name, used to pick the format
+        results: Iterable of result rows (`format_result` output), one per
+            non-empty question in file order
+        output_path (str): Path to write the answered questionnaire to
+    """
+    results = iter(results)
+    tmp_path = f"{output_path}.{uuid.uuid4().hex}.tmp"
+
+    if file_name.lower().endswith('.csv'):
+        # A plain reader, unlike iter_table, keeps the blank lines, so the
+        # copy has every line of the upload in place
+        with open(upload_path, 'r', encoding='utf-8-sig', newline='') as upload, \
+                open(tmp_path, 'w', encoding='utf-8', newline='') as out:
+            writer = csv.writer(out)
+            for row in _answered_rows(csv.reader(upload), results):
+                writer.writerow(row)
+    else:
+        workbook = openpyxl.Workbook(write_only=True)
+        with open(upload_path, 'rb') as upload:
+            if file_name.lower().endswith('.xlsx'):
+                source = openpyxl.load_workbook(upload, read_only=True, data_only=True)
+                try:
+                    for i, sheet in enumerate(source.worksheets):
+                        rows = sheet.iter_rows(values_only=True)
+                        out = workbook.create_sheet(title=sheet.title)
+                        for row in _answered_rows(rows, results) if i == 0 else rows:
+                            out.append(row)
+                finally:
+                    source.close()
+            else:
+                out = workbook.create_sheet()
+                for row in _answered_rows(iter_table(upload, file_name), results):
+                    out.append(row)
+        workbook.save(tmp_path)
+
+    os.replace(tmp_path, output_path)
+
+
+def _answered_rows(table, results):
+    header = list(next(table, []))
+    question_col, _ = question_columns(header)
+    width = len(header)
+    yield header + list(ANSWER_COLUMNS)
+
+    # Results come one per question row, so each is attached to the next
+    # row that has a question
+    for row in table:
+        row = list(row)
+        if not row:
+            yield row
+            continue
+        # Pad short rows so the answers line up under their headers
+        row += [None] * (width - len(row))
+        if row_question(row, question_col) is None:
+            yield row + [None] * len(ANSWER_COLUMNS)
+            continue
+        result = next(results)
+        yield row + [
+            result["suggestedAnswer"],
+            result["confidence_score"],
+            "; ".join(str(reference) for reference in result["references"])
+        ]
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Words the fake model answers with, picked deterministically per prompt
+_VOCABULARY = (
+    "access", "audit", "backup", "control", "data", "encryption", "incident", "key", "log", "monitoring",
+    "network", "password", "policy", "review", "risk", "security", "system", "training", "user", "vendor",
+)
+
+
+class FakeOllamaServer:
+    """
+    Local stand-in for the Ollama HTTP API, for offline benchmarks.
+
+    Answers /api/chat and /api/generate like Ollama does, streamed as
+    NDJSON or as one JSON object, with a fixed number of tokens. The words
+    depend only on the prompt, so a benchmark run is reproducible, and the
+    latency is set per token plus a time to the first token, so LLM cost
+    can be modelled without a GPU. Requests are served on their own
+    threads, like a model server with unlimited parallelism; the app's
+    LLM_MAX_CONCURRENCY still applies on the client side.
+
+    Use as a context manager:
+
+        with FakeOllamaServer(token_latency=0.02) as server:
+            settings.OLLAMA_BASE_URL = server.url
+    """
+
+    def __init__(self, tokens=32, token_latency=0.02, first_token_latency=0.1, host="127.0.0.1", port=0):
+        """
+        Initialize the FakeOllamaServer. It starts listening on `start()`.
+
+        Args:
+            tokens (int): Tokens per answer
+            token_latency (float): Seconds between tokens
+            first_token_latency (float): Seconds before the first token
+            host (str): Interface to bind
+            port (int): Port to bind; 0 picks a free one
+        """
+        self.tokens = tokens
+        self.token_latency = token_latency
+        self.first_token_latency = first_token_latency
+        self.host = host
+        self.port = port
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    def start(self):
+        self._server = ThreadingHTTPServer((self.host, self.port), self._handler())
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def answer(self, prompt):
+        """
+        The tokens the fake model answers a prompt with.
+
+        Args:
+            prompt (str): Prompt text
+
+        Returns:
+            list: Token strings, each ending in a space
+        """
+        seed = hashlib.sha1(prompt.encode('utf-8')).digest()
+        return [_VOCABULARY[seed[i % len(seed)] % len(_VOCABULARY)] + " " for i in range(self.tokens)]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                if self.path.rstrip("/") in ("/api/tags", "/api/version", ""):
+                    self._send_json({"models": [], "version": "fake"})
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                if self.path not in ("/api/chat", "/api/generate"):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b"{}")
+                with server._lock:
+                    server.requests += 1
+
+                chat = self.path == "/api/chat"
+                prompt = json.dumps(body.get("messages")) if chat else body.get("prompt", "")
+                tokens = server.answer(prompt)
+                model = body.get("model", "fake")
+
+                def chunk(text, done):
+                    payload = {"model": model, "created_at": "1970-01-01T00:00:00Z", "done": done}
+                    if chat:
+                        payload["message"] = {"role": "assistant", "content": text}
+                    else:
+                        payload["response"] = text
+                    if done:
+                        payload["done_reason"] = "stop"
+                        payload["eval_count"] = len(tokens)
+                    return payload
+
+                time.sleep(server.first_token_latency)
+                if not body.get("stream", True):
+                    time.sleep(server.token_latency * (len(tokens) - 1))
+                    self._send_json(chunk("".join(tokens), True))
+                    return
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/x-ndjson')
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(server.token_latency)
+                    self._write_chunk(json.dumps(chunk(token, False)) + "\n")
+                self._write_chunk(json.dumps(chunk("", True)) + "\n")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+            def _send_json(self, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, text):
+                data = text.encode('utf-8')
+                self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
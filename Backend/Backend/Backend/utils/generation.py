@@ -0,0 +1,340 @@
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from langchain_community.chat_models import ChatOllama
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from .generation_cache import get_generation_cache
+from .metrics import span
+
+logger = logging.getLogger(__name__)
+
+
+CHAT_PROMPT = ChatPromptTemplate.from_template("""
+                    You are an InfoSec QA assistant. Answer security and compliance questions using only the provided context.
+                    For each response:
+                    - Ensure that the context is in a readable format if it is not already.
+                    - Do not change, add, or remove any words from the context. Preserve its original meaning exactly.
+
+                    Response style:
+                    [your refined response with context preserved]
+
+                    Only output the refined answer in natural language. Do not include any labels, brackets, or metadata in your response.
+                    Use the conversation so far only to understand what the question refers to.
+                    Conversation so far:
+                    {history}
+                    Context:
+                    {context}
+                    Question:
+                    {query}
+                    """)
+
+QUESTIONNAIRE_PROMPT = ChatPromptTemplate.from_template("""
+            You are an InfoSec QA assistant. Answer security and compliance questions using only the provided context.
+            For each response:
+            - Ensure that the context is in a readable format if it is not already.
+            - Do not change, add, or remove any words from the context. Preserve its original meaning exactly.
+
+            Only output the refined answer in natural language. Do not include any labels, brackets, or metadata in your response.
+
+            Response style:
+            [your refined response with context preserved]
+
+            Context:
+            {context}
+            Question:
+            {query}
+            """)
+
+
+class GenerationError(RuntimeError):
+    """
+    Raised when a prompt could not be answered within its retries.
+    """
+
+
+class GenerationClient:
+    """
+    Shared Ollama client with bounded parallelism.
+
+    One ChatOllama instance and one chain per prompt template are reused for
+    every call, and the model is kept resident between calls. A semaphore
+    caps the number of generations in flight across the whole process, so
+    batch fan-out and chat requests share the same limit.
+
+    Every call has its own deadline and retry budget: a row that stalls is
+    abandoned and retried (or failed) without holding up the rows around it.
+
+    With a GenerationCache, calls that pass the retrieved `chunks` their
+    context was built from are answered from the cache when the same
+    chunks, question, prompt and model were generated before. A stale entry
+    is returned at once and regenerated in the background.
+    """
+
+    def __init__(self, model=None, base_url=None, max_concurrency=None, timeout=None, max_retries=None, cache=None):
+        """
+        Initialize the GenerationClient.
+
+        Args:
+            model (str, optional): Ollama model name
+            base_url (str, optional): Ollama server URL
+            max_concurrency (int, optional): Generations allowed in flight at once
+            timeout (float, optional): Seconds allowed for a single attempt
+            max_retries (int, optional): Extra attempts after a failed one
+            cache (GenerationCache, optional): Cache of earlier generations
+        """
+        self.model = model or settings.OLLAMA_MODEL
+        self.cache = cache
+        self.max_concurrency = max_concurrency or settings.LLM_MAX_CONCURRENCY
+        self.timeout = timeout or settings.LLM_TIMEOUT_SECONDS
+        self.max_retries = settings.LLM_MAX_RETRIES if max_retries is None else max_retries
+
+        self.llm = ChatOllama(
+            model=self.model,
+            base_url=base_url or settings.OLLAMA_BASE_URL,
+            timeout=self.timeout,
+            keep_alive=settings.OLLAMA_KEEP_ALIVE
+        )
+        self._parser = StrOutputParser()
+        self._chains = {}
+        self._chains_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="llm")
+        # Stale entries are regenerated apart from the request rows, which
+        # should never queue behind a refresh
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix="llm-refresh")
+
+    def chain_for(self, prompt):
+        """
+        Get the reusable prompt | llm | parser chain for a prompt template.
+        """
+        key = id(prompt)
+        chain = self._chains.get(key)
+        if chain is None:
+            with self._chains_lock:
+                chain = self._chains.setdefault(key, prompt | self.llm | self._parser)
+        return chain
+
+    def generate(self, prompt, inputs, chunks=None):
+        """
+        Answer one prompt, retrying on failure.
+
+        Args:
+            prompt (ChatPromptTemplate): Prompt template
+            inputs (dict): Template variables
+            chunks (list, optional): `chunk_ids` of the retrieved context;
+                the cache is only used when they are given
+
+        Returns:
+            str: Generated text
+        """
+        key = self._cache_key(prompt, inputs, chunks)
+        if key is not None:
+            text = self._cached(key, prompt, inputs)
+            if text is not None:
+                return text
+
+        started = time.perf_counter()
+        text = self._generate(prompt, inputs)
+        if key is not None:
+            self.cache.put(key, self.model, text, time.perf_counter() - started)
+        return text
+
+    def _generate(self, prompt, inputs):
+        chain = self.chain_for(prompt)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    return self._generate_once(chain, inputs)
+            except Exception as e:
+                last_error = e
+                logger.warning("Generation attempt %d/%d failed: %s", attempt + 1, self.max_retries + 1, e)
+                if attempt < self.max_retries:
+                    time.sleep(settings.LLM_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+        raise GenerationError(f"Generation failed after {self.max_retries + 1} attempt(s): {last_error}") from last_error
+
+    def imap(self, prompt, inputs_list, chunks_list=None):
+        """
+        Answer many prompts in parallel, returning results in input order.
+
+        All rows are queued immediately; failed rows come back as a
+        GenerationError instead of raising, so a caller can keep going with
+        the rest of the batch.
+
+        Args:
+            prompt (ChatPromptTemplate): Prompt template shared by all rows
+            inputs_list (list): Template variables, one dict per row
+            chunks_list (list, optional): `chunk_ids` per row, for the cache
+
+        Returns:
+            iterator: str or GenerationError per input, in input order
+        """
+        chunks_list = chunks_list or [None] * len(inputs_list)
+        # Each row runs in the calling request's context, so its log
+        # records keep the request's trace id
+        futures = [
+            self._executor.submit(contextvars.copy_context().run, self.generate, prompt, inputs, chunks)
+            for inputs, chunks in zip(inputs_list, chunks_list)
+        ]
+        return self._collect(futures)
+
+    def generate_many(self, prompt, inputs_list, chunks_list=None):
+        """
+        Answer many prompts in parallel.
+
+        Returns:
+            list: str or GenerationError per input, in input order
+        """
+        return list(self.imap(prompt, inputs_list, chunks_list))
+
+    async def astream(self, prompt, inputs, chunks=None):
+        """
+        Stream one answer token by token, for async views.
+
+        Shares the concurrency limit with `generate`. A failed attempt is
+        retried only while nothing has been yielded yet; once tokens have
+        reached the caller a failure raises GenerationError. A cached answer
+        is yielded as a single chunk.
+
+        Args:
+            prompt (ChatPromptTemplate): Prompt template
+            inputs (dict): Template variables
+            chunks (list, optional): `chunk_ids` of the retrieved context;
+                the cache is only used when they are given
+
+        Yields:
+            str: Generated text chunks
+        """
+        key = self._cache_key(prompt, inputs, chunks)
+        if key is not None:
+            text = await asyncio.to_thread(self._cached, key, prompt, inputs)
+            if text is not None:
+                yield text
+                return
+
+        chain = self.chain_for(prompt)
+        last_error = None
+
+        for attempt in range(self.max_retries + 1):
+            started = False
+            parts = []
+            await self._acquire_slot()
+            try:
+                deadline = time.monotonic() + self.timeout
+                generation_started = time.perf_counter()
+                with span("llm"):
+                    async for chunk in chain.astream(inputs):
+                        started = True
+                        parts.append(chunk)
+                        yield chunk
+                        if time.monotonic() > deadline:
+                            raise TimeoutError(f"Generation exceeded {self.timeout}s")
+                if key is not None:
+                    await asyncio.to_thread(
+                        self.cache.put, key, self.model, "".join(parts), time.perf_counter() - generation_started
+                    )
+                return
+            except Exception as e:
+                if started:
+                    raise GenerationError(f"Generation failed mid-stream: {e}") from e
+                last_error = e
+                logger.warning("Generation attempt %d/%d failed: %s", attempt + 1, self.max_retries + 1, e)
+            finally:
+                self._slots.release()
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(settings.LLM_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+        raise GenerationError(f"Generation failed after {self.max_retries + 1} attempt(s): {last_error}") from last_error
+
+    async def _acquire_slot(self):
+        # Wait on the semaphore in a worker thread so the event loop keeps
+        # running; if the caller goes away meanwhile, give the slot back
+        # as soon as the thread gets it.
+        acquire = asyncio.ensure_future(asyncio.to_thread(self._slots.acquire))
+        try:
+            await asyncio.shield(acquire)
+        except asyncio.CancelledError:
+            acquire.add_done_callback(lambda _: self._slots.release())
+            raise
+
+    def _cache_key(self, prompt, inputs, chunks):
+        if self.cache is None or chunks is None:
+            return None
+        return self.cache.key(self.model, prompt, chunks, inputs)
+
+    def _cached(self, key, prompt, inputs):
+        text, state = self.cache.get(key)
+        if state == "stale" and self.cache.begin_refresh(key):
+            self._refresher.submit(contextvars.copy_context().run, self._refresh, key, prompt, inputs)
+        return text
+
+    def _refresh(self, key, prompt, inputs):
+        try:
+            started = time.perf_counter()
+            text = self._generate(prompt, inputs)
+            self.cache.put(key, self.model, text, time.perf_counter() - started)
+        except GenerationError as e:
+            logger.warning("Could not refresh stale generation: %s", e)
+        finally:
+            self.cache.end_refresh(key)
+
+    def _collect(self, futures):
+        try:
+            for future in futures:
+                try:
+                    yield future.result()
+                except GenerationError as e:
+                    yield e
+                except Exception as e:
+                    # Anything else (a failed cache read, a cancelled future)
+                    # also fails only its own row
+                    logger.exception("Generation failed")
+                    error = GenerationError(f"Generation failed: {e}")
+                    error.__cause__ = e
+                    yield error
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def _generate_once(self, chain, inputs):
+        # Stream so the per-attempt deadline is checked while tokens arrive
+        # instead of only after the whole answer has been produced.
+        deadline = time.monotonic() + self.timeout
+        parts = []
+        with span("llm"):
+            for chunk in chain.stream(inputs):
+                parts.append(chunk)
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Generation exceeded {self.timeout}s")
+        return "".join(parts)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_generation_client():
+    """
+    Get the process-wide GenerationClient, creating it on first call.
+
+    Returns:
+        GenerationClient: The shared client
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = GenerationClient(
+                    cache=get_generation_cache() if settings.GENERATION_CACHE_ENABLED else None
+                )
+    return _client
@@ -0,0 +1,299 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+from .answer_cache import normalize_question
+from .metrics import GENERATION_CACHE, span
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS generations (
+    key TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    text TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL,
+    generation_seconds REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS generations_used ON generations (used_at);
+"""
+
+
+def chunk_ids(docs_with_scores):
+    """
+    Identify the retrieved chunks a prompt's context is built from.
+
+    Each chunk is named by its stable vector id plus a digest of its text:
+    the id of a chunk stays the same when its file is edited, the digest
+    does not. The list is sorted, so the same chunks retrieved in another
+    order share a cache entry.
+
+    Args:
+        docs_with_scores (list): Output of the hybrid retriever for a question
+
+    Returns:
+        list: Chunk identifiers
+    """
+    ids = []
+    for doc, _ in docs_with_scores:
+        digest = hashlib.sha1(doc.page_content.encode('utf-8')).hexdigest()[:16]
+        name = doc.id or f"{doc.metadata.get('file', '')}#{doc.metadata.get('chunk_index', '')}"
+        ids.append(f"{name}:{digest}")
+    return sorted(ids)
+
+
+def template_hash(prompt):
+    """
+    Digest of a prompt template's text, so editing a prompt retires the
+    answers generated with the old one.
+    """
+    return hashlib.sha256(prompt.pretty_repr().encode('utf-8')).hexdigest()[:16]
+
+
+class GenerationCache:
+    """
+    Disk-backed cache of LLM output for the PDF path.
+
+    An entry is keyed by the model, the prompt template, the retrieved
+    chunks and the normalized question, so a question that retrieves the
+    same chunks as an earlier one is answered without calling Ollama.
+    Entries live in one SQLite database in WAL mode, shared by every
+    worker process, and the least recently used ones are evicted once the
+    stored text exceeds `max_bytes`.
+
+    An entry is fresh for `ttl_seconds`. For `stale_seconds` after that it
+    is still returned, and the caller regenerates it in the background
+    (stale-while-revalidate); older entries count as misses.
+    """
+
+    def __init__(self, path=None, max_bytes=None, ttl_seconds=None, stale_seconds=None):
+        """
+        Initialize the GenerationCache.
+
+        Args:
+            path (str, optional): SQLite database file
+            max_bytes (int, optional): Stored text size beyond which entries
+                are evicted
+            ttl_seconds (float, optional): Age until which an entry is fresh
+            stale_seconds (float, optional): Extra age during which a stale
+                entry is served while it is regenerated; 0 disables
+        """
+        self.path = str(path or settings.GENERATION_CACHE_PATH)
+        self.max_bytes = max_bytes or settings.GENERATION_CACHE_MAX_BYTES
+        self.ttl_seconds = ttl_seconds or settings.GENERATION_CACHE_TTL_SECONDS
+        self.stale_seconds = settings.GENERATION_CACHE_STALE_SECONDS if stale_seconds is None else stale_seconds
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lookup_seconds = 0.0
+        self.seconds_saved = 0.0
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @staticmethod
+    def key(model, prompt, chunks, inputs):
+        """
+        Build the cache key of one generation.
+
+        Args:
+            model (str): Ollama model name
+            prompt (ChatPromptTemplate): Prompt template
+            chunks (list): `chunk_ids` of the retrieved context
+            inputs (dict): Template variables; `context` is covered by
+                `chunks`, any other non-empty variable besides `query`
+                (such as chat history) is part of the key
+
+        Returns:
+            str: Hex digest
+        """
+        extra = {name: value for name, value in inputs.items() if name not in ("query", "context") and value}
+        material = json.dumps(
+            [model, template_hash(prompt), sorted(chunks), normalize_question(inputs.get("query", "")), extra],
+            sort_keys=True, default=str
+        )
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """
+        Look up a generation.
+
+        Args:
+            key (str): Output of `key`
+
+        Returns:
+            tuple: (text, state) with state "fresh" or "stale", or
+            (None, "miss")
+        """
+        started = time.perf_counter()
+        row = None
+        state = "miss"
+        with span("generation_cache"):
+            try:
+                db = self._connection()
+                row = db.execute(
+                    "SELECT text, created_at, generation_seconds FROM generations WHERE key = ?", (key,)
+                ).fetchone()
+                now = time.time()
+                if row is not None:
+                    age = now - row[1]
+                    if age <= self.ttl_seconds:
+                        state = "fresh"
+                    elif age <= self.ttl_seconds + self.stale_seconds:
+                        state = "stale"
+                if state != "miss":
+                    db.execute("UPDATE generations SET used_at = ? WHERE key = ?", (now, key))
+            except sqlite3.Error as e:
+                # A locked or broken database only costs a generation
+                logger.warning("Could not read generation: %s", e)
+                state = "miss"
+
+        with self._lock:
+            self.lookup_seconds += time.perf_counter() - started
+            if state == "fresh":
+                self.hits += 1
+            elif state == "stale":
+                self.stale_hits += 1
+            else:
+                self.misses += 1
+            if state != "miss":
+                self.seconds_saved += row[2]
+        GENERATION_CACHE.inc(result=state)
+        return (row[0], state) if state != "miss" else (None, state)
+
+    def put(self, key, model, text, generation_seconds):
+        """
+        Store a generation and evict beyond the size budget.
+
+        Args:
+            key (str): Output of `key`
+            model (str): Ollama model name
+            text (str): Generated text
+            generation_seconds (float): How long generating it took
+        """
+        now = time.time()
+        size = len(text.encode('utf-8'))
+        try:
+            db = self._connection()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute(
+                    "INSERT OR REPLACE INTO generations VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, model, text, size, now, now, generation_seconds)
+                )
+                evicted = self._evict(db)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        except sqlite3.Error as e:
+            logger.warning("Could not store generation: %s", e)
+            return
+        if evicted:
+            with self._lock:
+                self.evictions += evicted
+            GENERATION_CACHE.inc(evicted, result="evicted")
+
+    def begin_refresh(self, key):
+        """
+        Claim the background refresh of a stale entry.
+
+        Returns:
+            bool: False if this process is already refreshing it
+        """
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def stats(self):
+        """
+        Get hit/miss counters, latency and the current size.
+
+        Returns:
+            dict: Cache statistics
+        """
+        entries, size = self._connection().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM generations").fetchone()
+        with self._lock:
+            lookups = self.hits + self.stale_hits + self.misses
+            return {
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "hit_rate": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "mean_lookup_ms": round(self.lookup_seconds / lookups * 1000, 3) if lookups else None,
+                # Generation time the hits would have taken, as measured
+                # when their entries were generated
+                "generation_seconds_saved": round(self.seconds_saved, 3)
+            }
+
+    def clear(self):
+        self._connection().execute("DELETE FROM generations")
+        with self._lock:
+            self.hits = self.stale_hits = self.misses = self.evictions = 0
+            self.lookup_seconds = self.seconds_saved = 0.0
+
+    def _evict(self, db):
+        # Least recently used first, until the stored text fits the budget
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM generations").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        evicted = []
+        for key, size in db.execute("SELECT key, size FROM generations ORDER BY used_at"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        db.executemany("DELETE FROM generations WHERE key = ?", evicted)
+        return len(evicted)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_generation_cache():
+    """
+    Get the process-wide GenerationCache, creating it on first call.
+
+    Returns:
+        GenerationCache: The shared cache
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = GenerationCache()
+    return _cache
@@ -1,36 +1,88 @@
 import csv
 import os
 import json
+import sqlite3
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 import uuid
 from django.conf import settings
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS threads (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    title TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS threads_user_updated ON threads (user_id, updated_at);
+CREATE TABLE IF NOT EXISTS messages (
+    thread_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    timestamp TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (thread_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS active_threads (
+    user_id TEXT PRIMARY KEY,
+    thread_id TEXT NOT NULL
+) WITHOUT ROWID;
+"""
+
+
 class ChatThreadManager:
     """
     A system for managing multiple chat threads, similar to ChatGPT/Claude interfaces.
     Each user can have multiple chat threads, and each thread contains a conversation history.
+
+    Threads and messages live in one SQLite database in WAL mode, so readers
+    never block the writer and every request appends a message with a
+    single indexed insert instead of rewriting a per-user JSON file. Each
+    thread keeps its own connection; writes run in short IMMEDIATE
+    transactions, so concurrent requests cannot lose each other's updates.
+
+    The active thread is stored per user as well, so any number of users,
+    request threads and worker processes can share one manager.
     """
     
-    def __init__(self, data_dir="Backend/utils/chat_data"):
+    def __init__(self, data_dir="Backend/utils/chat_data", db_name="history.sqlite3"):
         """
         Initialize the ChatThreadManager.
         
         Args:
             data_dir (str): Directory to store all chat data
+            db_name (str): File name of the SQLite database in `data_dir`
         """
         self.data_dir = os.path.join(settings.BASE_DIR, data_dir)
-        self.threads_dir = os.path.join(data_dir, "threads")
-        self.users_file = os.path.join(data_dir, "users.json")
-        self.active_thread = None
+        self.db_path = os.path.join(self.data_dir, db_name)
+        self._local = threading.local()
         
-        # Create necessary directories
+        # Create necessary directories and tables
         os.makedirs(self.data_dir, exist_ok=True)
-        os.makedirs(self.threads_dir, exist_ok=True)
-        
-        # Initialize users file if it doesn't exist
-        if not os.path.exists(self.users_file):
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump({}, f)
+        self._connection().executescript(_SCHEMA)
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        db = self._connection()
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            yield db
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        db.execute("COMMIT")
     
     def get_user_data(self, user_id):
         """
@@ -42,40 +94,29 @@ class ChatThreadManager:
         Returns:
             dict: User data including threads
         """
-        try:
-            
-            with open(self.users_file, 'r', encoding='utf-8') as f:
-                users = json.load(f)
-                
-            if user_id not in users:
-                users[user_id] = {
-                    "threads": []
-                }
-                with open(self.users_file, 'w', encoding='utf-8') as f:
-                    json.dump(users, f, indent=2)     
-            return users[user_id]
-        except Exception as e:
-            print(f"Error getting user data: {e}")
-            return {"threads": []}
+        return {"threads": self.get_threads(user_id)}
     
     def save_user_data(self, user_id, user_data):
         """
-        Save user data back to the users file.
+        Replace a user's thread list, as returned by `get_user_data`.
+
+        Threads missing from `user_data` are deleted with their messages.
         
         Args:
             user_id (str): User identifier
             user_data (dict): Updated user data
         """
-        try:
-            with open(self.users_file, 'r', encoding='utf-8') as f:
-                users = json.load(f)
-            
-            users[user_id] = user_data
-            
-            with open(self.users_file, 'w', encoding='utf-8') as f:
-                json.dump(users, f, indent=2)
-        except Exception as e:
-            print(f"Error saving user data: {e}")
+        threads = user_data.get("threads", [])
+        with self._transaction() as db:
+            kept = {thread["id"] for thread in threads}
+            for (thread_id,) in db.execute("SELECT id FROM threads WHERE user_id = ?", (user_id,)).fetchall():
+                if thread_id not in kept:
+                    self._delete(db, thread_id)
+            db.executemany(
+                "INSERT INTO threads (id, user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET title = excluded.title, updated_at = excluded.updated_at",
+                [(t["id"], user_id, t["title"], t["created_at"], t["updated_at"]) for t in threads]
+            )
     
     def create_thread(self, user_id, title="New Chat"):
         """
@@ -91,23 +132,13 @@ class ChatThreadManager:
         thread_id = str(uuid.uuid4())
         timestamp = datetime.now().isoformat()
         
-        # Create thread file
-        thread_file = os.path.join(self.threads_dir, f"{thread_id}.csv")
-        with open(thread_file, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=["timestamp", "role", "content"])
-            writer.writeheader()
+        with self._transaction() as db:
+            db.execute(
+                "INSERT INTO threads (id, user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (thread_id, user_id, title, timestamp, timestamp)
+            )
+            self._set_active(db, user_id, thread_id)
         
-        # Update user data
-        user_data = self.get_user_data(user_id)
-        user_data["threads"].append({
-            "id": thread_id,
-            "title": title,
-            "created_at": timestamp,
-            "updated_at": timestamp
-        })
-        self.save_user_data(user_id, user_data)
-        
-        self.active_thread = thread_id
         return thread_id
     
     def get_threads(self, user_id):
@@ -118,10 +149,30 @@ class ChatThreadManager:
             user_id (str): User identifier
             
         Returns:
-            list: List of thread objects
+            list: List of thread objects, oldest first
         """
-        user_data = self.get_user_data(user_id)
-        return user_data["threads"]
+        rows = self._connection().execute(
+            "SELECT id, title, created_at, updated_at FROM threads WHERE user_id = ? ORDER BY created_at, rowid",
+            (user_id,)
+        )
+        return [dict(row) for row in rows]
+    
+    def get_thread(self, user_id, thread_id):
+        """
+        Get one of a user's threads.
+        
+        Args:
+            user_id (str): User identifier
+            thread_id (str): Thread identifier
+            
+        Returns:
+            dict: The thread object, or None if the user has no such thread
+        """
+        row = self._connection().execute(
+            "SELECT id, title, created_at, updated_at FROM threads WHERE id = ? AND user_id = ?",
+            (thread_id, user_id)
+        ).fetchone()
+        return dict(row) if row else None
     
     def rename_thread(self, user_id, thread_id, new_title):
         """
@@ -132,15 +183,11 @@ class ChatThreadManager:
             thread_id (str): Thread identifier
             new_title (str): New title for the thread
         """
-        user_data = self.get_user_data(user_id)
-        
-        for thread in user_data["threads"]:
-            if thread["id"] == thread_id:
-                thread["title"] = new_title
-                thread["updated_at"] = datetime.now().isoformat()
-                break
-        
-        self.save_user_data(user_id, user_data)
+        with self._transaction() as db:
+            db.execute(
+                "UPDATE threads SET title = ?, updated_at = ? WHERE id = ? AND user_id = ?",
+                (new_title, datetime.now().isoformat(), thread_id, user_id)
+            )
     
     def delete_thread(self, user_id, thread_id):
         """
@@ -150,28 +197,48 @@ class ChatThreadManager:
             user_id (str): User identifier
             thread_id (str): Thread identifier
         """
-        user_data = self.get_user_data(user_id)
-        
-        # Remove thread from user data
-        user_data["threads"] = [t for t in user_data["threads"] if t["id"] != thread_id]
-        self.save_user_data(user_id, user_data)
-        
-        # Delete thread file
-        thread_file = os.path.join(self.threads_dir, f"{thread_id}.csv")
-        if os.path.exists(thread_file):
-            os.remove(thread_file)
-        
-        if self.active_thread == thread_id:
-            self.active_thread = None
+        with self._transaction() as db:
+            owned = db.execute("SELECT 1 FROM threads WHERE id = ? AND user_id = ?", (thread_id, user_id)).fetchone()
+            if owned:
+                self._delete(db, thread_id)
+
+    def _delete(self, db, thread_id):
+        db.execute("DELETE FROM messages WHERE thread_id = ?", (thread_id,))
+        db.execute("DELETE FROM active_threads WHERE thread_id = ?", (thread_id,))
+        db.execute("DELETE FROM threads WHERE id = ?", (thread_id,))
     
-    def select_thread(self, thread_id):
+    def select_thread(self, user_id, thread_id):
         """
-        Select a thread as active.
+        Select a thread as the user's active thread.
         
         Args:
+            user_id (str): User identifier
             thread_id (str): Thread identifier
         """
-        self.active_thread = thread_id
+        with self._transaction() as db:
+            self._set_active(db, user_id, thread_id)
+
+    def _set_active(self, db, user_id, thread_id):
+        db.execute(
+            "INSERT INTO active_threads (user_id, thread_id) VALUES (?, ?) "
+            "ON CONFLICT (user_id) DO UPDATE SET thread_id = excluded.thread_id",
+            (user_id, thread_id)
+        )
+
+    def get_active_thread(self, user_id):
+        """
+        Get the user's active thread.
+        
+        Args:
+            user_id (str): User identifier
+            
+        Returns:
+            str: Thread ID, or None if no thread is selected
+        """
+        row = self._connection().execute(
+            "SELECT thread_id FROM active_threads WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return row[0] if row else None
     
     def add_message(self, user_id, thread_id, role, content):
         """
@@ -184,32 +251,26 @@ class ChatThreadManager:
             content (str): Message content
         """
         timestamp = datetime.now().isoformat()
-        
-        # Add message to thread file
-        thread_file = os.path.join(self.threads_dir, f"{thread_id}.csv")
-        with open(thread_file, 'a', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=["timestamp", "role", "content"])
-            writer.writerow({
-                "timestamp": timestamp,
-                "role": role,
-                "content": content
-            })
-        
-        # Update thread last updated time
-        user_data = self.get_user_data(user_id)
-        for thread in user_data["threads"]:
-            if thread["id"] == thread_id:
-                thread["updated_at"] = timestamp
-                
-                # Update title with first few words of first message if still "New Chat"
-                if thread["title"] == "New Chat" and role == "user":
-                    words = content.split()[:3]
-                    if words:
-                        new_title = " ".join(words) + "..."
-                        thread["title"] = new_title
-                break
-        
-        self.save_user_data(user_id, user_data)
+
+        # Update title with first few words of first message if still "New Chat"
+        words = content.split()[:3] if role == "user" else []
+        new_title = " ".join(words) + "..." if words else None
+
+        with self._transaction() as db:
+            # The primary key makes finding the last seq an index lookup
+            (seq,) = db.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+            db.execute(
+                "INSERT INTO messages (thread_id, seq, timestamp, role, content) VALUES (?, ?, ?, ?, ?)",
+                (thread_id, seq, timestamp, role, content)
+            )
+            db.execute(
+                "UPDATE threads SET updated_at = ?, "
+                "title = CASE WHEN title = 'New Chat' AND ? IS NOT NULL THEN ? ELSE title END "
+                "WHERE id = ? AND user_id = ?",
+                (timestamp, new_title, new_title, thread_id, user_id)
+            )
     
     def get_thread_messages(self, thread_id, limit=None):
         """
@@ -222,17 +283,100 @@ class ChatThreadManager:
         Returns:
             list: List of message objects
         """
-        thread_file = os.path.join(self.threads_dir, f"{thread_id}.csv")
-        messages = []
+        db = self._connection()
+        if limit is None:
+            rows = db.execute(
+                "SELECT seq AS id, timestamp, role, content FROM messages WHERE thread_id = ? ORDER BY seq",
+                (thread_id,)
+            ).fetchall()
+        else:
+            rows = db.execute(
+                "SELECT seq AS id, timestamp, role, content FROM messages WHERE thread_id = ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (thread_id, limit)
+            ).fetchall()[::-1]
+        return [dict(row) for row in rows]
+
+    def get_message_page(self, thread_id, before=None, after=None, page_size=50):
+        """
+        Get one page of a thread's messages around a cursor.
+
+        Without a cursor this is the newest page. Message ids increase
+        within a thread, so `before` pages back towards older messages and
+        `after` forward to newer ones; either way only the requested rows
+        are read, through the (thread_id, seq) primary key.
         
-        if os.path.exists(thread_file):
-            with open(thread_file, 'r', newline='', encoding='utf-8') as f:
-                reader = csv.DictReader(f)
-                messages = list(reader)
+        Args:
+            thread_id (str): Thread identifier
+            before (int, optional): Return messages older than this id
+            after (int, optional): Return messages newer than this id
+            page_size (int): Maximum number of messages to return
+            
+        Returns:
+            dict: `messages` oldest first, and `has_more` telling whether
+            further messages exist in the paging direction
+        """
+        db = self._connection()
+        if after is not None:
+            rows = db.execute(
+                "SELECT seq AS id, timestamp, role, content FROM messages WHERE thread_id = ? AND seq > ? "
+                "ORDER BY seq LIMIT ?",
+                (thread_id, after, page_size + 1)
+            ).fetchall()
+            has_more = len(rows) > page_size
+            rows = rows[:page_size]
+        else:
+            rows = db.execute(
+                "SELECT seq AS id, timestamp, role, content FROM messages WHERE thread_id = ? AND seq < ? "
+                "ORDER BY seq DESC LIMIT ?",
+                (thread_id, before if before is not None else 2 ** 63 - 1, page_size + 1)
+            ).fetchall()
+            has_more = len(rows) > page_size
+            rows = rows[:page_size][::-1]
+        return {"messages": [dict(row) for row in rows], "has_more": has_more}
+
+    def import_legacy_data(self, legacy_dir, owner=None):
+        """
+        Copy threads from the old users.json + per-thread CSV layout.
+
+        Threads already in the database are skipped, so the import can be
+        re-run safely; the legacy files are left untouched.
         
-        if limit is not None and limit < len(messages):
-            return messages[-limit:]
-        return messages
+        Args:
+            legacy_dir (str): Directory holding users.json and threads/
+            owner (str, optional): User id that receives every imported
+                thread instead of the user id it was saved under
+            
+        Returns:
+            dict: Counts of imported and skipped threads and imported messages
+        """
+        with open(os.path.join(legacy_dir, "users.json"), 'r', encoding='utf-8') as f:
+            users = json.load(f)
+
+        summary = {"threads": 0, "messages": 0, "skipped_threads": 0}
+        for user_id, user_data in users.items():
+            for thread in user_data.get("threads", []):
+                thread_file = os.path.join(legacy_dir, "threads", f"{thread['id']}.csv")
+                messages = []
+                if os.path.exists(thread_file):
+                    with open(thread_file, 'r', newline='', encoding='utf-8') as f:
+                        messages = list(csv.DictReader(f))
+
+                with self._transaction() as db:
+                    if db.execute("SELECT 1 FROM threads WHERE id = ?", (thread["id"],)).fetchone():
+                        summary["skipped_threads"] += 1
+                        continue
+                    db.execute(
+                        "INSERT INTO threads (id, user_id, title, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                        (thread["id"], owner or user_id, thread["title"], thread["created_at"], thread["updated_at"])
+                    )
+                    db.executemany(
+                        "INSERT INTO messages (thread_id, seq, timestamp, role, content) VALUES (?, ?, ?, ?, ?)",
+                        [(thread["id"], seq, m["timestamp"], m["role"], m["content"]) for seq, m in enumerate(messages, 1)]
+                    )
+                summary["threads"] += 1
+                summary["messages"] += len(messages)
+        return summary
 
 
 if __name__ == "__main__":
@@ -249,9 +393,9 @@ if __name__ == "__main__":
     print("Commands: new, list, select <id>, rename <title>, delete, quit")
     
     while True:
-        if manager.active_thread:
+        if manager.get_active_thread(user_id):
             active_threads = manager.get_threads(user_id)
-            active_title = next((t["title"] for t in active_threads if t["id"] == manager.active_thread), "Unknown")
+            active_title = next((t["title"] for t in active_threads if t["id"] == manager.get_active_thread(user_id)), "Unknown")
             prompt = f"[{active_title}] > "
         else:
             prompt = "> "
@@ -269,7 +413,7 @@ if __name__ == "__main__":
             else:
                 print("\nAvailable Threads:")
                 for t in threads:
-                    active = " (ACTIVE)" if t["id"] == manager.active_thread else ""
+                    active = " (ACTIVE)" if t["id"] == manager.get_active_thread(user_id) else ""
                     print(f"ID: {t['id']} - '{t['title']}'{active}")
                     print(f"  Created: {t['created_at']}")
                     print(f"  Updated: {t['updated_at']}")
@@ -277,29 +421,29 @@ if __name__ == "__main__":
         
         elif command.startswith("select "):
             thread_id = command.split(" ", 1)[1]
-            manager.select_thread(thread_id)
+            manager.select_thread(user_id, thread_id)
             print(f"Selected thread: {thread_id}")
             
             # Show thread messages
             messages = manager.get_thread_messages(thread_id)
         
         elif command.startswith("rename "):
-            if not manager.active_thread:
+            if not manager.get_active_thread(user_id):
                 print("No active thread selected.")
                 continue
                 
             new_title = command.split(" ", 1)[1]
-            manager.rename_thread(user_id, manager.active_thread, new_title)
+            manager.rename_thread(user_id, manager.get_active_thread(user_id), new_title)
             print(f"Renamed thread to: {new_title}")
         
         elif command == "delete":
-            if not manager.active_thread:
+            if not manager.get_active_thread(user_id):
                 print("No active thread selected.")
                 continue
                 
             confirm = input("Are you sure you want to delete this thread? (y/n): ")
             if confirm.lower() == "y":
-                thread_id = manager.active_thread
+                thread_id = manager.get_active_thread(user_id)
                 manager.delete_thread(user_id, thread_id)
                 print(f"Deleted thread: {thread_id}")
             else:
@@ -309,16 +453,16 @@ if __name__ == "__main__":
             print("Goodbye!")
             break
         
-        elif manager.active_thread:
+        elif manager.get_active_thread(user_id):
             # Treat as a message in the current thread
             user_message = command
-            manager.add_message(user_id, manager.active_thread, "user", user_message)
+            manager.add_message(user_id, manager.get_active_thread(user_id), "user", user_message)
             
             # Simulate assistant response
             print("Assistant: I'm just a demo. In a real app, the AI would respond here!")
             assistant_response = f"Echo: {user_message}"
             time.sleep(1)  # Simulate thinking
-            manager.add_message(user_id, manager.active_thread, "system", assistant_response)
+            manager.add_message(user_id, manager.get_active_thread(user_id), "system", assistant_response)
         
         else:
             print("Unknown command or no active thread. Type 'new' to create a thread.")
\ No newline at end of file
@@ -0,0 +1,129 @@
+import logging
+import math
+
+import faiss
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq")
+
+# Used for any parameter a store's FAISS_INDEX_CONFIG entry leaves out.
+DEFAULT_INDEX_PARAMS = {
+    "type": "flat",
+    "nlist": 256,
+    "nprobe": 16,
+    "hnsw_m": 32,
+    "ef_construction": 200,
+    "ef_search": 64,
+    "pq_m": 16,
+    "pq_bits": 8,
+}
+
+# k-means wants about this many training points per centroid
+_POINTS_PER_CENTROID = 39
+
+
+def index_params(kind, overrides=None):
+    """
+    Resolve the index parameters of one store.
+
+    Args:
+        kind (str): "csv" or "pdf"
+        overrides (dict, optional): Parameters taking precedence over settings
+
+    Returns:
+        dict: Complete parameter set
+    """
+    params = dict(DEFAULT_INDEX_PARAMS)
+    params.update(settings.FAISS_INDEX_CONFIG.get(kind, {}))
+    params.update(overrides or {})
+    if params["type"] not in INDEX_TYPES:
+        raise ValueError(f"Unknown FAISS index type {params['type']!r}; expected one of {', '.join(INDEX_TYPES)}")
+    return params
+
+
+def create_index(vectors, params):
+    """
+    Build and fill a FAISS index of the configured type.
+
+    Every type uses L2 distance, so scores stay comparable with the
+    thresholds the answer pipeline applies to the exact flat index.
+    IVF list counts and PQ code sizes are scaled down when the corpus is
+    too small to train them.
+
+    Args:
+        vectors (numpy.ndarray): float32 matrix of shape (n, dim)
+        params (dict): Parameters from `index_params`
+
+    Returns:
+        faiss.Index: The trained index holding all vectors
+    """
+    n, dim = vectors.shape
+    index_type = params["type"]
+
+    if index_type == "flat":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params["hnsw_m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+    else:
+        nlist = max(1, min(params["nlist"], n // _POINTS_PER_CENTROID))
+        if nlist != params["nlist"]:
+            logger.info("Using nlist=%d instead of %d for %d vectors", nlist, params["nlist"], n)
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist)
+        else:
+            pq_m = max(m for m in range(1, min(params["pq_m"], dim) + 1) if dim % m == 0)
+            pq_bits = max(1, min(params["pq_bits"], int(math.log2(max(2, n // _POINTS_PER_CENTROID)))))
+            if (pq_m, pq_bits) != (params["pq_m"], params["pq_bits"]):
+                logger.info("Using pq_m=%d, pq_bits=%d for %d vectors of dimension %d", pq_m, pq_bits, n, dim)
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits)
+        index.train(vectors)
+
+    index.add(vectors)
+    configure_search(index, params)
+    return index
+
+
+def read_index(path, params=None):
+    """
+    Load an index file the way the server does.
+
+    With FAISS_MMAP on, the file is mapped read-only rather than copied
+    into the heap, so processes loading the same index share its pages.
+
+    Args:
+        path (str): Path to index.faiss
+        params (dict, optional): Parameters whose search-time values are applied
+
+    Returns:
+        faiss.Index: The loaded index
+    """
+    flags = 0
+    if settings.FAISS_MMAP:
+        # IO_FLAG_MMAP leaves flat indexes in memory; IO_FLAG_MMAP_IFC
+        # (faiss >= 1.9) maps their codes too, so prefer it when available.
+        flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    index = faiss.read_index(str(path), flags)
+    if params:
+        configure_search(index, params)
+    return index
+
+
+def configure_search(index, params):
+    """
+    Apply search-time parameters (nprobe, efSearch) to a loaded index.
+
+    These are not stored in index.faiss, so they are set on every load and
+    can be tuned without rebuilding.
+    """
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = params["ef_search"]
+        return
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return
+    ivf.nprobe = min(params["nprobe"], ivf.nlist)
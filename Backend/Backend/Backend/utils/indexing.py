@@ -0,0 +1,469 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import faiss
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from langchain_community.document_loaders import PyPDFLoader
+from langchain_community.vectorstores import FAISS
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from .bm25 import BM25_NAME, write_bm25
+from .docstore import DOCSTORE_NAME, MmapDocstore, write_docstore
+from .embeddings import embedding_signature
+from .index_types import create_index, index_params
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_NAME = "manifest.json"
+LEGACY_DOCSTORE_NAME = "index.pkl"
+VECTORS_NAME = "vectors.npy"
+MANIFEST_VERSION = 2
+
+SOURCE_EXTENSIONS = {
+    "csv": (".csv",),
+    "pdf": (".pdf",),
+}
+
+
+def hash_file(path):
+    """
+    Content hash of a source file, used to detect changed files.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def index_file_signature(path, sample=64 * 1024):
+    """
+    Cheap signature of a written index file: its size and a hash of its
+    first and last `sample` bytes, which hold the headers and row counts.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(sample))
+        if size > sample:
+            f.seek(max(size - sample, sample))
+            digest.update(f.read())
+    return {"size": size, "sample": digest.hexdigest()}
+
+
+def check_index_files(index_path):
+    """
+    Check the files of an index directory against its manifest.
+
+    `IndexBuilder` moves a new index into place one file at a time with the
+    manifest last, so a reader arriving in between finds new files next to
+    the previous manifest. Raises ValueError if any file listed under the
+    manifest's `index_files` is missing or differs; indexes without a
+    manifest, or built before it listed its files, are not checked.
+
+    Args:
+        index_path (str): Index directory
+    """
+    manifest_path = os.path.join(index_path, MANIFEST_NAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            expected = json.load(f).get("index_files")
+    except FileNotFoundError:
+        return
+    except ValueError as e:
+        raise ValueError(f"{index_path}: unreadable {MANIFEST_NAME} ({e})")
+    for name, signature in (expected or {}).items():
+        path = os.path.join(index_path, name)
+        if not os.path.exists(path) or index_file_signature(path) != signature:
+            raise ValueError(
+                f"{index_path}: {name} does not match {MANIFEST_NAME}; the index is being rewritten "
+                "or a rebuild was interrupted"
+            )
+
+
+def stable_id(relpath, chunk_no):
+    """
+    Vector id that stays the same for the same chunk of the same file.
+    """
+    prefix = hashlib.sha1(relpath.encode('utf-8')).hexdigest()[:16]
+    return f"{prefix}-{chunk_no}"
+
+
+def load_csv_documents(path, relpath):
+    """
+    Read a Q&A CSV into (text, metadata) pairs, one per question.
+
+    The question column becomes the embedded text; answer, details and
+    category are kept as metadata, matching what the AnswerPipeline reads.
+    """
+    df = pd.read_csv(path)
+    columns = {col.lower().strip(): col for col in df.columns}
+    question_col = columns.get('question') or columns.get('questions')
+    if question_col is None:
+        raise ValueError(f"{relpath} has no 'Question' column")
+
+    documents = []
+    for _, row in df.iterrows():
+        question = row[question_col]
+        if pd.isna(question) or not str(question).strip():
+            continue
+        metadata = {"file": relpath}
+        for field in ("answer", "details", "category"):
+            if field in columns:
+                value = row[columns[field]]
+                metadata[field] = value.item() if hasattr(value, 'item') else value
+        documents.append((str(question), metadata))
+    return documents
+
+
+def load_pdf_documents(path, relpath, chunk_size, chunk_overlap):
+    """
+    Read a policy PDF into (text, metadata) chunks.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    pages = PyPDFLoader(path).load()
+
+    documents = []
+    for chunk_index, chunk in enumerate(splitter.split_documents(pages)):
+        metadata = dict(chunk.metadata)
+        metadata.update({
+            "file": relpath,
+            "source": "pdf",
+            "document_name": os.path.basename(path),
+            "page_number": metadata.get("page", 0) + 1,
+            "chunk_index": chunk_index
+        })
+        documents.append((chunk.page_content, metadata))
+    return documents
+
+
+def _load_source(kind, path, relpath, chunk_size, chunk_overlap):
+    # Module-level so it can run in a worker process
+    if kind == "csv":
+        return relpath, load_csv_documents(path, relpath)
+    return relpath, load_pdf_documents(path, relpath, chunk_size, chunk_overlap)
+
+
+class IndexBuilder:
+    """
+    Builds and incrementally updates one FAISS knowledge-base index.
+
+    The index directory keeps a manifest of every source file it was built
+    from: the file's content hash and the stable ids of its vectors. On
+    each run only new or changed files are parsed and embedded, and the
+    vectors of changed or deleted files are removed by id, so updating a
+    single policy PDF does not re-embed the whole corpus.
+    """
+
+    def __init__(self, index_path, kind, embedding_model, workers=None, batch_size=None,
+                 chunk_size=None, chunk_overlap=None, params=None):
+        """
+        Initialize the IndexBuilder.
+
+        Args:
+            index_path (str): Directory the index is written to
+            kind (str): "csv" for Q&A sheets or "pdf" for policy documents
+            embedding_model: LangChain embeddings used to encode chunks
+            workers (int, optional): Processes used to parse source files
+            batch_size (int, optional): Chunks encoded per forward pass
+            chunk_size (int, optional): PDF chunk size in characters
+            chunk_overlap (int, optional): Overlap between PDF chunks
+            params (dict, optional): FAISS index parameters overriding
+                FAISS_INDEX_CONFIG for this store
+        """
+        if kind not in SOURCE_EXTENSIONS:
+            raise ValueError(f"Unknown index kind: {kind}")
+
+        self.index_path = str(index_path)
+        self.kind = kind
+        self.embedding_model = embedding_model
+        self.workers = workers or settings.INDEX_BUILD_WORKERS
+        self.batch_size = batch_size or settings.INDEX_BUILD_BATCH_SIZE
+        self.chunk_size = chunk_size or settings.INDEX_CHUNK_SIZE
+        self.chunk_overlap = settings.INDEX_CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+        self.params = index_params(kind, params)
+
+    def build(self, sources, full=False):
+        """
+        Bring the index up to date with the given source files.
+
+        Args:
+            sources (list): Source files and/or directories
+            full (bool): Ignore the existing index and rebuild from scratch
+
+        Returns:
+            dict: Summary of what changed
+        """
+        files = self._discover(sources)
+        manifest = None if full else self._read_manifest()
+        contents = self._read_contents() if manifest is not None else None
+        if contents is None:
+            manifest = {"version": MANIFEST_VERSION, "model": embedding_signature(), "files": {}}
+            contents = IndexContents()
+
+        hashes = self._hash_files(files)
+        known = manifest["files"]
+
+        removed = [relpath for relpath in known if relpath not in files]
+        changed = [relpath for relpath in files if relpath in known and known[relpath]["sha256"] != hashes[relpath]]
+        added = [relpath for relpath in files if relpath not in known]
+
+        stale_ids = {i for relpath in removed + changed for i in known[relpath]["ids"]}
+        contents.remove(stale_ids)
+        for relpath in removed:
+            del known[relpath]
+
+        to_load = changed + added
+        vectors_added = 0
+        for relpath, documents in self._load_sources(files, to_load):
+            ids = [stable_id(relpath, n) for n in range(len(documents))]
+            if documents:
+                contents.add(ids, documents, self._embed([text for text, _ in documents]))
+            known[relpath] = {"sha256": hashes[relpath], "ids": ids}
+            vectors_added += len(ids)
+
+        if not len(contents):
+            raise ValueError(f"No {self.kind.upper()} documents found in {', '.join(map(str, sources))}")
+
+        manifest["index"] = self.params
+        self._save(contents, manifest)
+        return {
+            "index_type": self.params["type"],
+            "added_files": len(added),
+            "updated_files": len(changed),
+            "removed_files": len(removed),
+            "unchanged_files": len(files) - len(to_load),
+            "vectors_added": vectors_added,
+            "vectors_removed": len(stale_ids),
+            "total_vectors": len(contents)
+        }
+
+    def _discover(self, sources):
+        """
+        Map each source file's relative path to its absolute path.
+        """
+        extensions = SOURCE_EXTENSIONS[self.kind]
+        files = {}
+        for source in sources:
+            source = os.path.abspath(source)
+            if os.path.isfile(source):
+                files[os.path.basename(source)] = source
+                continue
+            for root, _, names in os.walk(source):
+                for name in names:
+                    if name.lower().endswith(extensions):
+                        path = os.path.join(root, name)
+                        files[os.path.relpath(path, source).replace(os.sep, '/')] = path
+        return dict(sorted(files.items()))
+
+    def _hash_files(self, files):
+        return {relpath: hash_file(path) for relpath, path in files.items()}
+
+    def _load_sources(self, files, relpaths):
+        if not relpaths:
+            return
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            futures = [
+                pool.submit(_load_source, self.kind, files[relpath], relpath, self.chunk_size, self.chunk_overlap)
+                for relpath in relpaths
+            ]
+            for future in futures:
+                relpath, documents = future.result()
+                logger.info("Loaded %s (%d chunks)", relpath, len(documents))
+                yield relpath, documents
+
+    def _embed(self, texts):
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            vectors.extend(self.embedding_model.embed_documents(texts[start:start + self.batch_size]))
+        return np.asarray(vectors, dtype=np.float32)
+
+    def _read_manifest(self):
+        path = os.path.join(self.index_path, MANIFEST_NAME)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("model") != embedding_signature():
+            logger.info("Index at %s was built differently, rebuilding from scratch", self.index_path)
+            return None
+        return manifest
+
+    def _read_contents(self):
+        try:
+            return IndexContents.read(self.index_path)
+        except Exception as e:
+            logger.warning("Could not read existing index at %s (%s), rebuilding from scratch", self.index_path, e)
+            return None
+
+    def _save(self, contents, manifest):
+        """
+        Write the index next to the live one, then move its files into place.
+
+        Each file is replaced atomically, but not the set of them: for a
+        moment the new files sit next to the previous manifest, which goes
+        last. The manifest lists the signature of every file it was written
+        with, and `retrieval.load_store` refuses a directory that does not
+        match it, so a server reloading in between keeps its current index.
+        """
+        tmp_path = f"{self.index_path}.tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        contents.write(tmp_path, self.params)
+        manifest["index_files"] = {
+            name: index_file_signature(os.path.join(tmp_path, name)) for name in sorted(os.listdir(tmp_path))
+        }
+        with open(os.path.join(tmp_path, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2)
+
+        os.makedirs(self.index_path, exist_ok=True)
+        # The manifest goes last: it is what marks the index as complete
+        names = sorted(os.listdir(tmp_path), key=lambda name: name == MANIFEST_NAME)
+        for name in names:
+            os.replace(os.path.join(tmp_path, name), os.path.join(self.index_path, name))
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+        # Drop files of the index this one replaces that it does not rewrite:
+        # the pickled docstore, and the raw vectors once back on a flat index
+        for name in (LEGACY_DOCSTORE_NAME, VECTORS_NAME):
+            if name not in names and os.path.exists(os.path.join(self.index_path, name)):
+                os.remove(os.path.join(self.index_path, name))
+
+
+class IndexContents:
+    """
+    Documents and vectors of one index, in FAISS order.
+
+    Approximate indexes cannot give back their vectors exactly (IVF lists
+    need a direct map, PQ codes are lossy), so next to those the raw
+    vectors are kept in vectors.npy for incremental updates and benchmarks.
+    """
+
+    def __init__(self, ids=None, texts=None, metadatas=None, vectors=None):
+        self.ids = ids or []
+        self.texts = texts or []
+        self.metadatas = metadatas or []
+        self.vectors = vectors
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def read(cls, index_path):
+        """
+        Read an index written by `write`, decoding every document.
+
+        Older pickled indexes (index.pkl) are read only when
+        ALLOW_PICKLE_INDEXES is on, as `retrieval.load_store` does.
+        """
+        docstore_path = os.path.join(index_path, DOCSTORE_NAME)
+        if os.path.exists(docstore_path):
+            documents = list(MmapDocstore(docstore_path))
+        elif not os.path.exists(os.path.join(index_path, LEGACY_DOCSTORE_NAME)):
+            raise ValueError(f"{index_path} has no {DOCSTORE_NAME}; build it with `manage.py build_indexes`")
+        elif not settings.ALLOW_PICKLE_INDEXES:
+            raise ValueError(
+                f"{index_path} has no {DOCSTORE_NAME}; run `manage.py build_indexes --convert-legacy` "
+                "or enable ALLOW_PICKLE_INDEXES"
+            )
+        else:
+            logger.warning("Reading pickled index at %s; convert it with `build_indexes --convert-legacy`", index_path)
+            documents = _read_legacy_documents(index_path)
+        return cls(
+            ids=[doc.id for doc in documents],
+            texts=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents],
+            vectors=read_vectors(index_path)
+        )
+
+    def remove(self, ids):
+        if not ids:
+            return
+        keep = [i for i, doc_id in enumerate(self.ids) if doc_id not in ids]
+        self.ids = [self.ids[i] for i in keep]
+        self.texts = [self.texts[i] for i in keep]
+        self.metadatas = [self.metadatas[i] for i in keep]
+        self.vectors = self.vectors[keep] if self.vectors is not None else None
+
+    def add(self, ids, documents, vectors):
+        self.ids.extend(ids)
+        self.texts.extend(text for text, _ in documents)
+        self.metadatas.extend(metadata for _, metadata in documents)
+        self.vectors = vectors if self.vectors is None or not len(self.vectors) else np.vstack([self.vectors, vectors])
+
+    def write(self, index_path, params):
+        """
+        Write index.faiss, the memory-mapped docstore.bin, the bm25.bin
+        lexical index and, for approximate index types, vectors.npy.
+        """
+        vectors = np.ascontiguousarray(self.vectors, dtype=np.float32)
+        faiss.write_index(create_index(vectors, params), os.path.join(index_path, "index.faiss"))
+        if params["type"] != "flat":
+            np.save(os.path.join(index_path, VECTORS_NAME), vectors)
+        write_docstore(os.path.join(index_path, DOCSTORE_NAME), self.ids, self.texts, self.metadatas)
+        write_bm25(os.path.join(index_path, BM25_NAME), self.texts, settings.BM25_K1, settings.BM25_B)
+
+
+def read_vectors(index_path):
+    """
+    Exact vectors of an index, in FAISS order.
+
+    Args:
+        index_path (str): Index directory
+
+    Returns:
+        numpy.ndarray: float32 matrix of shape (ntotal, dim)
+    """
+    vectors_path = os.path.join(index_path, VECTORS_NAME)
+    if os.path.exists(vectors_path):
+        return np.load(vectors_path, allow_pickle=False)
+    index = faiss.read_index(os.path.join(index_path, "index.faiss"))
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def convert_legacy_index(index_path, embedding_model):
+    """
+    Rewrite a pickled LangChain index (index.pkl) in the docstore.bin format,
+    and build its bm25.bin.
+
+    For indexes shipped before the format change; it unpickles whether or
+    not ALLOW_PICKLE_INDEXES is on. The FAISS vectors are kept as they are.
+
+    Args:
+        index_path (str): Index directory
+        embedding_model: LangChain embeddings (only needed to open the store)
+
+    Returns:
+        int: Number of documents converted
+    """
+    index_path = str(index_path)
+    documents = _read_legacy_documents(index_path, embedding_model)
+    write_docstore(
+        os.path.join(index_path, DOCSTORE_NAME),
+        [doc.id for doc in documents],
+        [doc.page_content for doc in documents],
+        [doc.metadata for doc in documents]
+    )
+    write_bm25(os.path.join(index_path, BM25_NAME), [doc.page_content for doc in documents],
+               settings.BM25_K1, settings.BM25_B)
+    os.remove(os.path.join(index_path, LEGACY_DOCSTORE_NAME))
+    return len(documents)
+
+
+def _read_legacy_documents(index_path, embedding_model=None):
+    # Unpickling runs arbitrary code: callers decide whether the index is
+    # trusted. Documents come back in FAISS order, with their docstore id
+    # where they had no id of their own.
+    store = FAISS.load_local(index_path, embeddings=embedding_model, allow_dangerous_deserialization=True)
+    documents = []
+    for i in range(store.index.ntotal):
+        doc = store.docstore.search(store.index_to_docstore_id[i])
+        doc.id = doc.id or store.index_to_docstore_id[i]
+        documents.append(doc)
+    return documents
@@ -0,0 +1,397 @@
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from django.conf import settings
+
+from .dedup import QuestionDeduplicator
+from .export import export_name, write_answered_questionnaire
+from .questionnaire import (
+    answer_rows, check_questionnaire, estimate_rows, format_result, iter_chunks, iter_questionnaire
+)
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ("completed", "failed")
+
+
+class QuestionnaireJobManager:
+    """
+    Runs questionnaire uploads as background jobs on a local thread pool.
+
+    Each job lives in its own directory:
+
+        job.json       status and progress, rewritten atomically after every row
+        upload.<ext>   the uploaded questionnaire, streamed to disk as received
+        results.jsonl  one answered row per line, appended as rows finish
+        answered.<ext> the upload with the answers added, written on completion
+        worker.lock    heartbeat of the process currently running the job
+
+    The worker reads the upload row by row and answers it in chunks, so
+    neither the file nor its questions are ever fully in memory and the
+    first rows are answered before the rest has been parsed. Before
+    answering starts, `rows_total` is estimated with a newline count of a
+    CSV upload or the worksheet dimension of a workbook, which keeps
+    `eta_seconds` available from the first row; blank and question-less
+    rows are counted too, so it is replaced by the exact count once the
+    whole file has been read.
+
+    Because results are appended row by row, a restarted worker skips the
+    rows already in results.jsonl and continues where the last one stopped.
+    Jobs created before uploads were kept carry a questions.json with the
+    parsed rows instead, which is still read.
+    """
+
+    def __init__(self, data_dir="Backend/utils/job_data", max_workers=None):
+        """
+        Initialize the QuestionnaireJobManager.
+
+        Args:
+            data_dir (str): Directory to store all job data
+            max_workers (int, optional): Jobs processed at the same time
+        """
+        self.data_dir = os.path.join(settings.BASE_DIR, data_dir)
+        self.max_workers = max_workers or settings.BATCH_JOB_WORKERS
+        self.owner = uuid.uuid4().hex
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch-job")
+        self._lock = threading.Lock()
+        self._running = set()
+
+        os.makedirs(self.data_dir, exist_ok=True)
+
+    def submit(self, file, file_name):
+        """
+        Save an upload and queue it for background processing.
+
+        Only the header is parsed here, to reject files without a Questions
+        column before a job is created.
+
+        Args:
+            file: File-like object with the upload contents
+            file_name (str): Original file name
+
+        Returns:
+            dict: The new job's status record
+        """
+        check_questionnaire(file, file_name)
+        file.seek(0)
+
+        job_id = str(uuid.uuid4())
+        job_dir = self._job_dir(job_id)
+        os.makedirs(job_dir)
+
+        with open(os.path.join(job_dir, self._upload_name(file_name)), 'wb') as f:
+            for chunk in file.chunks() if hasattr(file, "chunks") else iter(lambda: file.read(1 << 20), b""):
+                f.write(chunk)
+        open(os.path.join(job_dir, "results.jsonl"), 'w', encoding='utf-8').close()
+
+        timestamp = datetime.now().isoformat()
+        job = {
+            "id": job_id,
+            "file_name": file_name,
+            "status": "queued",
+            "rows_total": None,
+            "rows_done": 0,
+            "rows_needing_llm": None,
+            "deduplicated_rows": 0,
+            "eta_seconds": None,
+            "error": None,
+            "created_at": timestamp,
+            "updated_at": timestamp
+        }
+        self._write_job(job)
+        self._schedule(job_id)
+        return job
+
+    def get_job(self, job_id):
+        """
+        Get the status record of a job.
+
+        Args:
+            job_id (str): Job identifier
+
+        Returns:
+            dict: Job status, or None if the job does not exist
+        """
+        path = os.path.join(self._job_dir(job_id), "job.json")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def get_results(self, job_id, offset=0, limit=None):
+        """
+        Get the rows answered so far.
+
+        Args:
+            job_id (str): Job identifier
+            offset (int): Number of leading rows to skip
+            limit (int, optional): Maximum number of rows to return
+
+        Returns:
+            list: Result rows in questionnaire order
+        """
+        results = []
+        for i, entry in enumerate(self._iter_results(job_id)):
+            if i < offset:
+                continue
+            if limit is not None and len(results) >= limit:
+                break
+            results.append(entry["result"])
+        return results
+
+    def get_export(self, job_id):
+        """
+        Get the answered questionnaire of a completed job.
+
+        The file is written when the job completes; jobs that finished
+        before exports existed have it written on first request.
+
+        Args:
+            job_id (str): Job identifier
+
+        Returns:
+            tuple: (path, download_name), or None if the job is unfinished
+            or predates uploads being kept
+        """
+        job = self.get_job(job_id)
+        if job is None or job["status"] != "completed":
+            return None
+        if not os.path.exists(os.path.join(self._job_dir(job_id), self._upload_name(job["file_name"]))):
+            return None
+
+        path = self._export_path(job)
+        if not os.path.exists(path):
+            self._write_export(job)
+        return path, export_name(job["file_name"])
+
+    def resume_pending(self):
+        """
+        Re-queue every unfinished job whose worker is gone.
+
+        Returns:
+            list: Identifiers of the jobs that were re-queued
+        """
+        resumed = []
+        for job_id in os.listdir(self.data_dir):
+            job = self.get_job(job_id)
+            if job and job["status"] not in FINISHED_STATUSES and not self._is_locked_elsewhere(job_id):
+                self._schedule(job_id)
+                resumed.append(job_id)
+        if resumed:
+            logger.info("Resuming %d questionnaire job(s)", len(resumed))
+        return resumed
+
+    def _schedule(self, job_id):
+        with self._lock:
+            if job_id in self._running:
+                return
+            self._running.add(job_id)
+        self._executor.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        try:
+            if not self._acquire(job_id):
+                return
+            try:
+                self._process(job_id)
+            finally:
+                self._release(job_id)
+        except Exception as e:
+            logger.exception("Questionnaire job %s failed", job_id)
+            job = self.get_job(job_id)
+            if job:
+                job["status"] = "failed"
+                job["error"] = str(e)
+                self._write_job(job)
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _process(self, job_id):
+        job = self.get_job(job_id)
+        done = list(self._iter_results(job_id))
+
+        job["status"] = "running"
+        job["rows_done"] = len(done)
+        job["rows_needing_llm"] = sum(entry["needs_llm"] for entry in done)
+        job["deduplicated_rows"] = sum(entry.get("deduplicated", False) for entry in done)
+        rows = self._iter_rows(job)
+        self._write_job(job)
+
+        try:
+            # Skip the rows a previous worker already answered
+            for _ in itertools.islice(rows, len(done)):
+                pass
+
+            started = time.monotonic()
+            processed = 0
+            # Clusters only span the rows this worker answers; repeats of rows
+            # answered before a restart are retrieved again
+            dedup = QuestionDeduplicator()
+            results_path = os.path.join(self._job_dir(job_id), "results.jsonl")
+            with open(results_path, 'a', encoding='utf-8') as results_file:
+                # Retrieval is cheap, so run it for a whole chunk up front to
+                # know how many of its rows need the slower LLM path. Those
+                # are then generated in parallel while results still arrive
+                # in row order.
+                for chunk in iter_chunks(rows):
+                    pending_llm, duplicates, answers = answer_rows(chunk, dedup=dedup)
+                    job["rows_needing_llm"] += sum(pending_llm)
+                    job["deduplicated_rows"] += sum(duplicates)
+
+                    for i, ((question_id, question), result) in enumerate(zip(chunk, answers)):
+                        entry = {
+                            "needs_llm": pending_llm[i],
+                            "deduplicated": duplicates[i],
+                            "result": format_result(question_id, question, result)
+                        }
+                        results_file.write(json.dumps(entry) + "\n")
+                        results_file.flush()
+
+                        processed += 1
+                        job["rows_done"] = len(done) + processed
+                        if job["rows_total"] is not None:
+                            elapsed = time.monotonic() - started
+                            remaining = max(job["rows_total"] - job["rows_done"], 0)
+                            job["eta_seconds"] = round(elapsed / processed * remaining, 1)
+                        self._write_job(job)
+                        self._heartbeat(job_id)
+        finally:
+            rows.close()
+
+        job["status"] = "completed"
+        job["eta_seconds"] = 0
+        self._write_job(job)
+
+        try:
+            self._write_export(job)
+        except Exception:
+            # The answers are all in results.jsonl; the export is retried
+            # when it is first downloaded
+            logger.exception("Could not write the answered questionnaire of job %s", job_id)
+
+    def _write_export(self, job):
+        upload_path = os.path.join(self._job_dir(job["id"]), self._upload_name(job["file_name"]))
+        if not os.path.exists(upload_path):
+            return
+        write_answered_questionnaire(
+            upload_path,
+            job["file_name"],
+            (entry["result"] for entry in self._iter_results(job["id"])),
+            self._export_path(job)
+        )
+
+    def _export_path(self, job):
+        return os.path.join(self._job_dir(job["id"]), "answered" + os.path.splitext(export_name(job["file_name"]))[1])
+
+    def _iter_rows(self, job):
+        job_dir = self._job_dir(job["id"])
+        legacy_path = os.path.join(job_dir, "questions.json")
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'r', encoding='utf-8') as f:
+                rows = json.load(f)
+            job["rows_total"] = len(rows)
+            return (tuple(row) for row in rows)
+
+        upload = open(os.path.join(job_dir, self._upload_name(job["file_name"])), 'rb')
+        if job["rows_total"] is None:
+            job["rows_total"] = estimate_rows(upload, job["file_name"])
+
+        def rows():
+            try:
+                count = 0
+                for row in iter_questionnaire(upload, job["file_name"]):
+                    count += 1
+                    yield row
+                # The file has been read to the end, so the total is known
+                job["rows_total"] = count
+            finally:
+                upload.close()
+
+        return rows()
+
+    @staticmethod
+    def _upload_name(file_name):
+        return "upload" + os.path.splitext(file_name)[1].lower()
+
+    def _iter_results(self, job_id):
+        path = os.path.join(self._job_dir(job_id), "results.jsonl")
+        if not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                # A worker killed mid-write leaves a partial last line
+                if not line.endswith("\n"):
+                    break
+                yield json.loads(line)
+
+    def _job_dir(self, job_id):
+        return os.path.join(self.data_dir, os.path.basename(job_id))
+
+    def _write_job(self, job):
+        job["updated_at"] = datetime.now().isoformat()
+        path = os.path.join(self._job_dir(job["id"]), "job.json")
+        tmp_path = f"{path}.{self.owner}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def _lock_path(self, job_id):
+        return os.path.join(self._job_dir(job_id), "worker.lock")
+
+    def _read_lock(self, job_id):
+        try:
+            with open(self._lock_path(job_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _is_locked_elsewhere(self, job_id):
+        lock = self._read_lock(job_id)
+        if not lock or lock.get("owner") == self.owner:
+            return False
+        return time.time() - lock.get("heartbeat", 0) < settings.BATCH_JOB_STALE_SECONDS
+
+    def _acquire(self, job_id):
+        if self._is_locked_elsewhere(job_id):
+            return False
+        self._heartbeat(job_id)
+        return True
+
+    def _heartbeat(self, job_id):
+        path = self._lock_path(job_id)
+        tmp_path = f"{path}.{self.owner}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"owner": self.owner, "heartbeat": time.time()}, f)
+        os.replace(tmp_path, path)
+
+    def _release(self, job_id):
+        lock = self._read_lock(job_id)
+        if lock and lock.get("owner") == self.owner:
+            os.remove(self._lock_path(job_id))
+
+
+_job_manager = None
+_job_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """
+    Get the process-wide QuestionnaireJobManager, creating it on first call.
+
+    Returns:
+        QuestionnaireJobManager: The shared job manager
+    """
+    global _job_manager
+    if _job_manager is None:
+        with _job_manager_lock:
+            if _job_manager is None:
+                _job_manager = QuestionnaireJobManager()
+    return _job_manager
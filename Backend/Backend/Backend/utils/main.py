@@ -1,61 +1,55 @@
-def retrieve_hybrid_results(query, top_k=1, threshold=0.6):
-    csv_results = csv_store.similarity_search(query, k=top_k)
-    print(csv_results)
-
-    if csv_results:
-        for doc in csv_results:
-            doc.metadata['source'] = 'csv'
-        return csv_results
-
-    pdf_results = pdf_store.similarity_search(query, k=top_k)
-    for doc in pdf_results:
-        doc.metadata['source'] = 'pdf'
-    return pdf_results
-
-
-def answer_query(query):
-    docs = retrieve_hybrid_results(query, top_k=10)
-
-    # Group by source type
-    csv_context = "\n\n".join([doc.page_content for doc in docs if doc.metadata.get("source") == "csv"])
-    pdf_context = "\n\n".join([doc.page_content for doc in docs if doc.metadata.get("source") == "pdf"])
-
-    if csv_context:
-        custom_prompt = """
-        You are an InfoSec QA assistant. Answer security and compliance questions using only the provided context.
-        For each response:
-        
-        Format the response into a readable paragraph if it is not already in paragraph form.
-        Do not add, remove, or change any words. Preserve the original wording and meaning exactly.
-        
-        Response style:
-        [your formatted response]
-        
-        Context:
-        {context}
-        Question:
-        {query}
-        """
-        llm = ChatOllama(model="llama3.2:latest")
-        prompt = ChatPromptTemplate.from_template(custom_prompt)
-        chain = LLMChain(prompt=prompt, llm=llm)
-        return chain.invoke({"query": query, "context": csv_context})
-
-    elif pdf_context:
-        custom_prompt = """
-        You are an InfoSec QA assistant. Answer security and compliance questions using only the provided context.
-        For each response:
-
-        Summarize the answer in no more than 50 words.
-        Include the exact source document name at the end in brackets.
-        Response style:
-        [your short refined response]
-
-        Context:
-        {context}
-        Question:
-        {query}
-        """
-        prompt = ChatPromptTemplate.from_template(custom_prompt)
-        chain = LLMChain(prompt=prompt, llm=llm)
-        return chain.invoke({"query": query, "context": pdf_context})
+"""
+Answer questions from the command line with the same pipeline as the API.
+
+    cd Backend/Backend
+    python -m Backend.utils.main "Do you encrypt data at rest?"
+    python -m Backend.utils.main --file questions.txt --json
+"""
+import argparse
+import json
+import os
+import sys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer InfoSec questions against the built indexes.")
+    parser.add_argument('questions', nargs='*', help="Questions to answer.")
+    parser.add_argument('--file', help="Text file with one question per line.")
+    parser.add_argument('--json', action='store_true', help="Print one JSON result per line.")
+    args = parser.parse_args(argv)
+
+    questions = list(args.questions)
+    if args.file:
+        with open(args.file, 'r', encoding='utf-8') as f:
+            questions.extend(line.strip() for line in f if line.strip())
+    if not questions:
+        parser.error("no questions given")
+
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Backend.settings')
+    import django
+    django.setup()
+
+    from .pipeline import calculate_confidence, get_pipeline, result_references, result_text
+
+    # All questions go through the pipeline as one batch
+    for item in get_pipeline().answer(questions):
+        result = item.result
+        if args.json:
+            print(json.dumps({
+                "question": item.query,
+                "source": result["source"],
+                "answer": result_text(result),
+                "confidence_score": calculate_confidence(result.get("score")),
+                "references": result_references(result)
+            }, default=str))
+        else:
+            print(f"Q: {item.query}")
+            print(f"A: {result_text(result)}")
+            print(f"   source: {result['source']}, confidence: {calculate_confidence(result.get('score'))}, "
+                  f"references: {'; '.join(map(str, result_references(result)))}")
+            print()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+import os
+
+_SMAPS_FIELDS = {
+    "Rss": "rss_kb",
+    "Pss": "pss_kb",
+    "Shared_Clean": "shared_clean_kb",
+    "Shared_Dirty": "shared_dirty_kb",
+    "Private_Clean": "private_clean_kb",
+    "Private_Dirty": "private_dirty_kb",
+    "Anonymous": "anonymous_kb",
+}
+
+
+def _summarize(fields):
+    fields["shared_kb"] = fields.get("shared_clean_kb", 0) + fields.get("shared_dirty_kb", 0)
+    fields["private_kb"] = fields.get("private_clean_kb", 0) + fields.get("private_dirty_kb", 0)
+    return fields
+
+
+def process_memory():
+    """
+    Resident and shared memory of the current process.
+
+    On Linux this reads /proc/self/smaps_rollup: `shared_kb` counts pages
+    also mapped by other processes (for example memory-mapped index files
+    opened by every worker), `private_kb` pages only this process holds,
+    and `pss_kb` splits shared pages evenly across their users, which is
+    the fair per-worker cost. Elsewhere only the peak RSS is available.
+
+    Returns:
+        dict: Memory figures in kB
+    """
+    try:
+        with open("/proc/self/smaps_rollup", 'r') as f:
+            fields = {}
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in _SMAPS_FIELDS:
+                    fields[_SMAPS_FIELDS[name]] = int(value.split()[0])
+            return _summarize(fields)
+    except OSError:
+        pass
+
+    peak = peak_rss_kb()
+    return {} if peak is None else {"peak_rss_kb": peak}
+
+
+def mapped_files(directories):
+    """
+    Per-file resident and shared memory of files mapped from `directories`.
+
+    Args:
+        directories (list): Directories whose mapped files are reported
+
+    Returns:
+        dict: File path -> memory figures in kB; empty where /proc is missing
+    """
+    directories = [os.path.join(os.path.abspath(str(d)), "") for d in directories]
+    files = {}
+    current = None
+    try:
+        with open("/proc/self/smaps", 'r') as f:
+            for line in f:
+                head = line.split(None, 5)
+                if "-" in head[0] and ":" not in head[0]:
+                    path = head[5].strip() if len(head) > 5 else ""
+                    current = files.setdefault(path, {}) if any(path.startswith(d) for d in directories) else None
+                elif current is not None:
+                    name, _, value = line.partition(":")
+                    if name in _SMAPS_FIELDS:
+                        key = _SMAPS_FIELDS[name]
+                        current[key] = current.get(key, 0) + int(value.split()[0])
+    except OSError:
+        return {}
+    return {path: _summarize(fields) for path, fields in files.items()}
+
+
+def peak_rss_kb():
+    """
+    Peak resident memory of the current process, in kB.
+
+    Reads VmHWM from /proc/self/status, which `reset_peak_rss` can lower;
+    elsewhere falls back to the lifetime peak from getrusage.
+    """
+    try:
+        with open("/proc/self/status", 'r') as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss is in kB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if os.uname().sysname == "Darwin" else peak
+
+
+def reset_peak_rss():
+    """
+    Reset the peak resident memory to the current resident memory, so the
+    peak of one phase of a run can be measured on its own (Linux only).
+
+    Returns:
+        bool: Whether the peak was reset
+    """
+    try:
+        with open("/proc/self/clear_refs", 'w') as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
@@ -0,0 +1,195 @@
+import contextvars
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in seconds, of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Identifier of the request being handled, for log records
+trace_id = contextvars.ContextVar("trace_id", default="-")
+
+_registry = []
+
+
+class Counter:
+    """
+    Monotonic count, optionally split by labels.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield self.name, dict(zip(self.labelnames, key)), value
+
+
+class Histogram:
+    """
+    Distribution of observed values in cumulative buckets, as Prometheus
+    histograms are exposed, optionally split by labels.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = _label_values(self.labelnames, labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            else:
+                counts[-1] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                yield f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_sum", labels, total
+            yield f"{self.name}_count", labels, cumulative
+
+
+STAGE_SECONDS = Histogram(
+    "qna_stage_seconds",
+    "Time spent in each stage of answering: index_load, embed_query, csv_search, pdf_search, lexical_search, "
+    "rerank, history_read, condense, prompt_build, generation_cache, llm and history_write.",
+    ["stage"]
+)
+ANSWERS = Counter(
+    "qna_answers_total",
+    "Answers given, by source (csv hit, pdf fallback or none) and by how they were obtained "
+    "(retrieved, cache or dedup).",
+    ["source", "origin"]
+)
+GENERATION_CACHE = Counter(
+    "qna_generation_cache_total",
+    "Generation cache lookups by result (fresh, stale or miss), and entries evicted.",
+    ["result"]
+)
+CONTEXT_TOKENS = Counter(
+    "qna_context_tokens_total",
+    "Estimated tokens of PDF prompt contexts (used), and tokens cut compared with concatenating the "
+    "picked passages as they are (saved).",
+    ["kind"]
+)
+REQUEST_SECONDS = Histogram(
+    "qna_http_request_seconds",
+    "Time until the response headers were ready, by view, method and status.",
+    ["view", "method", "status"]
+)
+STREAM_SECONDS = Histogram(
+    "qna_stream_seconds",
+    "analyze/stream latency from the request: ttfb (metadata event), first_token and total.",
+    ["milestone"]
+)
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a block as one observation of a stage in `qna_stage_seconds`.
+
+    Args:
+        stage (str): Stage name
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        logger.debug("stage=%s ms=%.1f", stage, elapsed * 1000)
+
+
+def record_answer(result, origin="retrieved"):
+    """
+    Count an answer by its source in `qna_answers_total`.
+
+    Args:
+        result (dict): Answer with a "source" key
+        origin (str): "retrieved", "cache" or "dedup"
+    """
+    ANSWERS.inc(source=result.get("source") or "none", origin=origin)
+
+
+def render():
+    """
+    All metrics in the Prometheus text exposition format.
+
+    Values are kept per process; with several server processes, each
+    serves its own.
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            if labels:
+                label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+                name = f"{name}{{{label_text}}}"
+            lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+class TraceIdFilter(logging.Filter):
+    """
+    Adds the current request's trace id to every log record as `trace_id`.
+    """
+
+    def filter(self, record):
+        record.trace_id = trace_id.get()
+        return True
+
+
+def _label_values(labelnames, labels):
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value)) if abs(value) < 1e15 else repr(value)
+    return repr(value) if isinstance(value, float) else str(value)
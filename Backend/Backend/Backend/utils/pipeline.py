@@ -0,0 +1,402 @@
+import logging
+import threading
+
+import numpy as np
+from django.conf import settings
+
+from .answer_cache import get_answer_cache
+from .context import ContextBuilder
+from .generation import CHAT_PROMPT, QUESTIONNAIRE_PROMPT, GenerationError, get_generation_client
+from .generation_cache import chunk_ids
+from .metrics import record_answer, span
+from .retrieval import get_engine
+
+logger = logging.getLogger(__name__)
+
+NO_ANSWER = "No relevant information found."
+
+
+class PipelineItem:
+    """
+    One question on its way through the AnswerPipeline.
+
+    The stages fill in its attributes in order. An item that already has a
+    `result` (from the answer cache or an earlier duplicate) or that repeats
+    another item of the batch (`same_as`) is passed over by the stages that
+    follow, and only picks up its result in `format`.
+    """
+
+    def __init__(self, query, message=None, history="", follow_up=False, prompt="questionnaire"):
+        """
+        Initialize the PipelineItem.
+
+        Args:
+            query (str): Question to retrieve and cache the answer by
+            message (str, optional): Question as the LLM gets it, when it
+                differs from `query` (a chat follow-up)
+            history (str, optional): Conversation window, which goes into
+                the chat prompt of a follow-up
+            follow_up (bool): Whether the message continues the conversation
+            prompt (str): "questionnaire" or "chat"; answers are cached per
+                prompt
+        """
+        self.query = query
+        self.message = message or query
+        self.history = history
+        self.follow_up = follow_up
+        self.prompt = prompt
+
+        self.vector = None
+        self.index_version = None
+        self.docs_with_scores = None
+        self.source = None
+        self.score = None
+        self.context = None
+        self.context_docs = None
+        self.context_tokens = None
+        self.tokens_saved = None
+        self.references = None
+        self.chunks = None
+        self.generated = None
+        self.result = None
+        self.origin = "retrieved"
+        self.same_as = None
+
+    @property
+    def done(self):
+        return self.result is not None or self.same_as is not None
+
+    @property
+    def needs_generation(self):
+        return self.source == "pdf" and not self.done
+
+    @property
+    def cacheable(self):
+        # A follow-up generated from a PDF passage depends on the history in
+        # its prompt, which the answer cache does not key on. Everything else
+        # is answered from the standalone query alone.
+        return not (self.follow_up and self.history and self.source == "pdf")
+
+
+class AnswerPipeline:
+    """
+    The path from a question to its answer, shared by the chat views, the
+    questionnaire endpoints and jobs, and the command line.
+
+    The stages run in order: `embed`, `lookup` (answer cache), `retrieve`,
+    `select`, `generate` and `format`. Each takes one PipelineItem or a
+    batch of them, fills them in and returns them; a batch is embedded,
+    searched and generated together. The prompt templates are compiled once
+    at import and their chains are reused by the shared GenerationClient.
+
+    `answer` runs every stage; callers that need to act between stages,
+    such as a streaming view or a deduplicating questionnaire, call them
+    one by one.
+    """
+
+    def __init__(self, engine=None, client=None, context_builder=None, top_k=5, threshold=0.2):
+        """
+        Initialize the AnswerPipeline.
+
+        Args:
+            engine (RetrievalEngine, optional): Engine to retrieve with; the
+                shared one if omitted
+            client (GenerationClient, optional): LLM client; the shared one
+                if omitted
+            context_builder (ContextBuilder, optional): Builds PDF prompt
+                contexts
+            top_k (int): Candidates fetched from each store
+            threshold (float): L2 distance separating CSV hits from misses
+        """
+        self._engine = engine
+        self._client = client
+        self.context_builder = context_builder or ContextBuilder()
+        self.top_k = top_k
+        self.threshold = threshold
+        self.prompts = {"chat": CHAT_PROMPT, "questionnaire": QUESTIONNAIRE_PROMPT}
+
+    @property
+    def engine(self):
+        return self._engine or get_engine()
+
+    @property
+    def client(self):
+        return self._client or get_generation_client()
+
+    def answer(self, items, prompt="questionnaire"):
+        """
+        Run every stage.
+
+        Args:
+            items: A question, PipelineItem, or a list of either
+            prompt (str): "questionnaire" or "chat"
+
+        Returns:
+            PipelineItem or list: The answered item(s), `result` filled in
+        """
+        single = isinstance(items, (str, PipelineItem))
+        items = self.items(items)
+        for item in items:
+            item.prompt = prompt
+        answered = list(self.format(self.generate(self.prepare(items), prompt)))
+        return answered[0] if single else answered
+
+    @staticmethod
+    def items(queries):
+        """
+        Wrap questions in PipelineItems; items are passed through.
+
+        Returns:
+            list: PipelineItems
+        """
+        if isinstance(queries, (str, PipelineItem)):
+            queries = [queries]
+        return [query if isinstance(query, PipelineItem) else PipelineItem(query) for query in queries]
+
+    def prepare(self, items):
+        """
+        Run the stages before generation: embed, lookup, retrieve and select.
+        """
+        return self.select(self.retrieve(self.lookup(self.embed(items))))
+
+    def embed(self, items):
+        """
+        Embed the questions that have no vector yet, in one batch.
+        """
+        todo = [item for item in _batch(items) if item.vector is None]
+        if todo:
+            engine = self.engine
+            vectors = engine.embed_queries([item.query for item in todo])
+            for item, vector in zip(todo, vectors):
+                item.vector = vector
+                item.index_version = engine.index_version
+        return items
+
+    def lookup(self, items):
+        """
+        Answer what the answer cache already knows about each item's
+        question and prompt.
+        """
+        cache = get_answer_cache()
+        for item in _batch(items):
+            if not item.done and item.cacheable:
+                result = cache.get(item.query, item.vector, item.index_version, item.prompt)
+                if result is not None:
+                    item.result, item.origin = result, "cache"
+        return items
+
+    def retrieve(self, items):
+        """
+        Run the hybrid CSV-then-PDF lookup for the unanswered items together.
+        """
+        todo = [item for item in _batch(items) if not item.done]
+        if todo:
+            found = self.engine.retrieve_hybrid_batch(
+                [item.query for item in todo], top_k=self.top_k, threshold=self.threshold,
+                vectors=np.vstack([item.vector for item in todo])
+            )
+            for item, docs_with_scores in zip(todo, found):
+                item.docs_with_scores = docs_with_scores
+        return items
+
+    def select(self, items):
+        """
+        Decide where each answer comes from: a knowledge-library (CSV)
+        match, PDF passages for the LLM, or nothing. PDF items get their
+        prompt context - several passages picked by the ContextBuilder,
+        fetched for all of them in one search - with its references and
+        chunk ids.
+        """
+        pdf_items = []
+        for item in _batch(items):
+            if item.done or item.source is not None:
+                continue
+            if not item.docs_with_scores:
+                item.source = "none"
+                continue
+
+            doc, score = item.docs_with_scores[0]
+            item.score = float(score)
+            if 'answer' in doc.metadata or 'details' in doc.metadata or 'category' in doc.metadata:
+                item.source = "csv"
+            elif doc.metadata.get("source") == "pdf":
+                item.source = "pdf"
+                pdf_items.append(item)
+            else:
+                item.source, item.score = "none", None
+
+        if not pdf_items:
+            return items
+        if self.context_builder.max_chunks > 1:
+            passages = self.engine.pdf_passages(
+                np.vstack([item.vector for item in pdf_items]), settings.CONTEXT_CANDIDATES, self.threshold,
+                queries=[item.query for item in pdf_items]
+            )
+        else:
+            passages = [[] for _ in pdf_items]
+
+        with span("prompt_build"):
+            for item, candidates in zip(pdf_items, passages):
+                built = self.context_builder.build(candidates, best=item.docs_with_scores[0])
+                item.context = built["context"]
+                item.context_docs = built["docs_with_scores"]
+                item.context_tokens, item.tokens_saved = built["tokens"], built["tokens_saved"]
+                item.references = list(dict.fromkeys(
+                    f"{d.metadata.get('document_name', 'Unknown Document')}, Page: {d.metadata.get('page_number', 'N/A')}"
+                    for d, _ in item.context_docs
+                ))
+                item.chunks = chunk_ids(item.context_docs)
+        return items
+
+    def inputs(self, item, prompt="questionnaire"):
+        """
+        Template variables of an item for a prompt.
+        """
+        history = (item.history or "") if item.follow_up else ""
+        values = {"query": item.message, "context": item.context, "history": history}
+        return {name: values[name] for name in self.prompts[prompt].input_variables}
+
+    def generate(self, items, prompt="questionnaire"):
+        """
+        Generate the answers of the PDF items.
+
+        A failed generation leaves a GenerationError in `generated`, and
+        `format` falls back to the retrieved passage.
+
+        Args:
+            items: A PipelineItem, or an iterable of them
+            prompt (str): "questionnaire" or "chat"
+
+        Returns:
+            PipelineItem or iterator: A single item once generated; for a
+            batch, all generations are queued at once and the items are
+            yielded in order as their answers arrive
+        """
+        template = self.prompts[prompt]
+        if isinstance(items, PipelineItem):
+            if items.needs_generation and items.generated is None:
+                try:
+                    items.generated = self.client.generate(template, self.inputs(items, prompt), chunks=items.chunks)
+                except GenerationError as e:
+                    items.generated = e
+            return items
+
+        items = list(items)
+        todo = [item for item in items if item.needs_generation and item.generated is None]
+        generated = self.client.imap(
+            template, [self.inputs(item, prompt) for item in todo], [item.chunks for item in todo]
+        ) if todo else iter(())
+        return _in_order(items, todo, generated)
+
+    def format(self, items, cache=True):
+        """
+        Turn each item into its result dict, cache it and count it.
+
+        Args:
+            items: A PipelineItem, or an iterable of them
+            cache (bool): Store new answers in the answer cache
+
+        Returns:
+            PipelineItem or iterator: The item, or the items lazily in order
+        """
+        if isinstance(items, PipelineItem):
+            self._format(items, cache)
+            return items
+        return (self._format(item, cache) for item in items)
+
+    def _format(self, item, cache):
+        if item.same_as is not None:
+            item.result, item.origin = item.same_as.result, "dedup"
+        elif item.result is None:
+            item.result = self._result(item)
+            # Fallback answers from a failed generation are not worth keeping
+            if cache and item.cacheable and not isinstance(item.generated, GenerationError):
+                get_answer_cache().put(item.query, item.vector, item.result, item.index_version, item.prompt)
+        record_answer(item.result, item.origin)
+        return item
+
+    @staticmethod
+    def _result(item):
+        if item.source == "csv":
+            metadata = item.docs_with_scores[0][0].metadata
+            answer = metadata.get('answer', 'No answer available')
+            details = metadata.get('details', 'No details available')
+            category = metadata.get('category', 'No category available')
+            return {
+                "source": "csv",
+                "score": item.score,
+                "answer": "No answer available" if str(answer).lower() == "nan" else answer,
+                "details": "No details available" if str(details).lower() == "nan" else details,
+                "category": "No category available" if str(category).lower() == "nan" else category
+            }
+
+        if item.source == "pdf":
+            generated = item.generated
+            if isinstance(generated, GenerationError):
+                # The prompt asks for the context verbatim, so the retrieved
+                # passage is the closest answer we can give without the LLM.
+                logger.warning("Falling back to raw context for %r: %s", item.message, generated)
+            if not isinstance(generated, str):
+                generated = item.context
+            return {
+                "source": "pdf",
+                "score": item.score,
+                "answer": generated,
+                "references": item.references
+            }
+
+        return {"source": "none", "score": None, "answer": NO_ANSWER}
+
+
+def calculate_confidence(score):
+    if score is None:
+        return 0.0
+
+    # Convert FAISS distance (0–2) to confidence (0–1)
+    confidence = max(0, min(1, 1 - (score / 2)))
+    return round(confidence, 2)
+
+
+def result_text(result):
+    """
+    The answer text shown for a result.
+    """
+    return result.get("answer", "") + '. ' + result.get("details", "")
+
+
+def result_references(result):
+    """
+    The references of a result, always as a list.
+    """
+    return result.get("references", []) or ["KL (" + str(result.get("category", "")) + ")"]
+
+
+def _batch(items):
+    return [items] if isinstance(items, PipelineItem) else items
+
+
+def _in_order(items, todo, generated):
+    pending = {id(item) for item in todo}
+    for item in items:
+        if id(item) in pending:
+            item.generated = next(generated)
+        yield item
+
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_pipeline():
+    """
+    Get the process-wide AnswerPipeline, creating it on first call.
+
+    Returns:
+        AnswerPipeline: The shared pipeline
+    """
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = AnswerPipeline()
+    return _pipeline
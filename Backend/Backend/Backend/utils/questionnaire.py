@@ -0,0 +1,330 @@
+import contextlib
+import csv
+import io
+import itertools
+import logging
+
+import openpyxl
+import pandas as pd
+from django.conf import settings
+
+from .dedup import QuestionDeduplicator
+from .pipeline import calculate_confidence, get_pipeline, result_references, result_text
+
+logger = logging.getLogger(__name__)
+
+
+class QuestionnaireError(ValueError):
+    """
+    Raised when an uploaded questionnaire cannot be read.
+    """
+
+
+QUESTION_COLUMNS = ("questions", "question")
+
+
+def iter_questionnaire(file, file_name):
+    """
+    Stream the non-empty questions of an uploaded questionnaire.
+
+    CSV files are parsed line by line and Excel workbooks are opened in
+    openpyxl's read-only mode, which reads worksheet rows straight from the
+    zip archive without loading images or the rest of the workbook, so
+    memory stays flat however large the upload is. The header is read right
+    away, so a missing Questions column fails here rather than halfway
+    through processing.
+
+    Args:
+        file: File-like object with the upload contents
+        file_name (str): Original file name, used to pick the parser
+
+    Returns:
+        iterator: (question_id, question) tuples in file order
+    """
+    table = iter_table(file, file_name)
+    try:
+        question_col, id_col = question_columns(next(table, []))
+    except QuestionnaireError:
+        table.close()
+        raise
+    return _iter_questions(table, question_col, id_col)
+
+
+def check_questionnaire(file, file_name):
+    """
+    Check that an upload has a Questions column, reading only its header;
+    raises QuestionnaireError if it has none or cannot be read.
+
+    The reader is closed before returning, which leaves the upload open
+    and detached from the CSV text wrapper, so the caller can rewind it.
+
+    Args:
+        file: File-like object with the upload contents
+        file_name (str): Original file name, used to pick the parser
+    """
+    with contextlib.closing(iter_table(file, file_name)) as table:
+        question_columns(next(table, []))
+
+
+def estimate_rows(file, file_name):
+    """
+    Cheaply estimate the number of data rows of an upload without parsing it.
+
+    CSV files are scanned for newlines and Excel workbooks report the
+    worksheet dimension openpyxl reads in read-only mode. Blank lines,
+    rows without a question and multi-line cells are counted too, so the
+    estimate is an upper bound on the questions the readers yield.
+
+    Args:
+        file: Seekable binary file with the upload contents, rewound afterwards
+        file_name (str): Original file name, used to pick the format
+
+    Returns:
+        int: Estimated data rows, or None if the format does not tell
+    """
+    file_name = file_name.lower()
+    try:
+        if file_name.endswith('.csv'):
+            lines = 0
+            last = b"\n"
+            for block in iter(lambda: file.read(1 << 20), b""):
+                lines += block.count(b"\n")
+                last = block[-1:]
+            if last != b"\n":
+                lines += 1
+            return max(lines - 1, 0)
+        elif file_name.endswith('.xlsx'):
+            workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+            try:
+                max_row = workbook.worksheets[0].max_row
+            finally:
+                workbook.close()
+            return max(max_row - 1, 0) if max_row else None
+    except Exception:
+        logger.warning("Could not estimate the rows of %s", file_name, exc_info=True)
+    finally:
+        file.seek(0)
+    return None
+
+
+def iter_table(file, file_name):
+    """
+    Stream the rows of an uploaded questionnaire, header first.
+
+    Only the first worksheet of a workbook is read, as pandas.read_excel
+    did. Blank CSV lines are skipped.
+
+    Args:
+        file: File-like object with the upload contents
+        file_name (str): Original file name, used to pick the parser
+
+    Returns:
+        iterator: Lists of cell values
+    """
+    file_name = file_name.lower()
+
+    if file_name.endswith('.csv'):
+        return _iter_csv(file)
+    elif file_name.endswith('.xlsx'):
+        return _iter_xlsx(file)
+    elif file_name.endswith('.xls'):
+        # The old binary format cannot be read row by row
+        return _iter_dataframe(pd.read_excel(io.BytesIO(file.read())))
+    raise QuestionnaireError("Unsupported file format. Please upload CSV or Excel file.")
+
+
+def question_columns(header):
+    """
+    Find the Questions column and the optional id column of a header row.
+
+    Args:
+        header (list): Cell values of the header row
+
+    Returns:
+        tuple: (question_col, id_col) positions, id_col being None if absent
+    """
+    header = [str(cell).strip() if cell is not None else "" for cell in header]
+    question_col = next((i for i, col in enumerate(header) if col.lower() in QUESTION_COLUMNS), None)
+    if question_col is None:
+        raise QuestionnaireError("File must contain a 'Questions' column")
+    id_col = header.index("id") if "id" in header else None
+    return question_col, id_col
+
+
+def row_question(row, question_col):
+    """
+    Get the question of a table row, or None if the row has none.
+    """
+    question = row[question_col] if question_col < len(row) else None
+    if question is None or not str(question).strip():
+        return None
+    return str(question)
+
+
+def iter_chunks(rows, size=None):
+    """
+    Group an iterable of rows into lists of at most `size` rows.
+
+    Args:
+        rows: Iterable of rows
+        size (int, optional): Rows per chunk (default: QUESTIONNAIRE_CHUNK_SIZE)
+
+    Returns:
+        iterator: Lists of rows
+    """
+    size = size or settings.QUESTIONNAIRE_CHUNK_SIZE
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _iter_questions(table, question_col, id_col):
+    # Rows are numbered like the DataFrame index the reader used to build:
+    # data rows from 1, not counting the header
+    for number, row in enumerate(table, start=1):
+        question = row_question(row, question_col)
+        if question is None:
+            continue
+
+        question_id = row[id_col] if id_col is not None and id_col < len(row) else None
+        if question_id is None or question_id == "":
+            question_id = f"Q{number}"
+        elif isinstance(question_id, str) and question_id.isdigit():
+            question_id = int(question_id)
+        elif isinstance(question_id, float) and question_id.is_integer():
+            question_id = int(question_id)
+        yield question_id, question
+
+
+def _iter_csv(file):
+    raw = getattr(file, "file", file)
+    text = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+    try:
+        for row in csv.reader(text):
+            # Blank lines are skipped without counting as rows
+            if any(cell.strip() for cell in row):
+                yield row
+    finally:
+        # Leave the upload open for whoever owns it
+        text.detach()
+
+
+def _iter_xlsx(file):
+    try:
+        workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    except Exception as e:
+        raise QuestionnaireError(f"Could not read Excel file: {e}")
+    try:
+        # Like pandas.read_excel, only the first sheet holds the questions
+        yield from workbook.worksheets[0].iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _iter_dataframe(df):
+    yield list(df.columns)
+    for row in df.itertuples(index=False):
+        yield [None if pd.isna(value) else value for value in row]
+
+
+def answer_rows(rows, pipeline=None, dedup=None):
+    """
+    Plan and answer a list of questionnaire rows.
+
+    Rows are embedded in one batch and, with a deduplicator, grouped with
+    the repeats of earlier rows, which reuse their answer. The remaining
+    rows are checked against the answer cache; only the misses are
+    retrieved, and the misses that land on the PDF path are generated in
+    parallel.
+
+    Args:
+        rows (list): (question_id, question) tuples
+        pipeline (AnswerPipeline, optional): Pipeline to answer with
+        dedup (QuestionDeduplicator, optional): Clusters of the upload the
+            rows belong to
+
+    Returns:
+        tuple: (needs_llm, duplicates, answers) where `needs_llm` flags the
+        rows that go through the LLM, `duplicates` the rows that reuse the
+        answer of an earlier row, and `answers` iterates the result dicts
+        in row order
+    """
+    pipeline = pipeline or get_pipeline()
+    items = pipeline.embed(pipeline.items([question for _, question in rows]))
+
+    clusters = None
+    if dedup:
+        clusters = dedup.assign([item.query for item in items], [item.vector for item in items])
+        leaders = {}
+        for i, (item, cluster) in enumerate(zip(items, clusters)):
+            earlier = dedup.result(cluster)
+            if earlier is not None:
+                item.result, item.origin = earlier, "dedup"
+            elif cluster in leaders:
+                item.same_as = items[leaders[cluster]]
+            else:
+                leaders[cluster] = i
+    duplicates = [item.done for item in items]
+    if dedup:
+        dedup.deduplicated += sum(duplicates)
+
+    pipeline.select(pipeline.retrieve(pipeline.lookup(items)))
+    needs_llm = [item.needs_generation for item in items]
+
+    def answers():
+        for i, item in enumerate(pipeline.format(pipeline.generate(items))):
+            if dedup and not duplicates[i]:
+                dedup.remember(clusters[i], item.result)
+            yield item.result
+
+    return needs_llm, duplicates, answers()
+
+
+def format_result(question_id, question, result):
+    """
+    Shape one answer into a questionnaire result row.
+
+    Args:
+        question_id: Row identifier from the upload
+        question (str): The question
+        result (dict): Answer from the AnswerPipeline
+
+    Returns:
+        dict: JSON-serializable result row
+    """
+    confidence_score = calculate_confidence(result.get("score", 0.0))
+    return {
+        "id": question_id,
+        "question": question,
+        "suggestedAnswer": result_text(result),
+        "confidence_score": confidence_score * 100,  # Convert to percentage
+        "references": result_references(result),
+    }
+
+
+def iter_answers(rows, pipeline=None, dedup=None):
+    """
+    Answer questionnaire rows chunk by chunk as they are read.
+
+    Each chunk of QUESTIONNAIRE_CHUNK_SIZE rows is embedded, retrieved and
+    generated together, so answers start arriving before the rest of the
+    file has been parsed and only one chunk is held in memory.
+
+    Args:
+        rows: Iterable of (question_id, question) tuples
+        pipeline (AnswerPipeline, optional): Pipeline to answer with
+        dedup (QuestionDeduplicator, optional): Answers repeated questions
+            once; a new one is used if omitted
+
+    Returns:
+        iterator: Result rows in input order
+    """
+    dedup = dedup or QuestionDeduplicator()
+    for chunk in iter_chunks(rows):
+        _, _, answers = answer_rows(chunk, pipeline, dedup)
+        for (question_id, question), result in zip(chunk, answers):
+            yield format_result(question_id, question, result)
+
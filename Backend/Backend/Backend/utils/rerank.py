@@ -0,0 +1,147 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def doc_key(doc):
+    """
+    Stable identifier of a retrieved document for the score cache.
+    """
+    return doc.id or hashlib.sha1(doc.page_content.encode('utf-8')).hexdigest()
+
+
+class Reranker:
+    """
+    Cross-encoder scoring of (query, passage) pairs for the hybrid retriever.
+
+    The model reads the query and each candidate together, which separates
+    a paraphrased knowledge-library question from a merely similar one far
+    better than the L2 distance between two independent embeddings.
+
+    Candidates are scored in batches against a deadline; when the deadline
+    passes the call gives up and the caller keeps the FAISS order, so a
+    slow CPU never delays an answer by more than the budget. Scores are
+    cached per (query hash, document id), since questionnaires repeat
+    questions and the same passages come up again and again.
+    """
+
+    def __init__(self, model_name=None, batch_size=None, cache_size=None):
+        """
+        Initialize the Reranker. The model is loaded on first use.
+
+        Args:
+            model_name (str, optional): sentence-transformers CrossEncoder name
+            batch_size (int, optional): Pairs scored per forward pass
+            cache_size (int, optional): Cached (query, document) scores
+        """
+        self.model_name = model_name or settings.RERANK_MODEL
+        self.batch_size = batch_size or settings.RERANK_BATCH_SIZE
+        self.cache_size = cache_size or settings.RERANK_CACHE_SIZE
+
+        self._model = None
+        self._unavailable = False
+        self._model_lock = threading.Lock()
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        self.cache_hits = 0
+        self.pairs_scored = 0
+        self.budget_exceeded = 0
+
+    def score(self, query, docs, deadline=None):
+        """
+        Score candidate documents for a query.
+
+        Args:
+            query (str): The question
+            docs (list): Candidate Documents
+            deadline (float, optional): time.monotonic() value after which
+                to give up
+
+        Returns:
+            list: One relevance score (0-1) per document, or None if the
+            model is unavailable or the deadline passed
+        """
+        model = self._load()
+        if model is None:
+            return None
+
+        query_hash = hashlib.sha1(query.encode('utf-8')).hexdigest()
+        keys = [(query_hash, doc_key(doc)) for doc in docs]
+        scores = [None] * len(docs)
+        with self._cache_lock:
+            for i, key in enumerate(keys):
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[i] = self._cache[key]
+                    self.cache_hits += 1
+
+        missing = [i for i, score in enumerate(scores) if score is None]
+        for start in range(0, len(missing), self.batch_size):
+            if deadline is not None and time.monotonic() > deadline:
+                self.budget_exceeded += 1
+                return None
+            batch = missing[start:start + self.batch_size]
+            predicted = model.predict([(query, docs[i].page_content) for i in batch], batch_size=self.batch_size)
+            self.pairs_scored += len(batch)
+            with self._cache_lock:
+                for i, score in zip(batch, predicted):
+                    scores[i] = float(score)
+                    self._cache[keys[i]] = scores[i]
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+
+        if deadline is not None and time.monotonic() > deadline:
+            self.budget_exceeded += 1
+            return None
+        return scores
+
+    def stats(self):
+        return {
+            "model": self.model_name,
+            "loaded": self._model is not None,
+            "cached_scores": len(self._cache),
+            "cache_hits": self.cache_hits,
+            "pairs_scored": self.pairs_scored,
+            "budget_exceeded": self.budget_exceeded
+        }
+
+    def _load(self):
+        if self._model is not None or self._unavailable:
+            return self._model
+        with self._model_lock:
+            if self._model is None and not self._unavailable:
+                try:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name, device="cpu")
+                except Exception as e:
+                    logger.warning("Reranker %s unavailable, keeping FAISS order: %s", self.model_name, e)
+                    self._unavailable = True
+        return self._model
+
+
+_reranker = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker():
+    """
+    Get the process-wide Reranker, or None when RERANK_ENABLED is off.
+
+    Returns:
+        Reranker: The shared reranker
+    """
+    global _reranker
+    if not settings.RERANK_ENABLED:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = Reranker()
+    return _reranker
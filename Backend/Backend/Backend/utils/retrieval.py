@@ -0,0 +1,534 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import faiss
+import numpy as np
+from django.conf import settings
+from langchain_community.vectorstores import FAISS
+
+from .bm25 import load_bm25, reciprocal_rank_fusion
+from .docstore import DOCSTORE_NAME, MmapDocstore
+from .embeddings import EmbeddingService, embedding_signature
+from .index_types import index_params, read_index
+from .indexing import check_index_files
+from .memory import mapped_files, process_memory
+from .metrics import span
+from .rerank import get_reranker
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalEngine:
+    """
+    Process-wide owner of the embedding model and the CSV/PDF FAISS stores.
+
+    Loading the sentence-transformer and deserializing both indexes takes
+    seconds, so it happens once per process instead of once per request.
+    Readers take a snapshot of the stores with `stores()`; `reload()` builds
+    fresh stores off to the side and swaps them in with a single assignment,
+    so requests in flight keep searching the indexes they started with.
+    """
+
+    def __init__(self, csv_index_path=None, pdf_index_path=None, model_name=None):
+        """
+        Initialize the RetrievalEngine. Nothing is loaded until first use.
+
+        Args:
+            csv_index_path (str, optional): Directory of the CSV (Q&A) index
+            pdf_index_path (str, optional): Directory of the PDF (policy) index
+            model_name (str, optional): HuggingFace embedding model name
+        """
+        self.csv_index_path = str(csv_index_path or settings.FAISS_CSV_INDEX_PATH)
+        self.pdf_index_path = str(pdf_index_path or settings.FAISS_PDF_INDEX_PATH)
+        self.model_name = model_name or settings.EMBEDDING_MODEL_NAME
+
+        self._lock = threading.RLock()
+        self._embedding_model = None
+        self._stores = None
+        self.version = 0
+        self.index_version = None
+
+    @property
+    def is_loaded(self):
+        return self._stores is not None
+
+    @property
+    def embedding_model(self):
+        self._ensure_loaded()
+        return self._embedding_model
+
+    @property
+    def csv_store(self):
+        return self.stores()[0]
+
+    @property
+    def pdf_store(self):
+        return self.stores()[1]
+
+    def stores(self):
+        """
+        Get a consistent snapshot of both stores, loading them if needed.
+
+        Returns:
+            tuple: (csv_store, pdf_store)
+        """
+        return self._ensure_loaded()
+
+    def warm_up(self):
+        """
+        Load the embedding model and both indexes if they are not loaded yet.
+        """
+        self._ensure_loaded()
+
+    def reload(self, reload_model=False):
+        """
+        Re-read both indexes from disk and swap them in atomically.
+
+        Args:
+            reload_model (bool): Also rebuild the embedding model
+
+        Returns:
+            int: The new engine version
+        """
+        with self._lock, span("index_load"):
+            if reload_model or self._embedding_model is None:
+                self._embedding_model = self._load_embedding_model()
+            self._stores = self._load_stores(self._embedding_model)
+            self.index_version = self._fingerprint()
+            self.version += 1
+            logger.info("Retrieval indexes reloaded (version %s, memory %s)", self.version, process_memory())
+            return self.version
+
+    def status(self):
+        """
+        Describe the loaded indexes and this process's memory use.
+
+        `memory` covers the whole process; `index_files` lists the index
+        files mapped into it with their resident and shared pages, which
+        shows whether workers actually share the indexes.
+
+        Returns:
+            dict: Engine version, index fingerprint and memory figures in kB
+        """
+        reranker = get_reranker()
+        return {
+            "loaded": self.is_loaded,
+            "version": self.version,
+            "index_version": self.index_version,
+            "mmap": settings.FAISS_MMAP,
+            "pid": os.getpid(),
+            "memory": process_memory(),
+            "index_files": mapped_files([self.csv_index_path, self.pdf_index_path]),
+            "embeddings": self._embedding_model.stats() if self._embedding_model is not None else None,
+            "rerank": reranker.stats() if reranker else None
+        }
+
+    def embed_queries(self, queries, batch_size=None):
+        """
+        Encode many queries in fixed-size batches.
+
+        Vectors of queries seen recently come from the embedding service's
+        cache; only the others are encoded.
+
+        Args:
+            queries (list): Query strings
+            batch_size (int, optional): Queries per encoder forward pass
+
+        Returns:
+            numpy.ndarray: float32 matrix of shape (len(queries), dim)
+        """
+        embedding_model = self.embedding_model
+        with span("embed_query"):
+            return embedding_model.encode_queries(list(queries), batch_size or settings.RETRIEVAL_BATCH_SIZE)
+
+    def search(self, store, vectors, k, with_vectors=False, queries=None):
+        """
+        Run one FAISS search for a whole matrix of query vectors.
+
+        Mirrors `similarity_search_with_score_by_vector` row by row, so the
+        hits and raw L2 scores match what LangChain returns for one query.
+
+        Given the query strings, and with LEXICAL_ENABLED on and a BM25
+        index next to the store, each query's FAISS hits are fused with its
+        top BM25 hits (see `_fuse`), and hits come in fused order.
+
+        Args:
+            store (FAISS): Vector store to search
+            vectors (numpy.ndarray): float32 query matrix
+            k (int): Hits per query
+            with_vectors (bool): Also return each hit's stored vector, or
+                None where the index type cannot reconstruct it
+            queries (list, optional): Query strings, one per vector row
+
+        Returns:
+            list: One list of (Document, score) tuples per query row, or
+            (Document, score, vector) with `with_vectors`
+        """
+        if len(vectors) == 0:
+            return []
+
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if store._normalize_L2:
+            vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+
+        scores, indices = store.index.search(vectors, k)
+        lexical_index = getattr(store, "lexical_index", None)
+        if queries is not None and lexical_index is not None and settings.LEXICAL_ENABLED:
+            scores, indices = self._fuse(store.index, lexical_index, queries, vectors, scores, indices)
+        stored = self._reconstruct(store.index, indices) if with_vectors else None
+
+        results = []
+        for row, (row_scores, row_indices) in enumerate(zip(scores, indices)):
+            hits = []
+            for column, (score, i) in enumerate(zip(row_scores, row_indices)):
+                if i == -1:
+                    continue
+                doc = store.docstore.search(store.index_to_docstore_id[i])
+                if with_vectors:
+                    hits.append((doc, score, stored[row, column] if stored is not None else None))
+                else:
+                    hits.append((doc, score))
+            results.append(hits)
+        return results
+
+    @staticmethod
+    def _fuse(index, lexical_index, queries, vectors, scores, indices):
+        """
+        Merge FAISS and BM25 rankings by reciprocal-rank fusion.
+
+        Embeddings blur exact identifiers ("CC6.1", "A.12.3") together, BM25
+        matches them literally; fusing the two rankings puts documents both
+        agree on first. Documents only BM25 found get the L2 distance of
+        their stored vector, so every hit keeps a score comparable with the
+        retrieval thresholds; where the index cannot reconstruct vectors
+        they are left out and only the FAISS hits are reordered.
+
+        Returns:
+            tuple: (scores, indices) shaped like the FAISS results, the
+            best k fused hits per row, padded with -1
+        """
+        k = indices.shape[1]
+        with span("lexical_search"):
+            rankings = [[row for row, _ in lexical_index.top(query, k)] for query in queries]
+
+        fused_scores = np.zeros_like(scores)
+        fused_indices = np.full_like(indices, -1)
+        for row, ranking in enumerate(rankings):
+            distances = {int(i): float(score) for score, i in zip(scores[row], indices[row]) if i != -1}
+            extra = [i for i in ranking if i not in distances]
+            if extra:
+                try:
+                    stored = index.reconstruct_batch(np.asarray(extra, dtype=np.int64))
+                except RuntimeError:
+                    stored = None
+                if stored is not None:
+                    extra_distances = ((stored - vectors[row]) ** 2).sum(axis=1)
+                    distances.update(zip(extra, map(float, extra_distances)))
+
+            dense = [int(i) for i in indices[row] if i != -1]
+            lexical = [i for i in ranking if i in distances]
+            for column, i in enumerate(reciprocal_rank_fusion([dense, lexical], settings.RRF_K)[:k]):
+                fused_scores[row, column] = distances[i]
+                fused_indices[row, column] = i
+        return fused_scores, fused_indices
+
+    @staticmethod
+    def _reconstruct(index, indices):
+        # Flat and HNSW indexes return their stored vectors (PQ ones an
+        # approximation); IVF indexes without a direct map cannot
+        try:
+            ids = np.where(indices == -1, 0, indices).astype(np.int64).ravel()
+            return index.reconstruct_batch(ids).reshape(indices.shape[0], indices.shape[1], -1)
+        except RuntimeError:
+            return None
+
+    def pdf_passages(self, vectors, k, threshold=0.2, queries=None):
+        """
+        Fetch PDF passages to build a prompt context from.
+
+        Args:
+            vectors (numpy.ndarray): float32 query matrix
+            k (int): Candidates per query
+            threshold (float): Passages must score above it, as for the
+                best PDF match of `retrieve_hybrid_batch`
+            queries (list, optional): Query strings, to fuse in BM25 hits
+
+        Returns:
+            list: Per query, (Document, score, vector) tuples best first;
+            vector is None where the index cannot reconstruct it
+        """
+        _, pdf_store = self.stores()
+        with span("pdf_search"):
+            hits = self.search(pdf_store, vectors, k, with_vectors=True, queries=queries)
+        results = []
+        for row in hits:
+            passages = [hit for hit in row if hit[1] > threshold]
+            for doc, _, _ in passages:
+                doc.metadata['source'] = 'pdf'
+            results.append(passages)
+        return results
+
+    def retrieve_hybrid_batch(self, queries, top_k=5, threshold=0.2, batch_size=None, vectors=None):
+        """
+        Batched version of the CSV-then-PDF hybrid lookup.
+
+        All queries are embedded once and searched against the CSV store in
+        a single call; only the rows without a CSV hit within `threshold`
+        are searched again, together, against the PDF store. Both searches
+        fuse in BM25 hits when LEXICAL_ENABLED is on; the threshold still
+        applies to each hit's L2 distance, and the first hit in fused order
+        that meets it wins.
+
+        Args:
+            queries (list): Query strings
+            top_k (int): Candidates fetched from each store
+            threshold (float): L2 distance separating CSV hits from misses
+            batch_size (int, optional): Queries per encoder forward pass
+            vectors (numpy.ndarray, optional): Query embeddings computed
+                earlier with `embed_queries`; encoded here if omitted
+
+        When RERANK_ENABLED is on, a wider candidate set from each store is
+        scored with a cross-encoder (see `_retrieve_reranked`).
+
+        Returns:
+            list: Per query, [(best_doc, score)] or [] when nothing matched
+        """
+        csv_store, pdf_store = self.stores()
+        if vectors is None:
+            vectors = self.embed_queries(queries, batch_size)
+
+        reranker = get_reranker()
+        if reranker is not None:
+            return self._retrieve_reranked(reranker, queries, vectors, top_k, threshold)
+
+        with span("csv_search"):
+            csv_hits = self.search(csv_store, vectors, top_k, queries=queries)
+
+        results = [[] for _ in queries]
+        misses = []
+        for i, csv_results in enumerate(csv_hits):
+            best = _best_csv(csv_results, threshold)
+            if best:
+                results[i] = [best]
+            else:
+                misses.append(i)
+
+        if misses:
+            with span("pdf_search"):
+                pdf_hits = self.search(pdf_store, vectors[misses], top_k, queries=[queries[i] for i in misses])
+            for i, pdf_results in zip(misses, pdf_hits):
+                best = _best_pdf(pdf_results, threshold)
+                if best:
+                    results[i] = [best]
+
+        return results
+
+    def _retrieve_reranked(self, reranker, queries, vectors, top_k, threshold):
+        """
+        Hybrid lookup with cross-encoder reranking.
+
+        A CSV candidate is accepted when the cross-encoder rates it at least
+        RERANK_CSV_MIN_SCORE, or when it is within `threshold` as before, so
+        reranking only ever adds knowledge-library matches. Rows still
+        without one take the best-rated PDF passage.
+
+        Each query gets RERANK_BUDGET_MS of cross-encoder time across both
+        stores; a query that runs out falls back to the plain FAISS rules
+        for the rest of its lookup.
+        """
+        csv_store, pdf_store = self.stores()
+        k = max(top_k, settings.RERANK_CANDIDATES)
+        budget = settings.RERANK_BUDGET_MS / 1000
+        spent = [0.0] * len(queries)
+
+        def rerank(i, hits):
+            started = time.monotonic()
+            with span("rerank"):
+                scores = reranker.score(queries[i], [doc for doc, _ in hits], deadline=started + budget - spent[i])
+            spent[i] += time.monotonic() - started
+            return scores
+
+        with span("csv_search"):
+            csv_hits = self.search(csv_store, vectors, k, queries=queries)
+
+        results = [[] for _ in queries]
+        misses = []
+        for i, csv_results in enumerate(csv_hits):
+            scores = rerank(i, csv_results)
+            if scores is None:
+                best = _best_csv(csv_results[:top_k], threshold)
+            else:
+                accepted = [
+                    (rerank_score, hit) for rerank_score, hit in zip(scores, csv_results)
+                    if rerank_score >= settings.RERANK_CSV_MIN_SCORE or hit[1] <= threshold
+                ]
+                best = max(accepted, key=lambda x: x[0])[1] if accepted else None
+            if best:
+                results[i] = [best]
+            else:
+                misses.append(i)
+
+        if misses:
+            with span("pdf_search"):
+                pdf_hits = self.search(pdf_store, vectors[misses], k, queries=[queries[i] for i in misses])
+            for i, pdf_results in zip(misses, pdf_hits):
+                scores = rerank(i, pdf_results) if pdf_results else None
+                if scores is None:
+                    best = _best_pdf(pdf_results[:top_k], threshold)
+                else:
+                    best = max(zip(scores, pdf_results), key=lambda x: x[0])[1]
+                    best[0].metadata['source'] = 'pdf'
+                if best:
+                    results[i] = [best]
+
+        return results
+
+    def _ensure_loaded(self):
+        stores = self._stores
+        if stores is not None:
+            return stores
+
+        with self._lock:
+            if self._stores is None:
+                self.reload()
+            return self._stores
+
+    def _fingerprint(self):
+        """
+        Identify the index files on disk by name, size and modification time.
+
+        Caches keyed on retrieval results compare this value to notice that
+        the indexes were rebuilt, including across server restarts.
+        """
+        digest = hashlib.sha1(embedding_signature(self.model_name).encode('utf-8'))
+        for index_path in (self.csv_index_path, self.pdf_index_path):
+            for name in sorted(os.listdir(index_path)):
+                stat = os.stat(os.path.join(index_path, name))
+                digest.update(f"{name}:{stat.st_size}:{stat.st_mtime_ns};".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _load_embedding_model(self):
+        return EmbeddingService(model_name=self.model_name)
+
+    def _load_stores(self, embedding_model):
+        csv_store = load_store(self.csv_index_path, embedding_model, index_params("csv"))
+        pdf_store = load_store(self.pdf_index_path, embedding_model, index_params("pdf"))
+        return csv_store, pdf_store
+
+
+# Hits come best first (by distance, or in fused order), so the first one
+# within the threshold is the best match
+def _best_csv(csv_results, threshold):
+    return next(((doc, score) for doc, score in csv_results if score <= threshold), None)
+
+
+def _best_pdf(pdf_results, threshold):
+    best = next(((doc, score) for doc, score in pdf_results if score > threshold), None)
+    if best:
+        best[0].metadata['source'] = 'pdf'
+    return best
+
+
+def load_store(index_path, embedding_model, params=None):
+    """
+    Load one FAISS index directory as a LangChain vector store.
+
+    Indexes written by `build_indexes` keep their documents in a
+    memory-mapped docstore.bin, and with FAISS_MMAP on their vectors are
+    mapped read-only as well, so worker processes serving the same index
+    share its pages through the OS page cache instead of each holding a
+    private copy. The store's BM25 index (bm25.bin), if the directory has
+    one, is opened alongside as `lexical_index`. A directory whose files do
+    not match its manifest (a rebuild in progress) raises ValueError, so a
+    reload keeps the indexes already loaded. Older pickled indexes (index.pkl) are only
+    read when ALLOW_PICKLE_INDEXES is on, since unpickling runs arbitrary
+    code; convert them once with `build_indexes --convert-legacy`.
+
+    Args:
+        index_path (str): Index directory
+        embedding_model: LangChain embeddings used for text queries
+        params (dict, optional): Index parameters from `index_params`;
+            their search-time values (nprobe, ef_search) are applied
+
+    Returns:
+        FAISS: The vector store
+    """
+    index_path = str(index_path)
+    docstore_path = os.path.join(index_path, DOCSTORE_NAME)
+
+    if os.path.exists(docstore_path):
+        check_index_files(index_path)
+        index = read_index(os.path.join(index_path, "index.faiss"), params)
+        docstore = MmapDocstore(docstore_path)
+        if len(docstore) != index.ntotal:
+            raise ValueError(f"{index_path}: docstore has {len(docstore)} rows but the index has {index.ntotal} vectors")
+        store = FAISS(
+            embedding_function=embedding_model,
+            index=index,
+            docstore=docstore,
+            index_to_docstore_id={i: i for i in range(index.ntotal)}
+        )
+        store.lexical_index = load_bm25(index_path)
+        if store.lexical_index is None:
+            logger.warning("%s has no BM25 index; rebuild it with `build_indexes` for lexical retrieval", index_path)
+        elif len(store.lexical_index) != index.ntotal:
+            raise ValueError(
+                f"{index_path}: BM25 index has {len(store.lexical_index)} rows but the index has {index.ntotal} vectors"
+            )
+        return store
+
+    if not settings.ALLOW_PICKLE_INDEXES:
+        raise ValueError(
+            f"{index_path} has no {DOCSTORE_NAME}; run `manage.py build_indexes --convert-legacy` "
+            "or enable ALLOW_PICKLE_INDEXES"
+        )
+    logger.warning("Loading pickled index at %s; convert it with `build_indexes --convert-legacy`", index_path)
+    return FAISS.load_local(
+        index_path,
+        embeddings=embedding_model,
+        allow_dangerous_deserialization=True
+    )
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    """
+    Get the process-wide RetrievalEngine, creating it on first call.
+
+    Returns:
+        RetrievalEngine: The shared engine
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = RetrievalEngine()
+    return _engine
+
+
+def warm_up_in_background():
+    """
+    Start loading the shared engine on a daemon thread.
+
+    Requests that arrive before loading finishes block on the engine lock
+    and then use the warmed stores, so they never trigger a second load.
+
+    Returns:
+        threading.Thread: The loader thread
+    """
+    def _warm_up():
+        try:
+            get_engine().warm_up()
+        except Exception:
+            logger.exception("Retrieval engine warm-up failed")
+
+    thread = threading.Thread(target=_warm_up, name="retrieval-warmup", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,38 @@
+import math
+
+# Llama-family tokenizers average about four characters of English per token
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text):
+    """
+    Estimate how many LLM tokens a text takes, without a tokenizer.
+
+    Args:
+        text (str): Text to measure
+
+    Returns:
+        int: Estimated token count
+    """
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def clip_tokens(text, max_tokens):
+    """
+    Cut a text to about `max_tokens`, at a word boundary.
+
+    The head is kept, so the same text is always clipped the same way.
+
+    Args:
+        text (str): Text to clip
+        max_tokens (int): Token budget
+
+    Returns:
+        str: The text, or its head followed by "..."
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    head = text[:max(0, max_tokens * CHARS_PER_TOKEN - 3)]
+    if " " in head:
+        head = head.rsplit(" ", 1)[0]
+    return head.rstrip() + "..."
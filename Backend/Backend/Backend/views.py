@@ -1,24 +1,38 @@
-from rest_framework.decorators import api_view
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
 from rest_framework.response import Response
-from time import sleep
-from langchain_community.chat_models import ChatOllama
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains import LLMChain
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
+from .utils.answer_cache import get_answer_cache
+from .utils.chat import ChatTurn, response_metadata, response_text
+from .utils.conversation import ConversationContext
+from .utils.export import EXPORT_CONTENT_TYPES
+from .utils.generation import CHAT_PROMPT, GenerationError, get_generation_client
+from .utils.generation_cache import get_generation_cache
 from .utils.history import ChatThreadManager
+from .utils.jobs import FINISHED_STATUSES, get_job_manager
+from .utils.metrics import STREAM_SECONDS, render, span
+from .utils.dedup import QuestionDeduplicator
+from .utils.pipeline import PipelineItem, get_pipeline
+from .utils.questionnaire import QuestionnaireError, iter_answers, iter_questionnaire
+from .utils.retrieval import get_engine
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.http import content_disposition_header
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+import asyncio
 import json
+import logging
+import os
 import re
+import time
+import uuid
 
-manager = ChatThreadManager()
-
-# Example user
-user_id = "user123"
+logger = logging.getLogger(__name__)
 
-from django.http import JsonResponse
-from rest_framework import status
-import pandas as pd
-import io
+manager = ChatThreadManager()
+conversations = ConversationContext(manager)
 
 @api_view(['POST'])
 def analyze_question(request):
@@ -28,145 +42,135 @@ def analyze_question(request):
         if not query:
             return Response({"error": "No message provided"}, status=400)
 
-        # Load embedding model and vector stores
-        embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        csv_store = FAISS.load_local(
-            "../faiss_csv_index",
-            embeddings=embedding_model,
-            allow_dangerous_deserialization=True
-        )
-        pdf_store = FAISS.load_local(
-            "../faiss_pdf_index",
-            embeddings=embedding_model,
-            allow_dangerous_deserialization=True
-        )
-
-        def retrieve_hybrid_results(query, top_k=5, threshold=0.2):
-            csv_results = csv_store.similarity_search_with_score(query, k=top_k)
-            filtered_csv = [(doc, score) for doc, score in csv_results if score <= threshold]
-
-            if filtered_csv:
-                best_doc, best_score = min(filtered_csv, key=lambda x: x[1])
-                print(f"Best result from CSV with score: {best_score}")
-                print("Answer:", best_doc.metadata.get('answer'))
-                print("Details:", best_doc.metadata.get('details'))
-                print("Category:", best_doc.metadata.get('category'))
-                return [(best_doc, best_score)]
-            else:
-                print("No relevant results found in CSV. Searching in PDF...")
-
-            pdf_results = pdf_store.similarity_search_with_score(query, k=top_k)
-            filtered_pdf = [(doc, score) for doc, score in pdf_results if score > threshold]
-
-            if filtered_pdf:
-                best_doc, best_score = min(filtered_pdf, key=lambda x: x[1])
-                best_doc.metadata['source'] = 'pdf'
-                return [(best_doc, best_score)]
-
-            print("No relevant results found in both CSV and PDF.")
-            return []
-
-        def calculate_confidence(score):
-            if score is None:
-                return 0.0
+        # Follow-ups are retrieved with a standalone query built from the
+        # thread's recent turns, which also go into their prompt
+        user_id = chat_user_id(request)
+        conversation = conversations.build(manager.get_active_thread(user_id), query)
 
-            # Convert FAISS distance (0–2) to confidence (0–1)
-            confidence = max(0, min(1, 1 - (score / 2)))
-            return round(confidence, 2)
-
-        def answer_query(query):
-            docs_with_scores = retrieve_hybrid_results(query, top_k=5)
-            
-            if docs_with_scores:
-                doc, score = docs_with_scores[0]
-                
-                if 'answer' in doc.metadata or 'details' in doc.metadata or 'category' in doc.metadata:
-                    answer = doc.metadata.get('answer', 'No answer available')
-                    details = doc.metadata.get('details', 'No details available')
-                    category = doc.metadata.get('category', 'No category available')
-                    
-                    answer = "No answer available" if str(answer).lower() == "nan" else answer
-                    details = "No details available" if str(details).lower() == "nan" else details
-                    category = "No category available" if str(category).lower() == "nan" else category
-                    print("csv")
-                    return {
-                        "source": "csv",
-                        "score": float(score),
-                        "answer": answer,
-                        "details": details,
-                        "category": category
-                    }
-
-                elif doc.metadata.get("source") == "pdf":
-                    pdf_context = "\n\n".join([d.page_content for d, _ in docs_with_scores])
-                    references = set()
-                    
-                    for d, _ in docs_with_scores:
-                        doc_name = d.metadata.get("document_name", "Unknown Document")
-                        page = d.metadata.get("page_number", "N/A")
-                        references.add(f"{doc_name}, Page: {page}")
-
-                    custom_prompt = """
-                    You are an InfoSec QA assistant. Answer security and compliance questions using only the provided context.
-                    For each response:
-                    - Ensure that the context is in a readable format if it is not already.
-                    - Do not change, add, or remove any words from the context. Preserve its original meaning exactly.
-                    
-                    Response style:
-                    [your refined response with context preserved]
-                    
-                    Only output the refined answer in natural language. Do not include any labels, brackets, or metadata in your response.
-                    Context:
-                    {context}
-                    Question:
-                    {query}
-                    """
-                    
-                    llm = ChatOllama(model="llama3.2:latest")
-                    prompt = ChatPromptTemplate.from_template(custom_prompt)
-                    chain = LLMChain(prompt=prompt, llm=llm)
-                    response = chain.invoke({"query": query, "context": pdf_context})
-
-                    return {
-                        "source": "pdf",
-                        "score": float(score),
-                        "answer": response['text'],
-                        "references": "; ".join(references)
-                    }
-
-            return {
-                "source": "none",
-                "score": None,
-                "answer": "No relevant information found."
-            }
-
-        # Get and return the final answer
-        result = answer_query(query)
-        print("res", result)
+        item = PipelineItem(conversation["query"], message=query, history=conversation["history"],
+                            follow_up=conversation["follow_up"], prompt="chat")
+        result = get_pipeline().answer(item, prompt="chat").result
         response_data = {
-            "type": "system",
-            "content": {"text": result.get("answer", "") + '. ' + result.get("details", '')},
-            "references": result.get("references", []) or {"KL (" + result.get("category", []) + ")"},
-            "confidence_score": calculate_confidence(result.get("score", 0.0)),
+            **response_metadata(result),
+            "content": {"text": response_text(result)},
             "all_matches": []  # add matches if needed 
         }
-        print("response_data", response_data)
 
-        if not manager.active_thread:
-            # Create a new thread if no active thread exists
-            thread_id = manager.create_thread(user_id)
-            manager.select_thread(thread_id)
-            # Treat as a message in the current thread
-        user_message = query
-        manager.add_message(user_id, manager.active_thread, "user", user_message)
-        
-        assistant_response = response_data["content"]["text"]
-        manager.add_message(user_id, manager.active_thread, "system", assistant_response)
+        record_exchange(user_id, query, response_data["content"]["text"])
         
         return Response(response_data)
 
     except Exception as e:
+        logger.exception("Error answering question")
         return Response({"error": str(e)}, status=500)
+
+
+def chat_user_id(request):
+    """
+    Identify whose chat history a request belongs to.
+
+    Logged-in users are keyed by their primary key; anonymous clients get a
+    random id kept in their session cookie.
+    """
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    client_id = request.session.get("chat_client_id")
+    if client_id is None:
+        client_id = request.session["chat_client_id"] = uuid.uuid4().hex
+    return f"session:{client_id}"
+
+
+def record_exchange(user_id, user_message, assistant_response):
+    """
+    Append a question and its answer to the user's active thread, creating one if needed.
+    """
+    with span("history_write"):
+        thread_id = manager.get_active_thread(user_id)
+        if not thread_id:
+            # Create a new thread if no active thread exists
+            thread_id = manager.create_thread(user_id)
+        # Treat as a message in the current thread
+        manager.add_message(user_id, thread_id, "user", user_message)
+        manager.add_message(user_id, thread_id, "system", assistant_response)
+
+
+def start_chat_turn(user_id, query):
+    """
+    Retrieve for a message in the context of the user's active thread.
+    """
+    return ChatTurn(query, context=conversations.build(manager.get_active_thread(user_id), query))
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@csrf_exempt
+@require_POST
+async def analyze_question_stream(request):
+    """
+    Streaming variant of analyze_question, as server-sent events.
+
+    A `metadata` event (source, references, confidence) is sent as soon as
+    retrieval is done. PDF answers then follow as `token` events while
+    Ollama generates them; CSV and cached answers arrive as one `token`.
+    A final `done` event carries the complete text, or an `error` event
+    replaces it if generation breaks off mid-answer.
+    """
+    try:
+        query = json.loads(request.body or b"{}").get('message', '')
+    except (ValueError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON body"}, status=status.HTTP_400_BAD_REQUEST)
+    if not query:
+        return JsonResponse({"error": "No message provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+    started = time.perf_counter()
+    # Resolve the user before streaming starts, so a new session cookie
+    # still makes it into the response headers
+    user_id = await sync_to_async(chat_user_id)(request)
+    try:
+        turn = await sync_to_async(start_chat_turn, thread_sensitive=False)(user_id, query)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def events():
+        yield sse_event("metadata", response_metadata(turn.result))
+        STREAM_SECONDS.observe(time.perf_counter() - started, milestone="ttfb")
+
+        if turn.needs_generation:
+            parts = []
+            try:
+                async for token in get_generation_client().astream(CHAT_PROMPT, turn.inputs, turn.chunks):
+                    if not token:
+                        continue
+                    if not parts:
+                        STREAM_SECONDS.observe(time.perf_counter() - started, milestone="first_token")
+                    parts.append(token)
+                    yield sse_event("token", {"text": token})
+            except GenerationError as e:
+                if parts:
+                    yield sse_event("error", {"error": str(e)})
+                    return
+                # Nothing was streamed yet: answer with the retrieved passage,
+                # as the questionnaire path does, but do not cache it.
+                logger.warning("Falling back to raw context for %r: %s", query, e)
+                await sync_to_async(turn.complete)(turn.inputs["context"], cache=False)
+                yield sse_event("token", {"text": turn.result["answer"]})
+            else:
+                # Formatting writes the answer cache, which blocks on its file lock
+                await sync_to_async(turn.complete)("".join(parts))
+        else:
+            yield sse_event("token", {"text": response_text(turn.result)})
+
+        text = response_text(turn.result)
+        await sync_to_async(record_exchange)(user_id, query, text)
+        yield sse_event("done", {"text": text})
+        STREAM_SECONDS.observe(time.perf_counter() - started, milestone="total")
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
     
 
 @api_view(['POST'])
@@ -182,6 +186,9 @@ def fetch_history(request):
     # user_id = "user123"
  
 
+    user_id = chat_user_id(request)
+    active_thread = manager.get_active_thread(user_id)
+
     if query == "new":
         thread_id = manager.create_thread(user_id)
         return Response(thread_id)
@@ -189,11 +196,11 @@ def fetch_history(request):
     elif query == "list":
         threads = manager.get_threads(user_id)
         if not threads:
-            return "No threads available."
+            return Response([])
         else:
             result = []
             for t in threads:
-                active = " (ACTIVE)" if t["id"] == manager.active_thread else ""
+                active = " (ACTIVE)" if t["id"] == active_thread else ""
                 thread_info = {
                     "id": t["id"],
                     "title": t["title"],
@@ -202,243 +209,309 @@ def fetch_history(request):
                     "updated_at": t["updated_at"]
                 }
                 result.append(thread_info)
-            print("Threads:", result)
             return Response(result)   
 
     elif query.startswith("select "):
         thread_id = query.split(" ", 1)[1]
-        manager.select_thread(thread_id)
-        
-        # Get thread messages
-        messages = manager.get_thread_messages(thread_id)
-        if not messages:
-            return f"Selected:{thread_id}|Messages:None"
-        else:
-            msg_data = []
-            for msg in messages:
-                msg_data.append({
-                    "type": msg["role"],
-                    "content": msg["content"]
-                })
-            return Response(msg_data)
+        if manager.get_thread(user_id, thread_id) is None:
+            return Response({"error": "Thread not found"}, status=status.HTTP_404_NOT_FOUND)
+        manager.select_thread(user_id, thread_id)
+
+        # Page through thread messages: newest page by default, older ones
+        # with `before` (a message id), newer ones with `after`
+        try:
+            before = request.data.get('before')
+            after = request.data.get('after')
+            before = int(before) if before is not None else None
+            after = int(after) if after is not None else None
+            page_size = int(request.data.get('page_size', settings.HISTORY_PAGE_SIZE))
+        except (TypeError, ValueError):
+            return Response({"error": "before, after and page_size must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+        page_size = max(1, min(page_size, settings.HISTORY_MAX_PAGE_SIZE))
+
+        page = manager.get_message_page(thread_id, before=before, after=after, page_size=page_size)
+        msg_data = []
+        for msg in page["messages"]:
+            msg_data.append({
+                "id": msg["id"],
+                "type": msg["role"],
+                "content": msg["content"]
+            })
+        return Response({
+            "messages": msg_data,
+            "has_more": page["has_more"],
+            "before": msg_data[0]["id"] if msg_data else before,
+            "after": msg_data[-1]["id"] if msg_data else after
+        })
 
     elif query.startswith("rename "):
-        if not manager.active_thread:
-            return "NoActiveThread"
+        if not active_thread:
+            return Response("NoActiveThread")
             
         new_title = query.split(" ", 1)[1]
-        manager.rename_thread(user_id, manager.active_thread, new_title)
-        return f"Renamed:{new_title}"
+        manager.rename_thread(user_id, active_thread, new_title)
+        return Response(f"Renamed:{new_title}")
 
     elif query == "delete":
-        if not manager.active_thread:
-            return "NoActiveThread"
-        thread_id = manager.active_thread
+        if not active_thread:
+            return Response("NoActiveThread")
+        thread_id = active_thread
         manager.delete_thread(user_id, thread_id)
-        return f"Deleted:{thread_id}"
+        return Response(f"Deleted:{thread_id}")
         
     # Manage for each conversation
-    elif manager.active_thread:
+    elif active_thread:
         # Treat as a message in the current thread
         user_message = query
-        manager.add_message(user_id, manager.active_thread, "user", user_message)
+        manager.add_message(user_id, active_thread, "user", user_message)
         
         # Simulate assistant response
         assistant_response = f"Echo: {user_message}"
-        manager.add_message(user_id, manager.active_thread, "system", assistant_response)
-        return {"user": user_message, "system": assistant_response}
+        manager.add_message(user_id, active_thread, "system", assistant_response)
+        return Response({"user": user_message, "system": assistant_response})
 
     else:
-        return "NoThreadSelected"
+        return Response("NoThreadSelected")
     
 @api_view(['POST'])
 def analyze_questionnaire(request):
+    """
+    Answer an uploaded questionnaire in the response.
+
+    The upload is read and answered chunk by chunk and the JSON body is
+    streamed one result row at a time, so neither the file nor the results
+    are held in memory and the first rows reach the client early. Repeated
+    questions are answered once; `deduplicated_rows` at the end of the body
+    counts the rows that reused another row's answer.
+    """
     if 'file' not in request.FILES:
         return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
     
     file = request.FILES['file']
-    file_name = file.name.lower()
     
     try:
-        # Read the questionnaire file
-        if file_name.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(file.read()))
-        elif file_name.endswith(('.xlsx', '.xls')):
-            df = pd.read_excel(io.BytesIO(file.read()))
-        else:
-            return Response({
-                "error": "Unsupported file format. Please upload CSV or Excel file."
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Check if 'Questions' column exists
-        question_col = None
-        for col in df.columns:
-            if col.lower() == 'questions' or col.lower() == 'question':
-                question_col = col
-                break
-        
-        if not question_col:
-            return Response({
-                "error": "File must contain a 'Questions' column"
-            }, status=status.HTTP_400_BAD_REQUEST)
-        
-        # Load embedding model and vector stores
-        embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        csv_store = FAISS.load_local(
-            "../faiss_csv_index",
-            embeddings=embedding_model,
-            allow_dangerous_deserialization=True
-        )
-        pdf_store = FAISS.load_local(
-            "../faiss_pdf_index",
-            embeddings=embedding_model,
-            allow_dangerous_deserialization=True
-        )
-
-        def retrieve_hybrid_results(query, top_k=5, threshold=0.2):
-            csv_results = csv_store.similarity_search_with_score(query, k=top_k)
-            filtered_csv = [(doc, score) for doc, score in csv_results if score <= threshold]
-
-            if filtered_csv:
-                best_doc, best_score = min(filtered_csv, key=lambda x: x[1])
-                print(f"Best result from CSV with score: {best_score}")
-                print("Answer:", best_doc.metadata.get('answer'))
-                print("Details:", best_doc.metadata.get('details'))
-                print("Category:", best_doc.metadata.get('category'))
-                return [(best_doc, best_score)]
-            else:
-                print("No relevant results found in CSV. Searching in PDF...")
+        rows = iter_questionnaire(file, file.name)
+    except QuestionnaireError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        import traceback
+        logger.exception("Error processing questionnaire")
+        return Response({
+            "error": f"Error processing questionnaire: {str(e)}",
+            "details": traceback.format_exc()
+        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    async def body():
+        # An async body is streamed by ASGI servers instead of buffered; the
+        # blocking reader and pipeline run in a worker thread, one row at a time
+        dedup = QuestionDeduplicator()
+        answers = iter_answers(rows, dedup=dedup)
+        next_answer = sync_to_async(next, thread_sensitive=False)
+        yield '{"message": "Questionnaire analyzed successfully", "results": ['
+        try:
+            first = True
+            while (result := await next_answer(answers, None)) is not None:
+                yield ("" if first else ", ") + json.dumps(result, default=str)
+                first = False
+        except Exception:
+            # The 200 status has already been sent, so all that is left is
+            # to log the error and cut the body short
+            logger.exception("Error processing questionnaire")
+            raise
+        yield '], "deduplicated_rows": ' + json.dumps(dedup.deduplicated) + '}'
+
+    return StreamingHttpResponse(body(), content_type="application/json")
 
-            pdf_results = pdf_store.similarity_search_with_score(query, k=top_k)
-            filtered_pdf = [(doc, score) for doc, score in pdf_results if score > threshold]
 
-            if filtered_pdf:
-                best_doc, best_score = min(filtered_pdf, key=lambda x: x[1])
-                best_doc.metadata['source'] = 'pdf'
-                return [(best_doc, best_score)]
+@api_view(['POST'])
+def submit_questionnaire_job(request):
+    """
+    Queue a questionnaire for background processing and return its job id.
+    """
+    if 'file' not in request.FILES:
+        return Response({"error": "No file uploaded"}, status=status.HTTP_400_BAD_REQUEST)
 
-            print("No relevant results found in both CSV and PDF.")
-            return []
+    file = request.FILES['file']
 
-        def calculate_confidence(score):
-            if score is None:
-                return 0.0
+    try:
+        job = get_job_manager().submit(file, file.name)
+    except QuestionnaireError as e:
+        return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    except Exception as e:
+        return Response({"error": f"Error queuing questionnaire: {str(e)}"}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-            # Convert FAISS distance (0–2) to confidence (0–1)
-            confidence = max(0, min(1, 1 - (score / 2)))
-            return round(confidence, 2)
+    return Response({"job_id": job["id"], "job": job}, status=status.HTTP_202_ACCEPTED)
 
-        def answer_query(query):
-            docs_with_scores = retrieve_hybrid_results(query, top_k=5)
-            
-            if docs_with_scores:
-                doc, score = docs_with_scores[0]
-                
-                if 'answer' in doc.metadata or 'details' in doc.metadata or 'category' in doc.metadata:
-                    answer = doc.metadata.get('answer', 'No answer available')
-                    details = doc.metadata.get('details', 'No details available')
-                    category = doc.metadata.get('category', 'No category available')
-                    
-                    answer = "No answer available" if str(answer).lower() == "nan" else answer
-                    details = "No details available" if str(details).lower() == "nan" else details
-                    category = "No category available" if str(category).lower() == "nan" else category
-                    print("csv")
-                    return {
-                        "source": "csv",
-                        "score": float(score),
-                        "answer": answer,
-                        "details": details,
-                        "category": category
-                    }
-
-                elif doc.metadata.get("source") == "pdf":
-                    pdf_context = "\n\n".join([d.page_content for d, _ in docs_with_scores])
-                    references = set()
-                    
-                    for d, _ in docs_with_scores:
-                        doc_name = d.metadata.get("document_name", "Unknown Document")
-                        page = d.metadata.get("page_number", "N/A")
-                        references.add(f"{doc_name}, Page: {page}")
-
-                    custom_prompt = """
-                    You are an InfoSec QA assistant. Answer security and compliance questions using only the provided context.
-                    For each response:
-                    - Ensure that the context is in a readable format if it is not already.
-                    - Do not change, add, or remove any words from the context. Preserve its original meaning exactly.
-                    
-                    Only output the refined answer in natural language. Do not include any labels, brackets, or metadata in your response.
-                    
-                    Response style:
-                    [your refined response with context preserved]
-                    
-                    Context:
-                    {context}
-                    Question:
-                    {query}
-                    """
-                    
-                    llm = ChatOllama(model="llama3.2:latest")
-                    prompt = ChatPromptTemplate.from_template(custom_prompt)
-                    chain = LLMChain(prompt=prompt, llm=llm)
-                    response = chain.invoke({"query": query, "context": pdf_context})
-
-                    return {
-                        "source": "pdf",
-                        "score": float(score),
-                        "answer": response['text'],
-                        "references": list(references)
-                    }
-
-            return {
-                "source": "none",
-                "score": None,
-                "answer": "No relevant information found."
-            }
-        
-        # Process each question in the file
-        results = []
-        
-        for index, row in df.iterrows():
-            question = row[question_col]
-            
-            # Skip empty questions
-            if pd.isna(question) or not question.strip():
-                continue
-                
-            # Generate a unique question ID (or extract from file if available)
-            question_id = f"Q{index+1}" if "id" not in row else row["id"]
-            
-            # Get answer for this question using the same process as analyze_question
-            result = answer_query(question)
-            
-            # Format the result similar to analyze_question
-            confidence_score = calculate_confidence(result.get("score", 0.0))
-            
-            result_entry = {
-                "id": question_id,
-                "question": question,
-                "suggestedAnswer": result.get("answer", "") + '. ' + result.get("details", ""),
-                "confidence_score": confidence_score * 100,  # Convert to percentage
-                "references": result.get("references", []) or {"KL (" + result.get("category", []) + ")"},
-            }
-            print("ref", result_entry)
-            
-            results.append(result_entry)
-            
-            # Add a small delay to prevent overwhelming the system
-            sleep(0.1)
-        
-        # Return results
-        return Response({
-            "message": "Questionnaire analyzed successfully",
-            "results": results
-        }, status=status.HTTP_200_OK)
-        
+
+@api_view(['GET'])
+def questionnaire_job(request, job_id):
+    """
+    Get a job's progress and the rows answered so far.
+
+    Query params `offset` and `limit` page through the results, so a client
+    polling a long job only fetches the rows it has not seen yet.
+    """
+    jobs = get_job_manager()
+    job = jobs.get_job(job_id)
+    if job is None:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        offset = int(request.query_params.get('offset', 0))
+        limit = request.query_params.get('limit')
+        limit = int(limit) if limit is not None else None
+    except ValueError:
+        return Response({"error": "offset and limit must be integers"}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response({
+        "job": job,
+        "offset": offset,
+        "results": jobs.get_results(job_id, offset=offset, limit=limit)
+    })
+
+
+@api_view(['GET'])
+def download_questionnaire_job(request, job_id):
+    """
+    Download a completed job's questionnaire with the answers filled in.
+
+    The file comes back in the uploaded format, and a `Range` header is
+    honoured so an interrupted download of a large file can be resumed.
+    """
+    jobs = get_job_manager()
+    job = jobs.get_job(job_id)
+    if job is None:
+        return Response({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+    if job["status"] != "completed":
+        return Response({"error": "Job has not completed"}, status=status.HTTP_409_CONFLICT)
+
+    export = jobs.get_export(job_id)
+    if export is None:
+        return Response({"error": "No answered file is available for this job"}, status=status.HTTP_404_NOT_FOUND)
+
+    path, download_name = export
+    return ranged_file_response(request, path, EXPORT_CONTENT_TYPES[os.path.splitext(path)[1]], download_name)
+
+
+RANGE_PATTERN = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def ranged_file_response(request, path, content_type, download_name):
+    """
+    Serve a file as an attachment, or the single byte range a client asks for.
+
+    Multi-range requests and ranges whose `If-Range` validator no longer
+    matches get the whole file, as RFC 9110 allows.
+    """
+    stat = os.stat(path)
+    size = stat.st_size
+    etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+
+    match = RANGE_PATTERN.match(request.headers.get('Range', '').strip())
+    if_range = request.headers.get('If-Range')
+    if not match or not any(match.groups()) or (if_range and if_range != etag):
+        response = FileResponse(open(path, 'rb'), as_attachment=True, filename=download_name, content_type=content_type)
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        return response
+
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    else:
+        # "bytes=-N" asks for the last N bytes
+        start = max(0, size - int(last))
+        end = size - 1
+    if start > end:
+        response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+
+    def read_range():
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(remaining, FileResponse.block_size))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+    response = StreamingHttpResponse(read_range(), status=status.HTTP_206_PARTIAL_CONTENT, content_type=content_type)
+    response['Content-Length'] = str(end - start + 1)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    # Escaped the same way FileResponse does for the full-file branch
+    response['Content-Disposition'] = content_disposition_header(True, download_name)
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
+
+
+async def questionnaire_job_events(request, job_id):
+    """
+    Stream a job's progress as server-sent events until it finishes.
+    """
+    jobs = get_job_manager()
+    if jobs.get_job(job_id) is None:
+        return JsonResponse({"error": "Job not found"}, status=status.HTTP_404_NOT_FOUND)
+
+    async def events():
+        last_update = None
+        while True:
+            job = await sync_to_async(jobs.get_job)(job_id)
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield sse_event("progress", job)
+            if job["status"] in FINISHED_STATUSES:
+                return
+            await asyncio.sleep(settings.BATCH_JOB_EVENT_INTERVAL)
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def reload_indexes(request):
+    """
+    Re-read both FAISS indexes from disk without restarting the server.
+    """
+    try:
+        # Form and query-style bodies send "false" as a string
+        reload_model = str(request.data.get('reload_model', False)).strip().lower() in ("1", "true", "yes")
+        version = get_engine().reload(reload_model=reload_model)
+        return Response({"message": "Indexes reloaded", "version": version})
     except Exception as e:
-        import traceback
-        print(f"Error processing questionnaire: {str(e)}")
-        print(traceback.format_exc())
-        return Response({
-            "error": f"Error processing questionnaire: {str(e)}",
-            "details": traceback.format_exc()
-        }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+        return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+@api_view(['GET'])
+def retrieval_status(request):
+    """
+    Report the loaded index version and this worker's resident vs shared memory.
+    """
+    return Response(get_engine().status())
+
+
+@api_view(['GET'])
+def answer_cache_stats(request):
+    """
+    Report answer and generation cache size and hit/miss counters.
+    """
+    stats = get_answer_cache().stats()
+    if settings.GENERATION_CACHE_ENABLED:
+        stats["generation"] = get_generation_cache().stats()
+    return Response(stats)
+
+
+@require_GET
+def metrics(request):
+    """
+    Stage latencies, answer sources and request timings in the Prometheus
+    text format, for scraping.
+    """
+    return HttpResponse(render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -175,6 +175,7 @@ export default function UnifiedQnAAssistant() {
     // Send request to backend API
     fetch("http://localhost:8080/analyze/", {
       method: "POST",
+      credentials: "include",
       headers: {
         "Content-Type": "application/json",
       },
@@ -44,6 +44,8 @@ export default function ChatHistory({ darkMode }) {
   const [isPulsing, setIsPulsing] = useState(true);
 
   const [activeTopic, setActiveTopic] = useState(null);
+  // Id of the oldest loaded message while older ones remain on the server
+  const [olderCursor, setOlderCursor] = useState(null);
 
   // Document mappings for references
   const documentMappings = {
@@ -176,22 +178,28 @@ export default function ChatHistory({ darkMode }) {
     return () => clearTimeout(pulseTimer);
   }, []);
 
-  const processHistory = (historyCase) => {
+  const processHistory = (historyCase, page = {}) => {
     console.log("Processing history case:", historyCase);
     fetch("http://localhost:8080/history/", {
       method: "POST",
+      credentials: "include",
       headers: {
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ history: historyCase }),
+      body: JSON.stringify({ history: historyCase, ...page }),
     })
       .then((res) => res.json())
       .then((data) => {
         console.log("Response from server:", data);
         if (historyCase === "list") {
           setTopics(data);
-        } else if (historyCase.startsWith("select ")) {
-          setChatMessages(data);
+        } else if (historyCase.startsWith("select ") && data.messages) {
+          if (page.before) {
+            setChatMessages((prev) => [...data.messages, ...prev]);
+          } else {
+            setChatMessages(data.messages);
+          }
+          setOlderCursor(data.has_more ? data.before : null);
         } else if (historyCase === "new") {
           setActiveTopic(data);
           setChatMessages([
@@ -290,6 +298,7 @@ export default function ChatHistory({ darkMode }) {
     // Send request to backend API
     fetch("http://localhost:8080/analyze/", {
       method: "POST",
+      credentials: "include",
       headers: {
         "Content-Type": "application/json",
       },
@@ -605,6 +614,22 @@ export default function ChatHistory({ darkMode }) {
         {/* Chat Messages */}
         <div className="flex-grow p-6 overflow-y-auto">
           <div className="space-y-4">
+            {olderCursor !== null && (
+              <div className="flex justify-center">
+                <button
+                  onClick={() =>
+                    processHistory("select " + activeTopic, {
+                      before: olderCursor,
+                    })
+                  }
+                  className={`text-xs hover:underline ${
+                    darkMode ? "text-gray-400" : "text-gray-500"
+                  }`}
+                >
+                  Load earlier messages
+                </button>
+              </div>
+            )}
             {chatMessages.map((msg, idx) => (
               <div
                 key={idx}